@@ -0,0 +1,83 @@
+"""Encode/decode cost and size of protocol frames, JSON against bin1.
+
+    python -m benchmarks.codec [--rounds 20000]
+"""
+import argparse
+import time
+import uuid
+
+from src.common.codec import JSON, BINARY, decode
+
+FRAMES = {
+    "chat": {
+        "type": "message",
+        "msg_id": uuid.uuid4().hex,
+        "sender_id": 17,
+        "receiver_id": 4,
+        "content": "are we still on for the review at 10?",
+        "timestamp": "2025-03-01T09:41:27.512093",
+        "has_media": False
+    },
+    "presence": {
+        "type": "status_change",
+        "user_id": 17,
+        "status": "online",
+        "timestamp": "2025-03-01T09:41:27.512093"
+    },
+    "ack": {"type": "ack", "msg_id": uuid.uuid4().hex},
+    "channel push": {
+        "type": "new_message",
+        "channel_id": 12,
+        "message": {
+            "id": 604211,
+            "seq": 977,
+            "content": "pushed a fix for the flaky upload test",
+            "sender_id": 9,
+            "created_at": "2025-03-01T09:41:27.512093",
+            "has_media": False,
+            "media_type": None,
+            "media_path": None,
+            "media_name": None
+        }
+    },
+    "request": {"action": "get_channel_messages", "channel_id": 12, "limit": 50,
+                "before_id": None, "tag": 311},
+}
+
+
+def timed(function, argument, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        function(argument)
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'frame':<14}{'codec':<6}{'bytes':>7}{'encode us':>11}{'decode us':>11}")
+    totals = {}
+    for name, frame in FRAMES.items():
+        for codec in (JSON, BINARY):
+            encoded = codec.encode(frame)
+            if name == "channel push":
+                # Encoded once per channel, then numbered per session
+                encoded = codec.add_field(encoded, "seq", 1841)
+                assert decode(encoded) == {"seq": 1841, **frame}
+            else:
+                assert decode(encoded) == frame, f"{codec.name} does not round-trip {name}"
+            encode_us = timed(codec.encode, frame, args.rounds)
+            decode_us = timed(codec.decode, encoded, args.rounds)
+            total = totals.setdefault(codec.name, [0, 0.0, 0.0])
+            total[0] += len(encoded)
+            total[1] += encode_us
+            total[2] += decode_us
+            print(f"{name:<14}{codec.name:<6}{len(encoded):>7}{encode_us:>11.2f}{decode_us:>11.2f}")
+    for name, (size, encode_us, decode_us) in totals.items():
+        print(f"{'all':<14}{name:<6}{size:>7}{encode_us:>11.2f}{decode_us:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""Synthetic chat database for query benchmarks.
+
+    python -m benchmarks.dataset OUTPUT.db [--scale small|medium|full] [--seed 1]
+
+Writes a scratch SQLite database with the application's schema: users,
+channels, memberships, friendships and channel and direct messages. Channel
+popularity and user activity follow power laws (a few channels and users
+account for most traffic), messages arrive in time order over DAYS days.
+"full" is 100k users, 10k channels and 50M messages: about 7 GB and half an
+hour to generate.
+"""
+import argparse
+import bisect
+import itertools
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+SCALES = {
+    "small": {"users": 1000, "channels": 100, "messages": 100_000},
+    "medium": {"users": 10_000, "channels": 1000, "messages": 5_000_000},
+    "full": {"users": 100_000, "channels": 10_000, "messages": 50_000_000},
+}
+
+ACTIVITY_EXPONENT = 1.1  # weight of the n-th most active user or channel is 1 / n ** this
+MEMBERSHIP_ALPHA = 1.3  # Pareto shape of channels joined per user
+MEMBERSHIP_SCALE = 3
+FRIENDS_ALPHA = 1.5  # Pareto shape of friends per user
+FRIENDS_SCALE = 4
+DIRECT_FRACTION = 0.1  # share of messages sent directly to a friend
+MEDIA_FRACTION = 0.03
+ONLINE_FRACTION = 0.1
+DAYS = 365
+END = datetime(2025, 3, 1)
+BATCH = 50_000
+
+# The vocabulary is Zipf-distributed too; benchmarks search for SEARCH_TERMS,
+# a frequent, a medium and a rare word
+VOCABULARY = (
+    "the", "ok", "yes", "is", "to", "and", "a", "i", "you", "it", "for", "on", "we", "that", "in",
+    "lol", "thanks", "what", "now", "can", "just", "see", "meeting", "today", "tomorrow", "build",
+    "fix", "review", "lunch", "later", "deploy", "release", "test", "broken", "green", "merge",
+    "branch", "ticket", "server", "client", "channel", "message", "video", "image", "upload",
+    "latency", "database", "index", "query", "cache", "benchmark", "profile", "memory", "thread",
+) + tuple(f"w{n:04d}" for n in range(2000))
+SEARCH_TERMS = ("build", "benchmark", "w1500")
+
+
+def stamp(moment):
+    """DateTime in the text form SQLAlchemy stores and compares in SQLite"""
+    return moment.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def power_law_weights(count, rng):
+    """Cumulative weights for ids 1..count, ranks shuffled so heavy ids are spread out"""
+    ranks = list(range(1, count + 1))
+    rng.shuffle(ranks)
+    return list(itertools.accumulate(1.0 / rank ** ACTIVITY_EXPONENT for rank in ranks))
+
+
+def pick(cumulative, rng):
+    """An id (1-based) drawn with the given cumulative weights"""
+    return bisect.bisect_left(cumulative, rng.random() * cumulative[-1]) + 1
+
+
+def create_schema(path):
+    """Tables from the application's models; indexes come after loading"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.schema import CreateTable
+    from src.database.config import Base
+    import src.database.models  # noqa: F401 (registers the tables)
+
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            connection.execute(CreateTable(table))
+    return engine, Base.metadata
+
+
+def create_indexes(engine, metadata):
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine)
+
+
+class Generator:
+    def __init__(self, connection, users, channels, messages, seed):
+        self.db = connection
+        self.users = users
+        self.channels = channels
+        self.messages = messages
+        self.rng = random.Random(seed)
+        self.user_weights = power_law_weights(users, self.rng)
+        self.channel_weights = power_law_weights(channels, self.rng)
+        self.word_weights = list(itertools.accumulate(
+            1.0 / rank ** ACTIVITY_EXPONENT for rank in range(1, len(VOCABULARY) + 1)))
+        self.members = {}  # channel_id -> [user_id]
+        self.friends = {}  # user_id -> [user_id]
+        self.start = END - timedelta(days=DAYS)
+
+    def insert(self, table, columns, rows):
+        placeholders = ", ".join("?" for _ in columns)
+        self.db.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+
+    def generate_users(self):
+        rng = self.rng
+        self.insert("users", ("id", "username", "password", "status", "role", "created_at"), (
+            (user_id, f"user{user_id:06d}", "x", "online" if rng.random() < ONLINE_FRACTION else "offline",
+             "user", stamp(self.start))
+            for user_id in range(1, self.users + 1)
+        ))
+
+    def generate_channels(self):
+        rng = self.rng
+        rows = []
+        for channel_id in range(1, self.channels + 1):
+            owner_id = pick(self.user_weights, rng)
+            self.members[channel_id] = {owner_id: "owner"}
+            rows.append((channel_id, f"channel-{channel_id:05d}", owner_id, rng.random() < 0.2,
+                         True, True, stamp(self.start)))
+        self.insert("channels", ("id", "name", "owner_id", "is_private", "allow_visitors",
+                                 "allow_visitor_messages", "created_at"), rows)
+
+    def generate_memberships(self):
+        rng = self.rng
+        for user_id in range(1, self.users + 1):
+            wanted = min(int(rng.paretovariate(MEMBERSHIP_ALPHA) * MEMBERSHIP_SCALE), self.channels)
+            for _ in range(wanted):
+                self.members[pick(self.channel_weights, rng)].setdefault(user_id, "member")
+        rows = ((user_id, channel_id, role, stamp(self.start))
+                for channel_id, members in self.members.items() for user_id, role in members.items())
+        self.insert("channel_memberships", ("user_id", "channel_id", "role", "joined_at"), rows)
+        self.members = {channel_id: list(members) for channel_id, members in self.members.items()}
+
+    def generate_friendships(self):
+        rng = self.rng
+        pairs = set()
+        for user_id in range(1, self.users + 1):
+            wanted = min(int(rng.paretovariate(FRIENDS_ALPHA) * FRIENDS_SCALE) - FRIENDS_SCALE, self.users - 1)
+            for _ in range(max(wanted, 0)):
+                friend_id = pick(self.user_weights, rng)
+                if friend_id != user_id:
+                    pairs.add((min(user_id, friend_id), max(user_id, friend_id)))
+        for user_id, friend_id in pairs:
+            self.friends.setdefault(user_id, []).append(friend_id)
+            self.friends.setdefault(friend_id, []).append(user_id)
+        # One row per friendship, either direction, as the app stores them
+        self.insert("friendships", ("user_id", "friend_id", "created_at"), (
+            (user_id, friend_id, stamp(self.start)) if self.rng.random() < 0.5
+            else (friend_id, user_id, stamp(self.start))
+            for user_id, friend_id in sorted(pairs)
+        ))
+        return len(pairs)
+
+    def content(self):
+        words = self.rng.choices(VOCABULARY, cum_weights=self.word_weights, k=self.rng.randint(2, 20))
+        return " ".join(words)
+
+    def message_rows(self, first, count, seqs):
+        rng = self.rng
+        span = (END - self.start).total_seconds()
+        for message_id in range(first, first + count):
+            created = self.start + timedelta(seconds=span * message_id / self.messages)
+            content = self.content()
+            media = rng.random() < MEDIA_FRACTION
+            media_type = ("image" if rng.random() < 0.8 else "video") if media else None
+            media_path = f"media/{media_type}s/{message_id}.{'png' if media_type == 'image' else 'mp4'}" if media else None
+            media_name = os.path.basename(media_path) if media else None
+            sender_id = pick(self.user_weights, rng)
+            friends = self.friends.get(sender_id)
+            if friends and rng.random() < DIRECT_FRACTION:
+                receiver_id = friends[rng.randrange(len(friends))]
+                # Older direct messages have been read
+                is_read = message_id < self.messages * 0.98
+                yield (message_id, content, sender_id, None, receiver_id, True, is_read, stamp(created),
+                       None, media, media_type, media_path, media_name)
+                continue
+            channel_id = pick(self.channel_weights, rng)
+            members = self.members[channel_id]
+            sender_id = members[rng.randrange(len(members))]
+            seqs[channel_id] = seqs.get(channel_id, 0) + 1
+            yield (message_id, content, sender_id, channel_id, None, False, False, stamp(created),
+                   seqs[channel_id], media, media_type, media_path, media_name)
+
+    def generate_messages(self, progress=True):
+        columns = ("id", "content", "sender_id", "channel_id", "receiver_id", "is_direct", "is_read",
+                   "created_at", "seq", "has_media", "media_type", "media_path", "media_name")
+        seqs = {}
+        started = time.monotonic()
+        for first in range(1, self.messages + 1, BATCH):
+            count = min(BATCH, self.messages + 1 - first)
+            self.insert("messages", columns, self.message_rows(first, count, seqs))
+            self.db.commit()
+            done = first + count - 1
+            if progress and (done % (BATCH * 20) == 0 or done == self.messages):
+                rate = done / max(time.monotonic() - started, 1e-9)
+                print(f"  {done:,} / {self.messages:,} messages ({rate:,.0f}/s)", flush=True)
+
+
+def generate(path, users, channels, messages, seed=1, progress=True):
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} exists, remove it or choose another output")
+    started = time.monotonic()
+    engine, metadata = create_schema(path)
+    connection = sqlite3.connect(path)
+    # A scratch database: nothing to protect from crashes while loading
+    connection.execute("PRAGMA journal_mode = OFF")
+    connection.execute("PRAGMA synchronous = OFF")
+    connection.execute("PRAGMA cache_size = -262144")
+    generator = Generator(connection, users, channels, messages, seed)
+    try:
+        generator.generate_users()
+        generator.generate_channels()
+        generator.generate_memberships()
+        friendships = generator.generate_friendships()
+        connection.commit()
+        memberships = sum(len(members) for members in generator.members.values())
+        if progress:
+            print(f"{users:,} users, {channels:,} channels, {memberships:,} memberships, "
+                  f"{friendships:,} friendships", flush=True)
+        generator.generate_messages(progress)
+    finally:
+        connection.close()
+    if progress:
+        print("Creating indexes", flush=True)
+    create_indexes(engine, metadata)
+    engine.dispose()
+    if progress:
+        print(f"Done in {time.monotonic() - started:.0f}s, {os.path.getsize(path) / 1048576:,.0f} MiB", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output", help="database file to create")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--channels", type=int)
+    parser.add_argument("--messages", type=int)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    sizes = dict(SCALES[args.scale])
+    for field in ("users", "channels", "messages"):
+        if getattr(args, field) is not None:
+            sizes[field] = getattr(args, field)
+    generate(args.output, seed=args.seed, **sizes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Wire size and encode/decode cost of channel history responses.
+
+Compares plain JSON with the codecs ChannelHost negotiates at handshake
+(zlib above CHANNEL_COMPRESS_THRESHOLD, columnar message batches).
+
+    python -m benchmarks.history_codec [--messages 100] [--rounds 200]
+"""
+import argparse
+import json
+import random
+import time
+import zlib
+from datetime import datetime, timedelta
+
+from src.client.config import CHANNEL_COMPRESS_THRESHOLD
+from src.common.columnar import pack_response, unpack_response
+from src.common.framing import encode_frame, FrameReader
+
+WORDS = ("hey", "ok", "meeting", "tomorrow", "the", "build", "is", "green", "lunch?",
+         "sounds", "good", "pushed", "a", "fix", "for", "that", "see", "you", "at", "10")
+
+
+def sample_messages(count, seed=1):
+    rng = random.Random(seed)
+    created = datetime(2025, 3, 1, 9, 0, 0)
+    messages = []
+    for index in range(count):
+        created += timedelta(seconds=rng.randint(1, 600), microseconds=rng.randint(0, 999999))
+        has_media = rng.random() < 0.05
+        messages.append({
+            "id": 48000 + index * rng.randint(1, 40),
+            "seq": 900 + index,
+            "content": " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 18))),
+            "sender_id": rng.choice((3, 4, 9, 10, 17)),
+            "created_at": created.isoformat(),
+            "has_media": has_media,
+            "media_type": "image" if has_media else None,
+            "media_path": f"media/{rng.getrandbits(64):016x}.png" if has_media else None,
+            "media_name": "screenshot.png" if has_media else None
+        })
+    return messages
+
+
+def measure(name, response, columnar, compress_threshold, rounds):
+    encoded = b""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        payload = pack_response(response) if columnar else response
+        encoded = encode_frame(json.dumps(payload).encode('utf-8'), compress_threshold)
+    encode_us = (time.perf_counter() - start) / rounds * 1e6
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        decoded = json.loads(FrameReader().feed(encoded)[0].decode('utf-8'))
+        if columnar:
+            unpack_response(decoded)
+    decode_us = (time.perf_counter() - start) / rounds * 1e6
+
+    assert decoded == response, f"{name} does not round-trip"
+    return len(encoded), encode_us, decode_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    response = {"status": "success", "messages": sample_messages(args.messages), "tag": 7}
+    variants = (
+        ("json", False, None),
+        ("json+zlib", False, CHANNEL_COMPRESS_THRESHOLD),
+        ("columnar", True, None),
+        ("columnar+zlib", True, CHANNEL_COMPRESS_THRESHOLD),
+    )
+
+    baseline = None
+    print(f"{args.messages} messages, {args.rounds} rounds")
+    print(f"{'codec':<15}{'bytes':>9}{'ratio':>8}{'encode us':>12}{'decode us':>12}")
+    for name, columnar, threshold in variants:
+        size, encode_us, decode_us = measure(name, response, columnar, threshold, args.rounds)
+        baseline = baseline or size
+        print(f"{name:<15}{size:>9}{baseline / size:>7.1f}x{encode_us:>12.0f}{decode_us:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,641 @@
+"""Load generator: thousands of simulated chat clients on loopback.
+
+    python -m benchmarks.loadgen [--scenario chat] [--clients 2000] [--duration 60]
+                                 [--send-rate 0.5] [--json results.json]
+
+Starts the target (a ChannelHost with a media node, or the ChatServer) in a
+child process on a scratch database, drives it with asyncio clients that join
+channels, send messages at a given rate, fetch history, send media or look up
+routes, and reports throughput, latency percentiles and errors per operation
+together with the target's CPU and memory use. --scenario also takes a JSON
+file of scenario fields; --json writes the results for comparing runs.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+from src.common.codec import JSON, decode, get_codec
+from src.common.framing import HEADER, COMPRESSED_FLAG, decompress_payload, encode_frame
+from src.common.metrics import Histogram
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Rates are per client and second, sizes in bytes. Operations are scheduled
+# open-loop (Poisson arrivals), so a slow target shows up as latency instead
+# of silently lowering the offered load.
+DEFAULTS = {
+    "target": "host",  # "host" (ChannelHost + media node) or "server" (ChatServer)
+    "clients": 200,
+    "channels": 20,
+    "channels_per_client": 2,
+    "duration": 30.0,
+    "ramp": 5.0,  # seconds over which clients connect
+    "send_rate": 0.0,
+    "message_bytes": 80,
+    "history_rate": 0.0,
+    "history_limit": 50,
+    "media_rate": 0.0,
+    "media_bytes": 64 * 1024,
+    "lookup_rate": 0.0,
+    "formats": ["json"],  # ["bin1", "json"] to measure the binary format
+    "timeout": 10.0,
+}
+
+SCENARIOS = {
+    # Members chatting: every send fans out to the channel's subscribers
+    "chat": {"clients": 1000, "channels": 50, "channels_per_client": 3, "send_rate": 0.2,
+             "history_rate": 0.02},
+    # Mostly scrolling back through history
+    "readers": {"clients": 1000, "channels": 50, "send_rate": 0.02, "history_rate": 0.5,
+                "history_limit": 100},
+    # Image uploads through the media node, announced in the channel
+    "media": {"clients": 100, "channels": 10, "send_rate": 0.05, "media_rate": 0.05,
+              "media_bytes": 256 * 1024},
+    # Route lookups against the ChatServer's directory
+    "directory": {"target": "server", "clients": 1000, "channels": 200, "channels_per_client": 5,
+                  "lookup_rate": 1.0},
+}
+
+MEDIA_HEADER = struct.Struct('!Q')
+OWNER_ID = 1  # provisioned owner of every channel; clients are users 2..clients+1
+DATABASE_FILE = "loadgen.db"
+# *_request_seconds summaries in the target's /metrics exposition
+SERIES = re.compile(r'^\w+_request_seconds(?P<suffix>_count)?\{(?P<labels>[^}]*)\} (?P<value>\S+)$', re.M)
+LABEL = re.compile(r'(\w+)="([^"]*)"')
+
+
+def load_scenario(name):
+    scenario = dict(DEFAULTS)
+    if name in SCENARIOS:
+        scenario.update(SCENARIOS[name])
+    else:
+        with open(name, 'r', encoding='utf-8') as f:
+            scenario.update(json.load(f))
+    unknown = set(scenario) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown scenario fields: {', '.join(sorted(unknown))}")
+    return scenario
+
+
+def client_channels(index, scenario):
+    """Channel ids client index joins, spread evenly over all channels"""
+    count = min(scenario["channels_per_client"], scenario["channels"])
+    return [(index * count + k) % scenario["channels"] + 1 for k in range(count)]
+
+
+def provision(workdir, scenario):
+    """Create the scratch database: an owner, the channels and one user per client"""
+    path = os.path.join(workdir, DATABASE_FILE)
+    if os.path.exists(path):
+        os.remove(path)
+    # Read by src.database.config at import, so set before importing it
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    from src.database.config import Base, engine
+    from src.database.models import User, Channel, ChannelMembership
+    from src.database.migrations import upgrade_schema
+
+    Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
+    clients = scenario["clients"]
+    with engine.begin() as connection:
+        connection.execute(User.__table__.insert(), [
+            {"id": user_id, "username": f"loadgen_{user_id}", "password": "loadgen"}
+            for user_id in range(OWNER_ID, clients + 2)
+        ])
+        connection.execute(Channel.__table__.insert(), [
+            {"id": channel_id, "name": f"loadgen-{channel_id}", "owner_id": OWNER_ID}
+            for channel_id in range(1, scenario["channels"] + 1)
+        ])
+        memberships = [{"user_id": OWNER_ID, "channel_id": channel_id}
+                       for channel_id in range(1, scenario["channels"] + 1)]
+        for index in range(clients):
+            memberships.extend({"user_id": index + 2, "channel_id": channel_id}
+                               for channel_id in client_channels(index, scenario))
+        connection.execute(ChannelMembership.__table__.insert(), memberships)
+    engine.dispose()
+    return path
+
+
+def serve_host():
+    """Child process: a ChannelHost and media node for OWNER_ID until stdin closes"""
+    from src.client.channel_host import ChannelHost
+    from src.client.media_transfer import MediaTransferNode
+
+    host = ChannelHost(OWNER_ID, metrics_port=0)
+    if not host.start_hosting():
+        sys.exit(1)
+    host.wait_ready(300)
+    node = MediaTransferNode(OWNER_ID, "loadgen")
+    node.start()
+    metrics_port = host.metrics_server.port if host.metrics_server else 0
+    print(f"READY {host.host_port} {node.media_port} {metrics_port}", flush=True)
+    sys.stdin.read()
+    node.stop()
+    host.stop_hosting()
+
+
+class Target:
+    """The process under load, started in workdir on the scratch database"""
+
+    def __init__(self, scenario, workdir, database_path):
+        self.scenario = scenario
+        self.workdir = workdir
+        self.env = dict(os.environ, DATABASE_URL=f"sqlite:///{database_path}",
+                        PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+        self.process = None
+        self.port = None
+        self.media_port = None
+        self.metrics_url = None
+
+    def start(self):
+        output = open(os.path.join(self.workdir, "target.log"), 'wb')
+        if self.scenario["target"] == "host":
+            self.process = subprocess.Popen(
+                [sys.executable, "-m", "benchmarks.loadgen", "--serve-host"],
+                cwd=self.workdir, env=self.env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=output
+            )
+            for line in self.process.stdout:
+                if line.startswith(b"READY"):
+                    self.port, self.media_port, metrics_port = (int(value) for value in line.split()[1:])
+                    if metrics_port:
+                        self.metrics_url = f"http://127.0.0.1:{metrics_port}/metrics"
+                    # Keep draining stdout so a chatty target never blocks on the pipe
+                    threading.Thread(target=shutil.copyfileobj, args=(self.process.stdout, output),
+                                     daemon=True).start()
+                    return
+            raise RuntimeError(f"Target exited before it was ready, see {output.name}")
+
+        from src.server.config import SERVER_PORT, METRICS_HOST, METRICS_PORT
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "run_server.py")],
+            cwd=self.workdir, env=self.env, stdin=subprocess.DEVNULL, stdout=output, stderr=output
+        )
+        self.port = SERVER_PORT
+        if METRICS_PORT is not None:
+            self.metrics_url = f"http://{METRICS_HOST}:{METRICS_PORT}/metrics"
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline and self.process.poll() is None:
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError(f"Server did not come up on port {self.port}, see {output.name}")
+
+    def stop(self):
+        if self.process is None or self.process.poll() is not None:
+            return
+        if self.process.stdin:
+            self.process.stdin.close()  # serve_host stops cleanly
+        else:
+            self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def scrape(self):
+        """Request counts and percentiles the target measured itself"""
+        if not self.metrics_url:
+            return {}
+        try:
+            with urllib.request.urlopen(self.metrics_url, timeout=5) as response:
+                text = response.read().decode('utf-8')
+        except OSError:
+            return {}
+        actions = {}
+        for match in SERIES.finditer(text):
+            labels = dict(LABEL.findall(match.group("labels")))
+            row = actions.setdefault(labels.get("action", ""), {})
+            if match.group("suffix") == "_count":
+                row["count"] = int(float(match.group("value")))
+            elif "quantile" in labels:
+                row[f"p{float(labels['quantile']) * 100:g}"] = float(match.group("value"))
+        return actions
+
+
+class ResourceMonitor:
+    """Samples the target's CPU time, resident memory and threads from /proc"""
+
+    def __init__(self, pid, interval=1.0):
+        self.pid = pid
+        self.interval = interval
+        self.ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+        self.samples = []  # (monotonic time, cpu seconds, rss bytes, threads)
+
+    def sample(self):
+        try:
+            with open(f"/proc/{self.pid}/stat", 'r') as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            cpu = (int(fields[11]) + int(fields[12])) / self.ticks
+            threads = int(fields[17])
+            rss = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, IndexError, ValueError):
+            return
+        self.samples.append((time.monotonic(), cpu, rss, threads))
+
+    async def run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def summary(self):
+        if len(self.samples) < 2:
+            return None
+        (start, cpu_start, _, _), (end, cpu_end, _, _) = self.samples[0], self.samples[-1]
+        busiest = max((b[1] - a[1]) / max(b[0] - a[0], 1e-9) for a, b in zip(self.samples, self.samples[1:]))
+        return {
+            "cpu_percent": (cpu_end - cpu_start) / max(end - start, 1e-9) * 100,
+            "peak_cpu_percent": busiest * 100,
+            "peak_rss_bytes": max(sample[2] for sample in self.samples),
+            "final_rss_bytes": self.samples[-1][2],
+            "peak_threads": max(sample[3] for sample in self.samples),
+        }
+
+
+class Stats:
+    def __init__(self):
+        self.latency = {}  # operation -> Histogram
+        self.errors = {}  # operation -> {reason: count}
+        self.started = None
+        self.finished = None
+
+    def record(self, operation, seconds):
+        histogram = self.latency.get(operation)
+        if histogram is None:
+            histogram = self.latency[operation] = Histogram(operation, ())
+        histogram.record(seconds)
+
+    def error(self, operation, reason):
+        reasons = self.errors.setdefault(operation, {})
+        reasons[reason] = reasons.get(reason, 0) + 1
+
+    def results(self):
+        elapsed = max((self.finished or time.monotonic()) - (self.started or 0), 1e-9)
+        operations = {}
+        for operation in sorted(set(self.latency) | set(self.errors)):
+            snapshot = self.latency[operation].snapshot() if operation in self.latency else {"count": 0}
+            errors = sum(self.errors.get(operation, {}).values())
+            operations[operation] = {
+                **snapshot,
+                "rate": snapshot["count"] / elapsed,
+                "errors": errors,
+                "error_rate": errors / max(snapshot["count"] + errors, 1),
+                "error_reasons": self.errors.get(operation, {}),
+            }
+        return {"elapsed": elapsed, "operations": operations}
+
+
+async def read_frame(reader):
+    (size,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+    payload = await reader.readexactly(size & ~COMPRESSED_FLAG)
+    return decompress_payload(payload) if size & COMPRESSED_FLAG else payload
+
+
+class SimulatedClient:
+    """One user: a connection, its outstanding tagged requests and its schedule"""
+
+    def __init__(self, index, scenario, target, stats):
+        self.index = index
+        self.user_id = index + 2
+        self.channel_ids = client_channels(index, scenario)
+        self.scenario = scenario
+        self.target = target
+        self.stats = stats
+        self.rng = random.Random(index)
+        self.reader = None
+        self.writer = None
+        self.codec = JSON
+        self.next_tag = 0
+        self.pending = {}  # tag -> future
+        self.tasks = set()
+
+    async def connect(self):
+        raise NotImplementedError
+
+    def encode(self, payload):
+        raise NotImplementedError
+
+    async def read_loop(self):
+        raise NotImplementedError
+
+    async def request(self, operation, payload):
+        """Send a tagged request and record its round trip; the response or None"""
+        self.next_tag += 1
+        tag = self.next_tag
+        payload["tag"] = tag
+        future = asyncio.get_running_loop().create_future()
+        self.pending[tag] = future
+        started = time.monotonic()
+        try:
+            self.writer.write(self.encode(payload))
+            await self.writer.drain()
+            response = await asyncio.wait_for(future, self.scenario["timeout"])
+        except asyncio.TimeoutError:
+            self.stats.error(operation, "timeout")
+            return None
+        except (ConnectionError, OSError) as e:
+            self.stats.error(operation, type(e).__name__)
+            return None
+        finally:
+            self.pending.pop(tag, None)
+        if response.get("status") != "success":
+            self.stats.error(operation, str(response.get("message", response.get("status")))[:60])
+            return None
+        self.stats.record(operation, time.monotonic() - started)
+        return response
+
+    def resolve(self, message):
+        future = self.pending.get(message.get("tag"))
+        if future is not None and not future.done():
+            future.set_result(message)
+
+    def operations(self):
+        """(rate, coroutine function) pairs this client runs"""
+        return []
+
+    async def run(self, start_at, until):
+        await asyncio.sleep(max(start_at - time.monotonic(), 0))
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self.connect(), self.scenario["timeout"])
+        except (asyncio.TimeoutError, ConnectionError, OSError, asyncio.IncompleteReadError) as e:
+            self.stats.error("connect", type(e).__name__)
+            return
+        self.stats.record("connect", time.monotonic() - started)
+        reading = asyncio.ensure_future(self.read_loop())
+        try:
+            await asyncio.gather(*(self.schedule(rate, operation, until)
+                                   for rate, operation in self.operations() if rate > 0))
+            if self.tasks:
+                await asyncio.wait(self.tasks, timeout=self.scenario["timeout"])
+        finally:
+            reading.cancel()
+            self.writer.close()
+
+    async def schedule(self, rate, operation, until):
+        while True:
+            await asyncio.sleep(self.rng.expovariate(rate))
+            if time.monotonic() >= until:
+                return
+            task = asyncio.ensure_future(operation())
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+
+class HostClient(SimulatedClient):
+    """A channel member connected to the ChannelHost and subscribed at handshake"""
+
+    def __init__(self, index, scenario, target, stats):
+        super().__init__(index, scenario, target, stats)
+        self.media_writer = None
+        self.media_lock = asyncio.Lock()
+
+    def encode(self, payload):
+        return encode_frame(self.codec.encode(payload))
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.target.port)
+        self.writer.write(encode_frame(JSON.encode({
+            "user_id": self.user_id,
+            "channel_ids": self.channel_ids,
+            "formats": self.scenario["formats"],
+        })))
+        await self.writer.drain()
+        response = decode(await read_frame(self.reader))
+        if response.get("status") != "authenticated":
+            raise ConnectionError(f"Handshake refused: {response}")
+        self.codec = get_codec(response.get("format", "json"))
+
+    async def read_loop(self):
+        try:
+            while True:
+                message = decode(await read_frame(self.reader))
+                if "tag" in message:
+                    self.resolve(message)
+                elif message.get("type") == "new_message":
+                    # Our own sends carry their send time, see send_message
+                    content = (message.get("message") or {}).get("content") or ""
+                    if content.startswith("lg "):
+                        self.stats.record("delivery", time.time() - float(content.split(" ", 2)[1]))
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            pass
+
+    def operations(self):
+        return [
+            (self.scenario["send_rate"], self.send_message),
+            (self.scenario["history_rate"], self.fetch_history),
+            (self.scenario["media_rate"], self.send_media),
+        ]
+
+    def content(self):
+        text = f"lg {time.time():.6f} "
+        return text + "x" * max(self.scenario["message_bytes"] - len(text), 0)
+
+    async def send_message(self):
+        await self.request("send", {"action": "send_message", "channel_id": self.rng.choice(self.channel_ids),
+                                    "content": self.content()})
+
+    async def fetch_history(self):
+        await self.request("history", {"action": "get_channel_messages", "limit": self.scenario["history_limit"],
+                                       "channel_id": self.rng.choice(self.channel_ids)})
+
+    async def send_media(self):
+        """Upload to the media node, then announce the file in the channel"""
+        started = time.monotonic()
+        media_id = f"{self.user_id}-{self.rng.getrandbits(48):012x}"
+        try:
+            async with self.media_lock:
+                if self.media_writer is None:
+                    reader, self.media_writer = await asyncio.open_connection("127.0.0.1", self.target.media_port)
+                    self.media_writer.write(json.dumps({"user_id": self.user_id, "username": f"loadgen_{self.user_id}",
+                                                        "formats": ["json"]}).encode('utf-8'))
+                    await self.media_writer.drain()
+                    await reader.read(1024)  # the node's JSON acknowledgement
+                body = json.dumps({
+                    "action": "send_media", "media_id": media_id, "media_type": "image",
+                    "media_name": "loadgen.png", "target_id": self.channel_ids[0], "is_channel": True,
+                    "media_data": base64.b64encode(os.urandom(self.scenario["media_bytes"])).decode('ascii'),
+                }).encode('utf-8')
+                self.media_writer.write(MEDIA_HEADER.pack(len(body)) + body)
+                await self.media_writer.drain()
+        except (ConnectionError, OSError) as e:
+            self.stats.error("media", type(e).__name__)
+            self.media_writer = None
+            return
+        response = await self.request("media_announce", {
+            "action": "send_message", "channel_id": self.channel_ids[0], "content": self.content(),
+            "has_media": True, "media_type": "image", "media_name": "loadgen.png",
+            "media_path": f"media/images/loadgen_{media_id}.png",
+        })
+        if response is not None:
+            self.stats.record("media", time.monotonic() - started)
+
+    async def run(self, start_at, until):
+        try:
+            await super().run(start_at, until)
+        finally:
+            if self.media_writer is not None:
+                self.media_writer.close()
+
+
+class ServerClient(SimulatedClient):
+    """A client watching channel routes on the ChatServer's control connection"""
+
+    def encode(self, payload):
+        return (json.dumps(payload) + "\n").encode('utf-8')
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.target.port, limit=1 << 20)
+
+    async def read_loop(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    return
+                message = json.loads(line)
+                if "tag" in message:
+                    self.resolve(message)
+                elif message.get("type") == "route_update":
+                    self.stats.record("route_push", 0.0)
+        except (ConnectionError, OSError, ValueError):
+            pass
+
+    def operations(self):
+        return [(self.scenario["lookup_rate"], self.lookup)]
+
+    async def lookup(self):
+        await self.request("lookup", {"action": "lookup", "channel_ids": self.channel_ids, "watch": True})
+
+
+def raise_file_limit(needed):
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+
+async def drive(scenario, target, stats):
+    monitor = ResourceMonitor(target.process.pid)
+    sampling = asyncio.ensure_future(monitor.run())
+    client_class = HostClient if scenario["target"] == "host" else ServerClient
+    clients = [client_class(index, scenario, target, stats) for index in range(scenario["clients"])]
+    now = time.monotonic()
+    stats.started = now + scenario["ramp"]
+    until = stats.started + scenario["duration"]
+    step = scenario["ramp"] / max(len(clients), 1)
+    try:
+        await asyncio.gather(*(client.run(now + index * step, until) for index, client in enumerate(clients)))
+    finally:
+        stats.finished = min(time.monotonic(), until)
+        sampling.cancel()
+        monitor.sample()
+    return monitor.summary()
+
+
+def print_report(scenario_name, scenario, results, out=sys.stdout):
+    print(f"Scenario {scenario_name}: {scenario['clients']} clients on the {scenario['target']} for "
+          f"{scenario['duration']:g}s after a {scenario['ramp']:g}s ramp", file=out)
+    print(f"\n{'operation':<16}{'count':>9}{'per s':>9}{'errors':>8}{'err %':>7}"
+          f"{'p50 ms':>9}{'p90':>9}{'p99':>9}{'p99.9':>9}{'max':>9}", file=out)
+    for operation, row in results["operations"].items():
+        line = f"{operation:<16}{row['count']:>9}{row['rate']:>9.1f}{row['errors']:>8}{row['error_rate'] * 100:>7.2f}"
+        if row["count"]:
+            line += "".join(f"{row[key] * 1000:>9.2f}" for key in ("p50", "p90", "p99", "p99.9", "max"))
+        print(line, file=out)
+    for operation, row in results["operations"].items():
+        for reason, count in sorted(row["error_reasons"].items(), key=lambda item: -item[1])[:5]:
+            print(f"  {operation} error x{count}: {reason}", file=out)
+
+    resources = results.get("target_resources")
+    if resources:
+        print(f"\nTarget process: {resources['cpu_percent']:.0f}% CPU average, "
+              f"{resources['peak_cpu_percent']:.0f}% peak, "
+              f"{resources['peak_rss_bytes'] / 1048576:.1f} MiB peak RSS, "
+              f"{resources['peak_threads']} threads", file=out)
+    measured = results.get("target_requests")
+    if measured:
+        print(f"\n{'target-side':<28}{'count':>9}{'p50 ms':>9}{'p99':>9}", file=out)
+        for action, row in sorted(measured.items()):
+            if row.get("count"):
+                print(f"{action:<28}{row['count']:>9}{row.get('p50', 0) * 1000:>9.2f}"
+                      f"{row.get('p99', 0) * 1000:>9.2f}", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", default="chat", help=f"one of {', '.join(SCENARIOS)} or a JSON file")
+    parser.add_argument("--clients", type=int)
+    parser.add_argument("--channels", type=int)
+    parser.add_argument("--duration", type=float)
+    parser.add_argument("--ramp", type=float)
+    parser.add_argument("--send-rate", type=float, help="messages per client and second")
+    parser.add_argument("--history-rate", type=float)
+    parser.add_argument("--media-rate", type=float)
+    parser.add_argument("--lookup-rate", type=float)
+    parser.add_argument("--formats", help="wire formats clients offer, most preferred first (e.g. bin1,json)")
+    parser.add_argument("--workdir", help="keep the scratch database and target logs here")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--serve-host", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve_host:
+        serve_host()
+        return
+
+    scenario = load_scenario(args.scenario)
+    for field in ("clients", "channels", "duration", "ramp", "send_rate", "history_rate",
+                  "media_rate", "lookup_rate"):
+        if getattr(args, field) is not None:
+            scenario[field] = getattr(args, field)
+    if args.formats:
+        scenario["formats"] = args.formats.split(",")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="loadgen-")
+    os.makedirs(workdir, exist_ok=True)
+    # Two sockets per client (media), plus the target's ends of them
+    raise_file_limit(scenario["clients"] * 4 + 256)
+    target = None
+    try:
+        database_path = provision(workdir, scenario)
+        target = Target(scenario, workdir, database_path)
+        target.start()
+        stats = Stats()
+        resources = asyncio.run(drive(scenario, target, stats))
+        results = stats.results()
+        results["scenario"] = scenario
+        results["target_resources"] = resources
+        results["target_requests"] = target.scrape()
+    finally:
+        if target is not None:
+            target.stop()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(args.scenario, scenario, results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""Timings of the client's hot SQL paths against a generated database.
+
+    python -m benchmarks.queries DATABASE.db [--repeat 5] [--only load_friends,search_messages]
+                                 [--explain] [--json results.json]
+
+Create the database with benchmarks.dataset. Every path runs for a heavy, a
+typical and a light subject (user or channel, picked from the data), first
+run and repeats reported separately so cold and warm cache costs both show.
+--explain prints SQLite's plan for every statement a path issues, to check
+what an index or query change does.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.dataset import SEARCH_TERMS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NOTIFICATION_WINDOW = timedelta(hours=1)  # get_new_messages looks back this far from the newest message
+
+# (subject kind, SQL listing candidate ids by decreasing weight)
+SUBJECTS = {
+    "channel": "SELECT channel_id, MAX(seq) FROM messages WHERE channel_id IS NOT NULL "
+               "GROUP BY channel_id ORDER BY 2 DESC, 1",
+    "member": "SELECT user_id, COUNT(*) FROM channel_memberships GROUP BY user_id ORDER BY 2 DESC, 1",
+    "friend": "SELECT user_id, COUNT(*) FROM (SELECT user_id FROM friendships UNION ALL "
+              "SELECT friend_id FROM friendships) GROUP BY user_id ORDER BY 2 DESC, 1",
+}
+
+
+def pick_subjects(connection, kind):
+    """(label, id) of the heaviest, the median and the lightest subject"""
+    rows = connection.execute(SUBJECTS[kind]).fetchall()
+    if not rows:
+        return []
+    return [("heavy", rows[0][0]), ("typical", rows[len(rows) // 2][0]), ("light", rows[-1][0])]
+
+
+class QueryPaths:
+    """The query paths, as the application runs them"""
+
+    def __init__(self, newest_message):
+        # Imported only now: the engines read DATABASE_URL when first imported
+        from src.database.config import SessionLocal
+        from src.database.models import User, Message, Friendship
+        from src.client.message_handler import MessageHandler
+
+        self.SessionLocal = SessionLocal
+        self.User = User
+        self.Message = Message
+        self.Friendship = Friendship
+        self.MessageHandler = MessageHandler
+        self.since = newest_message - NOTIFICATION_WINDOW
+        self.term = SEARCH_TERMS[1]
+
+    def load_channel_messages(self, channel_id):
+        """MainWindow.load_channel_messages without the widgets"""
+        Message, User = self.Message, self.User
+        db = self.SessionLocal()
+        try:
+            messages = db.query(Message).filter(
+                Message.channel_id == channel_id
+            ).order_by(Message.created_at).limit(100).all()
+
+            sender_ids = {msg.sender_id for msg in messages}
+            senders = db.query(User).filter(User.id.in_(sender_ids)).all()
+            sender_map = {sender.id: sender.username for sender in senders}
+            return len([sender_map.get(message.sender_id) for message in messages])
+        finally:
+            db.close()
+
+    def load_friends(self, user_id):
+        """MainWindow.load_friends without the widgets"""
+        User, Friendship = self.User, self.Friendship
+        db = self.SessionLocal()
+        try:
+            q1 = db.query(User).join(
+                Friendship, User.id == Friendship.friend_id
+            ).filter(Friendship.user_id == user_id)
+            q2 = db.query(User).join(
+                Friendship, User.id == Friendship.user_id
+            ).filter(Friendship.friend_id == user_id)
+
+            friends = q1.union(q2).order_by(User.username).all()
+            return len([friend for friend in friends if friend.id != user_id])
+        finally:
+            db.close()
+
+    def search_messages(self, user_id):
+        return len(self.MessageHandler(user_id).search_messages(self.term))
+
+    def get_recent_messages(self, user_id):
+        return len(self.MessageHandler(user_id).get_recent_messages())
+
+    def get_new_messages(self, user_id):
+        # Imported here, it needs PySide6, which the other paths do not
+        from src.client.notification_handler import NotificationHandler
+
+        # Skip the constructor, it sets up Qt timers and settings
+        handler = NotificationHandler.__new__(NotificationHandler)
+        handler.current_user_id = user_id
+        handler.last_check = self.since
+        return len(handler.get_new_messages())
+
+
+PATHS = {
+    "load_channel_messages": "channel",
+    "load_friends": "friend",
+    "search_messages": "member",
+    "get_recent_messages": "member",
+    "get_new_messages": "member",
+}
+
+
+class StatementRecorder:
+    """Collects each distinct SQL statement issued while enabled, with the
+    parameters of its first execution"""
+
+    def __init__(self):
+        self.statements = {}
+        self.enabled = False
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if self.enabled:
+            self.statements.setdefault(statement, parameters)
+
+
+def explain(database_path, statements, out=sys.stdout):
+    connection = sqlite3.connect(database_path)
+    try:
+        for statement, parameters in statements.items():
+            print("    " + " ".join(statement.split())[:160], file=out)
+            for row in connection.execute("EXPLAIN QUERY PLAN " + statement, parameters or ()):
+                print(f"      {row[-1]}", file=out)
+    finally:
+        connection.close()
+
+
+def run(database_path, repeat, only=None, show_plans=False, term=None, out=sys.stdout):
+    database_path = os.path.abspath(database_path)
+    if not os.path.exists(database_path):
+        raise FileNotFoundError(f"{database_path} does not exist, create it with benchmarks.dataset")
+    os.environ["DATABASE_URL"] = f"sqlite:///{database_path}"
+    # message_handler and notification_handler import database.* as when run from src
+    sys.path.append(os.path.join(ROOT, "src"))
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    connection = sqlite3.connect(database_path)
+    try:
+        newest = connection.execute("SELECT MAX(created_at) FROM messages").fetchone()[0]
+        subjects = {kind: pick_subjects(connection, kind) for kind in set(PATHS.values())}
+    finally:
+        connection.close()
+    paths = QueryPaths(datetime.fromisoformat(newest) if newest else datetime.utcnow())
+    if term:
+        paths.term = term
+
+    recorder = StatementRecorder()
+    event.listen(Engine, "before_cursor_execute", recorder)
+    results = []
+    print(f"{'path':<24}{'subject':<10}{'id':>8}{'rows':>8}{'first ms':>11}{'median':>10}{'max':>10}", file=out)
+    try:
+        for name, kind in PATHS.items():
+            if only and name not in only:
+                continue
+            for label, subject_id in subjects[kind]:
+                function = getattr(paths, name)
+                recorder.statements = {}
+                recorder.enabled = show_plans
+                started = time.perf_counter()
+                rows = function(subject_id)
+                first = time.perf_counter() - started
+                recorder.enabled = False
+                timings = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    function(subject_id)
+                    timings.append(time.perf_counter() - started)
+                median = statistics.median(timings) if timings else first
+                worst = max(timings) if timings else first
+                results.append({"path": name, "subject": label, "id": subject_id, "rows": rows,
+                                "first": first, "median": median, "max": worst, "repeat": repeat})
+                print(f"{name:<24}{label:<10}{subject_id:>8}{rows:>8}{first * 1000:>11.2f}"
+                      f"{median * 1000:>10.2f}{worst * 1000:>10.2f}", file=out, flush=True)
+                if show_plans:
+                    explain(database_path, recorder.statements, out)
+    finally:
+        event.remove(Engine, "before_cursor_execute", recorder)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("database", help="database created by benchmarks.dataset")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs after the first")
+    parser.add_argument("--only", help="comma-separated paths: " + ", ".join(PATHS))
+    parser.add_argument("--term", help=f"search_messages term (default {SEARCH_TERMS[1]!r})")
+    parser.add_argument("--explain", action="store_true", help="print the query plan of every statement")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    only = set(args.only.split(",")) if args.only else None
+    unknown = (only or set()) - set(PATHS)
+    if unknown:
+        parser.error(f"unknown paths: {', '.join(sorted(unknown))}")
+    results = run(args.database, args.repeat, only, args.explain, args.term)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"database": os.path.abspath(args.database), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
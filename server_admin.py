@@ -0,0 +1,25 @@
+import socket
+import sys
+
+# Sends a profiling command to a server running on this machine, e.g.
+#     python server_admin.py profile 30
+#     python server_admin.py memory snapshot
+
+def send_command(command):
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        
+        sock.connect(('localhost', 5000))
+        
+        sock.send((command + "\n").encode())
+        
+        response = sock.recv(4096).decode()
+        print(f"Server response: {response.strip()}")
+        
+    except Exception as e:
+        print(f"Error: {e}")
+    finally:
+        sock.close()
+
+if __name__ == "__main__":
+    send_command(" ".join(sys.argv[1:]) or "profile help")
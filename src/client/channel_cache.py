@@ -0,0 +1,126 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class ChannelCache:
+    """LRU cache of hosted channel data, bounded by entry count and/or bytes.
+
+    get() counts hits and misses and marks the entry as recently used; peek()
+    does neither, for bookkeeping that should not keep a channel resident.
+    Entries grow after insertion (new messages), so callers report that with
+    resize() and the cache evicts from the cold end until it fits again.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 sizeof: Optional[Callable[[Any], int]] = None,
+                 on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof or (lambda entry: 0)
+        self._on_evict = on_evict
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def peek(self, key, default=None):
+        return self._entries.get(key, default)
+
+    def put(self, key, entry):
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._sizes[key]
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._sizes[key] = self._sizeof(entry)
+            self._bytes += self._sizes[key]
+            evicted = self._shrink()
+        self._notify(evicted)
+
+    def resize(self, key):
+        """Re-measure an entry that changed in place"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            size = self._sizeof(entry)
+            self._bytes += size - self._sizes[key]
+            self._sizes[key] = size
+            evicted = self._shrink()
+        self._notify(evicted)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            self._bytes -= self._sizes.pop(key)
+            return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+    def _over_budget(self) -> bool:
+        if self.max_entries is not None and len(self._entries) > self.max_entries:
+            return True
+        return self.max_bytes is not None and self._bytes > self.max_bytes
+
+    def _shrink(self):
+        # The most recently used entry always stays, even if it alone is over budget
+        evicted = []
+        while self._over_budget() and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            entry = self._entries.pop(key)
+            self._bytes -= self._sizes.pop(key)
+            self.evictions += 1
+            evicted.append((key, entry))
+        return evicted
+
+    def _notify(self, evicted):
+        if self._on_evict is None:
+            return
+        for key, entry in evicted:
+            self._on_evict(key, entry)
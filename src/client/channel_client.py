@@ -0,0 +1,408 @@
+import socket
+import threading
+import json
+import logging
+import itertools
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from datetime import datetime
+from src.common.framing import send_frame, recv_frame
+from src.common.columnar import unpack_response
+from src.common.codec import JSON, decode, get_codec
+from src.client.config import CHANNEL_CODECS, CHANNEL_COMPRESS_THRESHOLD, WIRE_FORMATS
+
+
+class ChannelHostClient:
+    """A member's connection to the ChannelHost that serves a channel.
+
+    Every request carries a tag that the host echoes back, so many requests
+    can be in flight at once and answered in any order. Frames carrying a
+    "type" are pushes from the host (e.g. new_message) and are handed to the
+    update callbacks on the reader thread.
+
+    Hosts announce the standby of each channel; when the connection drops the
+    client reconnects there and restores its subscriptions (failover=True).
+
+    channel_ids are subscribed in the handshake itself. Pushes for all of them
+    arrive on this one connection numbered by "seq", and every channel message
+    carries its seq in the channel's log. After a gap in either, or when a new
+    connection finds the host ahead of us, the client syncs exactly the
+    missing range and delivers it as a catch_up update.
+
+    The wire format (formats) and codecs the host agrees to at handshake (zlib
+    for large frames, columnar message batches) are undone in the reader,
+    callers always see plain message dicts.
+    """
+
+    def __init__(self, user_id, host, port, timeout=10.0, failover=True, channel_ids=None,
+                 codecs=CHANNEL_CODECS, formats=WIRE_FORMATS):
+        self.user_id = user_id
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self.host_id = None
+        self.is_connected = False
+        self.pending = {}  # tag -> Future of the response
+        self.pending_lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.tags = itertools.count(1)
+        self.update_callbacks = []
+        self.reader_thread = None
+        self.failover = failover
+        self.closed = False
+        self.connected = threading.Event()
+        self.subscriptions = set(channel_ids or ())
+        self.standbys = {}  # channel_id -> (host, port) to fail over to
+        self.last_seqs = {}  # channel_id -> seq of the newest message we have seen
+        self.sync_targets = {}  # channel_id -> newest seq pushed while a sync was running
+        self.syncing = set()
+        self.seq_lock = threading.Lock()
+        self.push_seq = 0
+        self.codecs = tuple(codecs)
+        self.formats = tuple(formats)
+        self.codec = JSON
+        self.compress_threshold = None
+        self.columnar = False
+
+    @classmethod
+    def for_channel(cls, directory, user_id, channel_id, **kwargs):
+        """Connect straight to the channel's host as found in the routing
+        directory, or None if nobody hosts it"""
+        for attempt in range(2):
+            address = directory.lookup(channel_id)
+            if address is None:
+                return None
+            client = cls(user_id, address[0], address[1], **kwargs)
+            if client.connect():
+                return client
+            # The cached route may be stale, ask the server once more
+            directory.invalidate(channel_id)
+        return None
+
+    def connect(self):
+        try:
+            self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            handshake = {
+                "user_id": self.user_id,
+                "timestamp": datetime.now().isoformat()
+            }
+            if self.subscriptions:
+                handshake["channel_ids"] = list(self.subscriptions)
+            if self.codecs:
+                handshake["codecs"] = list(self.codecs)
+            if self.formats:
+                handshake["formats"] = list(self.formats)
+            # The handshake itself is JSON, the host may answer in the agreed format
+            send_frame(self.sock, json.dumps(handshake).encode('utf-8'))
+
+            response = decode(recv_frame(self.sock))
+            if response.get("status") != "authenticated":
+                logging.error(f"Channel host {self.host}:{self.port} rejected user {self.user_id}")
+                self.sock.close()
+                return False
+
+            self.host_id = response.get("host_id")
+            self.push_seq = 0
+            self.codec = get_codec(response.get("format"))
+            codecs = response.get("codecs", [])
+            self.compress_threshold = CHANNEL_COMPRESS_THRESHOLD if "zlib" in codecs else None
+            self.columnar = "columnar" in codecs
+            behind = self._note_subscribed(response.get("subscribed", []))
+            if response.get("rejected"):
+                self.subscriptions.difference_update(response["rejected"])
+                logging.warning(f"Channel host {self.host}:{self.port} rejected subscriptions "
+                                f"{response['rejected']}")
+            self.sock.settimeout(None)
+            self.is_connected = True
+            self.closed = False
+            self.connected.set()
+
+            self.reader_thread = threading.Thread(target=self._read_loop, args=(self.sock,), daemon=True)
+            self.reader_thread.start()
+            self._start_sync(behind)
+            return True
+        except Exception as e:
+            logging.error(f"Error connecting to channel host {self.host}:{self.port}: {str(e)}")
+            return False
+
+    def close(self):
+        self.closed = True
+        self._close_socket()
+
+    def _close_socket(self):
+        # Detach first so the old reader thread knows it is not the current one
+        sock, self.sock = self.sock, None
+        self.is_connected = False
+        self.connected.clear()
+        if sock:
+            try:
+                # Wakes the reader thread and lets the host see the disconnect
+                sock.shutdown(socket.SHUT_RDWR)
+            except Exception:
+                pass
+            try:
+                sock.close()
+            except Exception:
+                pass
+
+    def switch_host(self, host, port):
+        """Move to another host of our channels, the handshake restores the subscriptions"""
+        self._close_socket()
+        self.host, self.port = host, port
+        if not self.connect():
+            return False
+
+        logging.info(f"Switched channel host to {host}:{port}")
+        self._deliver({"type": "host_changed", "host": host, "port": port})
+        return True
+
+    def _fail_over(self):
+        candidates = [self.standbys[channel_id] for channel_id in self.subscriptions
+                      if channel_id in self.standbys]
+        candidates += [address for address in self.standbys.values() if address not in candidates]
+        for host, port in candidates:
+            if self.closed:
+                return
+            if (host, port) != (self.host, self.port) and self.switch_host(host, port):
+                return
+        logging.error(f"No standby reachable after losing channel host {self.host}:{self.port}")
+
+    def _deliver(self, message):
+        for callback in list(self.update_callbacks):
+            try:
+                callback(message)
+            except Exception as e:
+                logging.error(f"Error in channel update callback: {str(e)}")
+
+    def add_update_callback(self, callback):
+        if callback not in self.update_callbacks:
+            self.update_callbacks.append(callback)
+
+    def _read_loop(self, sock):
+        try:
+            while self.is_connected:
+                data = recv_frame(sock)
+                if data is None:
+                    break
+
+                message = decode(data)
+                if self.columnar:
+                    unpack_response(message)
+                if "type" in message:
+                    self._check_seq(message.get("seq"))
+                    if message["type"] == "new_message":
+                        if not self._accept_message(message["channel_id"], message["message"]):
+                            continue
+                    elif message["type"] == "replica_announce":
+                        self.standbys[message["channel_id"]] = (message["host"], message["port"])
+                    elif message["type"] == "redirect":
+                        threading.Thread(
+                            target=self.switch_host,
+                            args=(message["host"], message["port"]),
+                            daemon=True
+                        ).start()
+                    self._deliver(message)
+                else:
+                    with self.pending_lock:
+                        future = self.pending.pop(message.get("tag"), None)
+                    if future is not None:
+                        future.set_result(message)
+        except Exception as e:
+            if self.is_connected:
+                logging.error(f"Lost connection to channel host {self.host}:{self.port}: {str(e)}")
+        finally:
+            current = sock is self.sock
+            if current:
+                self._close_socket()
+            with self.pending_lock:
+                pending, self.pending = self.pending, {}
+            for future in pending.values():
+                future.set_result({"status": "error", "message": "Connection closed"})
+            if current and self.failover and not self.closed and self.standbys:
+                threading.Thread(target=self._fail_over, daemon=True).start()
+
+    def _check_seq(self, seq):
+        if seq is None:
+            return
+        expected = self.push_seq + 1
+        self.push_seq = seq
+        if seq != expected:
+            logging.warning(f"Missed pushes {expected}..{seq - 1} from channel host {self.host}:{self.port}")
+            self._start_sync(list(self.subscriptions))
+
+    def _accept_message(self, channel_id, message):
+        """Whether a pushed message is the next one of its channel; duplicates
+        are dropped and a gap starts a sync that delivers the range in order"""
+        seq = message.get("seq")
+        with self.seq_lock:
+            known = self.last_seqs.get(channel_id)
+            if seq is None or known is None:
+                if seq is not None:
+                    self.last_seqs[channel_id] = seq
+                return True
+            if seq <= known:
+                return False
+            if seq == known + 1 and channel_id not in self.syncing:
+                self.last_seqs[channel_id] = seq
+                return True
+            self.sync_targets[channel_id] = max(self.sync_targets.get(channel_id, 0), seq)
+            if channel_id in self.syncing:
+                return False  # The running sync picks it up
+        logging.warning(f"Channel {channel_id} jumped from seq {known} to {seq}, syncing")
+        self._start_sync([channel_id])
+        return False
+
+    def _note_seq(self, channel_id, seq):
+        if seq is None:
+            return
+        with self.seq_lock:
+            if seq > (self.last_seqs.get(channel_id) or 0):
+                self.last_seqs[channel_id] = seq
+
+    def _note_subscribed(self, subscribed):
+        """Record subscribe results; returns the channels where the host has
+        messages newer than the last we saw"""
+        behind = []
+        for channel in subscribed:
+            channel_id = channel["channel_id"]
+            self.subscriptions.add(channel_id)
+            if channel.get("standby"):
+                self.standbys[channel_id] = tuple(channel["standby"])
+            head = channel.get("last_seq")
+            with self.seq_lock:
+                known = self.last_seqs.get(channel_id)
+                if known is None:
+                    # Nothing to catch up on, the caller loads history itself
+                    if head is not None:
+                        self.last_seqs[channel_id] = head
+                elif head is not None and head > known:
+                    behind.append(channel_id)
+        return behind
+
+    def _start_sync(self, channel_ids):
+        with self.seq_lock:
+            channel_ids = [channel_id for channel_id in channel_ids
+                           if channel_id in self.last_seqs and channel_id not in self.syncing]
+            self.syncing.update(channel_ids)
+        if channel_ids:
+            threading.Thread(target=self.sync, args=(channel_ids,), daemon=True).start()
+
+    def sync(self, channel_ids):
+        """Fetch what channel_ids gained after our last seq and deliver it as
+        catch_up updates, asking again until every channel is complete"""
+        pending = list(channel_ids)
+        while pending and self.is_connected:
+            with self.seq_lock:
+                channels = [{"channel_id": channel_id, "last_seq": self.last_seqs.get(channel_id, 0)}
+                            for channel_id in pending]
+            response = self.request("sync", channels=channels)
+            if response.get("status") != "success":
+                logging.error(f"Channel sync failed: {response.get('message')}")
+                break
+
+            again = []
+            for result in response["results"]:
+                messages = result.get("messages")
+                if messages:
+                    self._note_seq(result["channel_id"], messages[-1].get("seq"))
+                    self._deliver({"type": "catch_up", "channel_id": result["channel_id"],
+                                   "new_messages": messages})
+                    if result.get("more"):
+                        again.append(result["channel_id"])
+            pending = again
+
+        # Pushes held back while we were syncing may still be ahead of us
+        behind = []
+        with self.seq_lock:
+            for channel_id in channel_ids:
+                self.syncing.discard(channel_id)
+                target = self.sync_targets.pop(channel_id, 0)
+                if target > self.last_seqs.get(channel_id, 0) and channel_id not in pending:
+                    behind.append(channel_id)
+        if behind and self.is_connected:
+            self._start_sync(behind)
+
+    def request_async(self, action, **params):
+        """Send a request without waiting; returns a Future of the response"""
+        future = Future()
+        future.tag = None
+        if not self.is_connected and not self.closed and self.failover and self.standbys:
+            # Give an ongoing failover a chance to finish
+            self.connected.wait(self.timeout)
+        if not self.is_connected:
+            future.set_result({"status": "error", "message": "Not connected"})
+            return future
+
+        tag = future.tag = next(self.tags)
+        params["action"] = action
+        params["tag"] = tag
+        with self.pending_lock:
+            self.pending[tag] = future
+        try:
+            with self.send_lock:
+                send_frame(self.sock, self.codec.encode(params), self.compress_threshold)
+        except Exception as e:
+            with self.pending_lock:
+                self.pending.pop(tag, None)
+            future.set_result({"status": "error", "message": str(e)})
+        return future
+
+    def request(self, action, timeout=None, **params):
+        future = self.request_async(action, **params)
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except FutureTimeoutError:
+            with self.pending_lock:
+                self.pending.pop(future.tag, None)
+            return {"status": "error", "message": "Request timed out"}
+
+    def subscribe(self, channel_ids):
+        response = self.request("subscribe", channel_ids=list(channel_ids))
+        self._note_subscribed(response.get("subscribed", []))
+        return response
+
+    def unsubscribe(self, channel_ids=None):
+        if channel_ids is None:
+            self.subscriptions.clear()
+            return self.request("unsubscribe")
+        self.subscriptions.difference_update(channel_ids)
+        return self.request("unsubscribe", channel_ids=list(channel_ids))
+
+    def get_channel_info(self, channel_id):
+        return self.request("get_channel_info", channel_id=channel_id)
+
+    def get_channel_messages(self, channel_id, limit=50, before_id=None):
+        return self.request("get_channel_messages", channel_id=channel_id, limit=limit, before_id=before_id)
+
+    def get_channel_messages_batch(self, channel_ids, limit=50):
+        """channel_id -> list of latest messages, for many channels in one round trip"""
+        response = self.request("get_channel_messages_batch", channels=list(channel_ids), limit=limit)
+        messages = {}
+        for result in response.get("results", []):
+            if result.get("status") == "success":
+                messages[result["channel_id"]] = result["messages"]
+                if result["messages"]:
+                    self._note_seq(result["channel_id"], result["messages"][0].get("seq"))
+        return messages
+
+    def refresh_membership(self, channel_id):
+        """Tell the host our membership of channel_id changed (e.g. we left)"""
+        return self.request("refresh_membership", channel_id=channel_id)
+
+    def send_message(self, channel_id, content, **media):
+        return self.request("send_message", channel_id=channel_id, content=content, **media)
+
+    def fetch_updates(self, channel_id, last_message_id, wait=0, stream=False):
+        """With wait > 0 the host holds the request until a new message arrives
+        or wait seconds pass. With stream=True later messages keep arriving as
+        stream_update pushes until a stream_end push."""
+        return self.request(
+            "fetch_updates",
+            timeout=self.timeout + wait,
+            channel_id=channel_id,
+            last_message_id=last_message_id,
+            wait=wait,
+            stream=stream
+        )
@@ -519,6 +519,10 @@ class ChannelDialog(QDialog):
                 db.delete(membership)
                 db.commit()
 
+                channel_host = getattr(self.parent(), "channel_host", None)
+                if channel_host:
+                    channel_host.remove_member(channel_id, member_id)
+
                 members_list.takeItem(members_list.row(selected))
                 QMessageBox.information(self, "Success", "Member removed successfully")
             else:
@@ -0,0 +1,276 @@
+import socket
+import threading
+import json
+import logging
+import itertools
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from src.client.config import SERVER_HOST, SERVER_PORT, CHANNEL_ROUTE_TTL, WIRE_FORMATS
+from src.common.codec import decode, get_codec
+from src.common.framing import encode_frame, FrameReader
+
+
+class ChannelDirectory:
+    """Client side of the server's channel routing directory.
+
+    Lookups are cached for ttl seconds and the server pushes a route_update
+    whenever a looked-up channel moves, so the cache is normally current and a
+    client reaches the channel's host in one hop. Registrations are remembered
+    and sent again after a reconnect. The same connection publishes and looks
+    up realtime peers (register_peer, lookup_peers).
+    """
+
+    def __init__(self, server_host=SERVER_HOST, server_port=SERVER_PORT,
+                 ttl=CHANNEL_ROUTE_TTL, timeout=5.0, formats=WIRE_FORMATS):
+        self.server_host = server_host
+        self.server_port = server_port
+        self.ttl = ttl
+        self.timeout = timeout
+        self.formats = list(formats)
+        self.codec = None  # None while speaking JSON lines
+        self.sock = None
+        self.is_connected = False
+        self.running = False
+        self.cache = {}  # channel_id -> (route, expires_at)
+        self.cache_lock = threading.Lock()
+        self.watched = set()
+        self.registrations = {}  # (host, port) -> (user_id, set of channel_ids)
+        self.peer_registration = None  # (user_id, host, port) of our realtime listener
+        self.pending = {}  # tag -> Future of the response
+        self.pending_lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.tags = itertools.count(1)
+        self.route_callbacks = []
+        self.reconnect_event = threading.Event()
+
+    def start(self):
+        self.running = True
+        connected = self.connect()
+        threading.Thread(target=self._reconnect_loop, daemon=True).start()
+        return connected
+
+    def stop(self):
+        self.running = False
+        self.reconnect_event.set()
+        self._close_socket()
+
+    def add_route_callback(self, callback):
+        if callback not in self.route_callbacks:
+            self.route_callbacks.append(callback)
+
+    def connect(self):
+        try:
+            sock = socket.create_connection((self.server_host, self.server_port), timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.codec = self._hello(sock) if self.formats else None
+            sock.settimeout(None)
+        except Exception as e:
+            logging.warning(f"Routing directory {self.server_host}:{self.server_port} unavailable: {str(e)}")
+            return False
+
+        self.sock = sock
+        self.is_connected = True
+        threading.Thread(target=self._read_loop, args=(sock,), daemon=True).start()
+
+        # Our state on the server died with the previous connection
+        for (host, port), (user_id, channel_ids) in list(self.registrations.items()):
+            self.request("register", user_id=user_id, channel_ids=list(channel_ids), host=host, port=port)
+        if self.watched:
+            self.request("subscribe_routes", channel_ids=list(self.watched))
+        if self.peer_registration is not None:
+            user_id, host, port = self.peer_registration
+            self.request("register_peer", user_id=user_id, host=host, port=port)
+        return True
+
+    def _hello(self, sock):
+        """Agree on a wire format; the connection is framed from then on.
+        A server without hello support answers with an error and we stay on
+        JSON lines"""
+        sock.sendall((json.dumps({"action": "hello", "formats": self.formats}) + "\n").encode('utf-8'))
+        buffer = b""
+        while b"\n" not in buffer:
+            data = sock.recv(4096)
+            if not data:
+                raise ConnectionError("Connection closed during hello")
+            buffer += data
+        response = json.loads(buffer.split(b"\n", 1)[0].decode('utf-8'))
+        if response.get("status") != "success":
+            return None
+        return get_codec(response.get("format"))
+
+    def _close_socket(self):
+        sock, self.sock = self.sock, None
+        self.is_connected = False
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except Exception:
+                pass
+            try:
+                sock.close()
+            except Exception:
+                pass
+
+    def _reconnect_loop(self):
+        delay = 1.0
+        while self.running:
+            if self.is_connected:
+                delay = 1.0
+                self.reconnect_event.wait()
+                self.reconnect_event.clear()
+                continue
+            if self.connect():
+                continue
+            self.reconnect_event.wait(delay)
+            delay = min(delay * 2, 60.0)
+
+    def _read_loop(self, sock):
+        buffer = b""
+        reader = FrameReader() if self.codec is not None else None
+        try:
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    break
+                if reader is not None:
+                    for frame in reader.feed(data):
+                        self._handle(decode(frame))
+                    continue
+                buffer += data
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    if line.strip():
+                        self._handle(json.loads(line.decode('utf-8')))
+        except Exception as e:
+            if self.running and sock is self.sock:
+                logging.error(f"Lost routing directory connection: {str(e)}")
+        finally:
+            if sock is self.sock:
+                self._close_socket()
+                # Routes may have moved while we could not hear about it
+                with self.cache_lock:
+                    self.cache.clear()
+                self.reconnect_event.set()
+            with self.pending_lock:
+                pending, self.pending = self.pending, {}
+            for future in pending.values():
+                future.set_result({"status": "error", "message": "Connection closed"})
+
+    def _handle(self, message):
+        if message.get("type") == "route_update":
+            self._apply(message["route"])
+            for callback in list(self.route_callbacks):
+                try:
+                    callback(message["route"])
+                except Exception as e:
+                    logging.error(f"Error in route callback: {str(e)}")
+            return
+
+        with self.pending_lock:
+            future = self.pending.pop(message.get("tag"), None)
+        if future is not None:
+            future.set_result(message)
+
+    def request(self, action, **params):
+        if not self.is_connected:
+            return {"status": "error", "message": "Not connected"}
+
+        future = Future()
+        tag = next(self.tags)
+        params["action"] = action
+        params["tag"] = tag
+        with self.pending_lock:
+            self.pending[tag] = future
+        try:
+            with self.send_lock:
+                if self.codec is not None:
+                    self.sock.sendall(encode_frame(self.codec.encode(params)))
+                else:
+                    self.sock.sendall((json.dumps(params) + "\n").encode('utf-8'))
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            return {"status": "error", "message": "Request timed out"}
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+        finally:
+            with self.pending_lock:
+                self.pending.pop(tag, None)
+
+    def _apply(self, route):
+        with self.cache_lock:
+            cached = self.cache.get(route["channel_id"])
+            if cached and cached[0]["epoch"] > route["epoch"]:
+                return  # An older update overtaken by a newer one
+            self.cache[route["channel_id"]] = (route, time.monotonic() + self.ttl)
+
+    def lookup_many(self, channel_ids):
+        """channel_id -> route dict (host None when nobody hosts it)"""
+        routes = {}
+        misses = []
+        now = time.monotonic()
+        with self.cache_lock:
+            for channel_id in channel_ids:
+                cached = self.cache.get(channel_id)
+                if cached and cached[1] > now:
+                    routes[channel_id] = cached[0]
+                else:
+                    misses.append(channel_id)
+
+        if misses:
+            response = self.request("lookup", channel_ids=misses, watch=True)
+            if response.get("status") == "success":
+                self.watched.update(misses)
+                for route in response["routes"]:
+                    self._apply(route)
+                    routes[route["channel_id"]] = route
+        return routes
+
+    def lookup(self, channel_id):
+        """(host, port) of the channel's host, or None"""
+        route = self.lookup_many([channel_id]).get(channel_id)
+        if not route or not route.get("host"):
+            return None
+        return route["host"], route["port"]
+
+    def invalidate(self, channel_id):
+        with self.cache_lock:
+            self.cache.pop(channel_id, None)
+
+    def register(self, user_id, channel_ids, host, port):
+        channel_ids = list(channel_ids)
+        _, known = self.registrations.setdefault((host, port), (user_id, set()))
+        known.update(channel_ids)
+        if not channel_ids:
+            return {"status": "success", "routes": [], "rejected": []}
+
+        response = self.request("register", user_id=user_id, channel_ids=channel_ids, host=host, port=port)
+        for route in response.get("routes", []):
+            self._apply(route)
+        return response
+
+    def unregister(self, host, port, channel_ids=None):
+        registration = self.registrations.get((host, port))
+        if registration is None:
+            return
+        if channel_ids is None:
+            channel_ids = list(registration[1])
+            del self.registrations[(host, port)]
+        else:
+            registration[1].difference_update(channel_ids)
+        if channel_ids:
+            self.request("unregister", channel_ids=list(channel_ids))
+
+    def register_peer(self, user_id, host, port):
+        """Publish where user_id's RealtimeHandler listens"""
+        self.peer_registration = (user_id, host, port)
+        return self.request("register_peer", user_id=user_id, host=host, port=port)
+
+    def unregister_peer(self, user_id):
+        if self.peer_registration and self.peer_registration[0] == user_id:
+            self.peer_registration = None
+        return self.request("unregister_peer", user_id=user_id)
+
+    def lookup_peers(self, user_ids):
+        """user_id -> (host, port) of the given peers that are online"""
+        response = self.request("lookup_peers", user_ids=list(user_ids))
+        return {peer["user_id"]: (peer["host"], peer["port"]) for peer in response.get("peers", [])}
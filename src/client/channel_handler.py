@@ -3,8 +3,11 @@ from database.config import SessionLocal
 import logging
 
 class ChannelHandler:
-    def __init__(self, current_user_id):
+    def __init__(self, current_user_id, on_leave=None):
         self.current_user_id = current_user_id
+        # Called with the channel_id after a leave so the channel's host can
+        # drop us, e.g. ChannelHostClient.refresh_membership
+        self.on_leave = on_leave
     
     def create_channel(self, name, description, is_private=False, allow_visitors=True):
         db = SessionLocal()
@@ -99,6 +102,9 @@ class ChannelHandler:
             db.delete(membership)
             db.commit()
             
+            if self.on_leave:
+                self.on_leave(channel_id)
+            
             return True, "Left channel successfully"
             
         except Exception as e:
@@ -1,16 +1,170 @@
 import socket
+import selectors
 import threading
 import json
 import logging
 import time
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from sqlalchemy import func
 from src.client.system_logger import SystemLogger
 from src.database.config import SessionLocal
-from src.database.models import Channel, Message, User, ChannelMembership
+from src.database.models import Channel, Message, User, ChannelMembership, add_channel_message
+from src.common.framing import encode_frame, FrameReader, FrameError
+from src.common.columnar import pack_response
+from src.common.codec import JSON, CodecError, decode, negotiate
+from src.common import metrics, profiling
+from src.common.metrics_server import MetricsServer
+from src.client.membership_index import MembershipIndex
+from src.client.message_history import ChannelHistory, estimate_message_size
+from src.client.channel_cache import ChannelCache
+from src.client.host_snapshot import read_snapshot, write_snapshot
+from src.client.update_waiters import UpdateWaiter, UpdateWaiters
+from src.client.channel_replica import ChannelReplica
+from src.client.config import (MEMBERSHIP_NEGATIVE_TTL, MEMBERSHIP_POSITIVE_TTL,
+                               CHANNEL_HISTORY_CAPACITY,
+                               CHANNEL_HISTORY_MAX_BYTES, LONG_POLL_MAX_WAIT,
+                               CHANNEL_HOST_WORKERS, CHANNEL_HOST_MAX_OUTBUF,
+                               CHANNEL_PRELOAD_MODE, CHANNEL_PRELOAD_BATCH,
+                               CHANNEL_CACHE_MAX_ENTRIES, CHANNEL_CACHE_MAX_BYTES,
+                               CHANNEL_SNAPSHOT_DIR, CHANNEL_SNAPSHOT_INTERVAL,
+                               CHANNEL_SNAPSHOT_MAX_AGE, CHANNEL_REPLICA_ROLE,
+                               CHANNEL_HEARTBEAT_INTERVAL, CHANNEL_SYNC_MAX_MESSAGES,
+                               CHANNEL_STANDBY, CHANNEL_STANDBY_CHECK_INTERVAL,
+                               CHANNEL_WRITE_RETRIES, CHANNEL_DB_POLL_INTERVAL, CHANNEL_CODECS,
+                               CHANNEL_COMPRESS_THRESHOLD, CLIENT_HOST,
+                               METRICS_DUMP_INTERVAL, METRICS_HOST,
+                               CHANNEL_HOST_METRICS_PORT)
+
+
+RECEIVED_BYTES = metrics.counter("channel_host_received_bytes_total", "Request bytes read from clients")
+SENT_BYTES = metrics.counter("channel_host_sent_bytes_total", "Response and push bytes written to clients")
+DB_COMMIT_SECONDS = metrics.histogram("channel_host_db_commit_seconds", "Database commit time")
+
+# Columns serialize_message reads
+MESSAGE_COLUMNS = (
+    Message.id, Message.seq, Message.content, Message.sender_id, Message.created_at,
+    Message.has_media, Message.media_type, Message.media_path, Message.media_name
+)
+
+
+def serialize_message(msg):
+    return {
+        "id": msg.id,
+        "seq": msg.seq,
+        "content": msg.content,
+        "sender_id": msg.sender_id,
+        "created_at": msg.created_at.isoformat() if msg.created_at else None,
+        "has_media": msg.has_media,
+        "media_type": msg.media_type,
+        "media_path": msg.media_path,
+        "media_name": msg.media_name
+    }
+
+
+class HostSession:
+    """One client connection, driven by the host's event loop.
+
+    Any thread may queue a frame: bytes go out directly while the socket takes
+    them, the rest waits in outbuf until the loop sees the socket writable.
+    Pushes from all of the session's channels share one stream numbered by
+    push_seq, so the client can tell when it missed some. Frames are written
+    in the wire format (codec) agreed at handshake.
+    """
+
+    def __init__(self, sock, address, on_attention):
+        self.sock = sock
+        self.address = address
+        self.user_id = None  # set once the client authenticates
+        self.channels = set()
+        self.replica = False  # a standby host streaming our channels
+        self.reader = FrameReader()
+        self.outbuf = bytearray()
+        self.send_lock = threading.Lock()
+        self.serial = deque()  # untagged requests, answered in arrival order
+        self.serial_lock = threading.Lock()
+        self.closed = False
+        self.push_seq = 0
+        # Negotiated at handshake
+        self.codec = JSON
+        self.compress_threshold = None
+        self.columnar = False
+        self._on_attention = on_attention
+
+    def send(self, payload):
+        self.send_raw(encode_frame(payload, self.compress_threshold))
+
+    def send_raw(self, frame):
+        with self.send_lock:
+            queued = self._write(frame)
+        if queued:
+            self._on_attention(self)
+
+    def push(self, message, bodies=None):
+        """Send a push with the session's next sequence number spliced in.
+        bodies caches the message per codec, so a fan-out encodes it once per
+        wire format. Returns the encoded size."""
+        bodies = {} if bodies is None else bodies
+        metrics.counter("channel_host_pushes_total", "Pushes queued to sessions",
+                        type=str(message.get("type"))).inc()
+        body = bodies.get(self.codec.name)
+        if body is None:
+            body = bodies[self.codec.name] = self.codec.encode(message)
+        with self.send_lock:
+            # Numbered under the lock so the numbers go out in order
+            self.push_seq += 1
+            queued = self._write(encode_frame(self.codec.add_field(body, "seq", self.push_seq),
+                                              self.compress_threshold))
+        if queued:
+            self._on_attention(self)
+        return len(body)
+
+    def _write(self, frame):
+        """Send what the socket takes and queue the rest, True if anything was queued"""
+        if self.closed:
+            raise ConnectionError("Session is closed")
+        SENT_BYTES.inc(len(frame))
+        if not self.outbuf:
+            try:
+                sent = self.sock.send(frame)
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            if sent == len(frame):
+                return False
+            frame = frame[sent:]
+        if len(self.outbuf) + len(frame) > CHANNEL_HOST_MAX_OUTBUF:
+            raise ConnectionError(f"More than {CHANNEL_HOST_MAX_OUTBUF} bytes waiting to be sent")
+        self.outbuf += frame
+        return True
+
+    def flush(self):
+        """Write queued bytes, True once nothing is left"""
+        with self.send_lock:
+            while self.outbuf:
+                try:
+                    sent = self.sock.send(self.outbuf)
+                except (BlockingIOError, InterruptedError):
+                    return False
+                del self.outbuf[:sent]
+            return True
+
+    @property
+    def wants_write(self):
+        return bool(self.outbuf)
+
+    def close(self):
+        # The loop unregisters and closes the socket
+        with self.send_lock:
+            self.closed = True
+        self._on_attention(self)
+
 
 class ChannelHost: 
-    def __init__(self, user_id, base_port=8000):
+    def __init__(self, user_id, base_port=8000, preload=CHANNEL_PRELOAD_MODE, snapshot_path=None,
+                 directory=None, advertise_host=CLIENT_HOST, metrics_port=CHANNEL_HOST_METRICS_PORT,
+                 standby=CHANNEL_STANDBY):
 
         self.user_id = user_id
         self.base_port = base_port
@@ -21,9 +175,69 @@ class ChannelHost:
         self.hosted_channels = {}  # {channel_id: port}
         
         # Initialize logger
-        self.logger = SystemLogger(log_dir="logs/channel_hosts")
-        self.channel_data = {}
+        self.logger = SystemLogger.shared()
+        # Resident channels (info + history), least recently used evicted first
+        self.channel_data = ChannelCache(
+            CHANNEL_CACHE_MAX_ENTRIES,
+            CHANNEL_CACHE_MAX_BYTES,
+            sizeof=self.channel_entry_size,
+            on_evict=self.evict_channel
+        )
+        self.membership = MembershipIndex(MEMBERSHIP_NEGATIVE_TTL, MEMBERSHIP_POSITIVE_TTL)
+        # Channels whose members were reloaded; their subscribers are rechecked
+        self.stale_memberships = set()
+        self.membership.add_invalidation_listener(self.membership_invalidated)
+        
+        # Hosted channels are preloaded in bulk; "lazy" leaves each channel to
+        # its first request. ready is set once preloading has finished.
+        self.preload = preload
+        self.ready = threading.Event()
+        self.preloading = False
+        self.preload_backlog = {}  # channel_id -> messages recorded while preloading
+        self.hydrating = {}  # channel_id -> loaders and messages recorded while load_channel_data runs
+        self.channel_data_lock = threading.Lock()
+        self.write_locks = {}  # channel_id -> Lock held from insert until the push
+        
+        # Periodic snapshot of the caches for a warm restart
+        if snapshot_path is None:
+            snapshot_path = os.path.join(CHANNEL_SNAPSHOT_DIR, f"channel_host_{user_id}.json.gz")
+        self.snapshot_path = snapshot_path
+        self.stop_event = threading.Event()
+        
+        # Replication: standby hosts of our channels, and channels we stand by for
+        self.replicas = {}  # channel_id -> {session: (host, port)}
+        self.standby = {}  # channel_id -> ChannelReplica following its primary
+        self.follow_standby = standby  # look for primaries of channels we are replica of
+        
+        # Server-side routing directory (ChannelDirectory) that members look us up in
+        self.directory = directory
+        self.advertise_host = advertise_host
         self.network_logger = logging.getLogger('network.channel_host')
+        
+        # Push subscriptions: channel_id -> sessions that want its new messages
+        self.sessions = set()
+        self.subscribers = {}
+        self.subscribers_lock = threading.Lock()
+        
+        # Long-polling fetch_updates requests waiting for a new message.
+        # record_counts (guarded by channel_data_lock) lets a request park
+        # only if nothing was recorded since it looked for messages.
+        self.waiters = UpdateWaiters(self.expire_waiter)
+        self.record_counts = {}  # channel_id -> messages recorded
+        
+        # Event loop: one thread multiplexes every connection, database-bound
+        # requests run on a small worker pool
+        self.selector = None
+        self.wake_reader = None
+        self.wake_writer = None
+        self.loop_thread = None
+        self.executor = None
+        self.attention = set()  # sessions whose registration must be updated
+        self.attention_lock = threading.Lock()
+        
+        # Optional local /metrics endpoint (None = off)
+        self.metrics_port = metrics_port
+        self.metrics_server = None
     
     def find_available_port(self):
         """Find an available port starting from base_port"""
@@ -32,6 +246,8 @@ class ChannelHost:
             try:
                 # Try to bind to the port
                 test_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                # A restarted host gets its old port back, where standbys look for it
+                test_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
                 test_socket.bind(('localhost', port))
                 test_socket.close()
                 return port
@@ -58,13 +274,44 @@ class ChannelHost:
         # Start the server socket
         try:
             self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.server_socket.bind(('0.0.0.0', self.host_port))
-            self.server_socket.listen(5)
+            self.server_socket.listen(128)
+            self.server_socket.setblocking(False)
+            
+            self.selector = selectors.DefaultSelector()
+            self.wake_reader, self.wake_writer = socket.socketpair()
+            self.wake_reader.setblocking(False)
+            self.wake_writer.setblocking(False)
+            self.selector.register(self.server_socket, selectors.EVENT_READ)
+            self.selector.register(self.wake_reader, selectors.EVENT_READ)
+            self.executor = ThreadPoolExecutor(
+                max_workers=CHANNEL_HOST_WORKERS,
+                thread_name_prefix="channel-host"
+            )
             self.is_running = True
+            metrics.REGISTRY.start_dump(METRICS_DUMP_INTERVAL, self.network_logger)
+            self.register_gauges()
+            if self.metrics_port is not None:
+                try:
+                    self.metrics_server = MetricsServer(METRICS_HOST, self.metrics_port)
+                    self.metrics_server.start()
+                except OSError as e:
+                    self.network_logger.error(f"Could not serve metrics on port {self.metrics_port}: {str(e)}")
+                    self.metrics_server = None
             
             self.logger.log_connection("0.0.0.0", self.host_port, "start_hosting", "success")
-            threading.Thread(target=self.accept_connections, daemon=True).start()
+            self.waiters.start()
+            self.loop_thread = threading.Thread(target=self.run_loop, daemon=True)
+            self.loop_thread.start()
             self.load_hosted_channels()
+            self.advertise_channels(list(self.hosted_channels))
+            self.stop_event.clear()
+            threading.Thread(target=self.snapshot_loop, daemon=True).start()
+            threading.Thread(target=self.heartbeat_loop, daemon=True).start()
+            threading.Thread(target=self.external_writes_loop, daemon=True).start()
+            if self.follow_standby and self.directory is not None:
+                threading.Thread(target=self.standby_loop, daemon=True).start()
             
             return True
         except Exception as e:
@@ -73,6 +320,7 @@ class ChannelHost:
             return False
     
     def load_hosted_channels(self):
+        self.ready.clear()
         db = SessionLocal()
         try:
             channels = db.query(Channel).filter(Channel.owner_id == self.user_id).all()
@@ -88,16 +336,348 @@ class ChannelHost:
                     "load", 
                     "success"
                 )
-                
-                # Load channel data for synchronization
-                self.load_channel_data(channel.id)
+            
+            infos = {channel.id: self.channel_info(channel) for channel in channels}
         except Exception as e:
             self.network_logger.error(f"Error loading hosted channels: {str(e)}")
+            self.ready.set()
+            return
+        finally:
+            db.close()
+        
+        if self.restore_snapshot(infos):
+            # Warm restart, anything not in the snapshot hydrates on first use
+            self.ready.set()
+        elif self.preload == "lazy" or not infos:
+            # Each channel is hydrated by load_channel_data on first use
+            self.ready.set()
+        elif self.preload == "background":
+            self.preloading = True
+            threading.Thread(target=self.preload_channels, args=(infos,), daemon=True).start()
+        else:
+            self.preloading = True
+            self.preload_channels(infos)
+    
+    def wait_ready(self, timeout=None):
+        """Block until hosted channels are preloaded"""
+        return self.ready.wait(timeout)
+    
+    def channel_info(self, channel):
+        return {
+            "name": channel.name,
+            "is_private": channel.is_private,
+            "created_at": channel.created_at.isoformat() if channel.created_at else None,
+            "owner_id": channel.owner_id
+        }
+    
+    def preload_channels(self, infos):
+        """Load members and recent messages of many channels with a few
+        set-based queries instead of three queries per channel"""
+        started = time.monotonic()
+        channel_ids = list(infos)
+        message_count = 0
+        
+        db = SessionLocal()
+        try:
+            limit = self.channel_data.max_entries
+            if limit is not None and len(channel_ids) > limit:
+                # Only what fits in the cache; the rest hydrate on first use
+                channel_ids = self.most_active_channels(db, channel_ids, limit)
+            members = {channel_id: [] for channel_id in channel_ids}
+            histories = {channel_id: self.new_history() for channel_id in channel_ids}
+            
+            for offset in range(0, len(channel_ids), CHANNEL_PRELOAD_BATCH):
+                batch = channel_ids[offset:offset + CHANNEL_PRELOAD_BATCH]
+                
+                rows = db.query(
+                    ChannelMembership.channel_id,
+                    ChannelMembership.user_id,
+                    ChannelMembership.role
+                ).filter(ChannelMembership.channel_id.in_(batch)).all()
+                for channel_id, user_id, role in rows:
+                    members[channel_id].append((user_id, role))
+                
+                # Newest CHANNEL_HISTORY_CAPACITY messages of every channel in one
+                # pass; plain rows serialize like Message objects but skip the ORM
+                ranked = db.query(
+                    *MESSAGE_COLUMNS,
+                    Message.channel_id,
+                    func.row_number().over(
+                        partition_by=Message.channel_id,
+                        order_by=Message.id.desc()
+                    ).label("rank")
+                ).filter(Message.channel_id.in_(batch)).subquery()
+                messages = db.query(
+                    *(ranked.c[column.key] for column in MESSAGE_COLUMNS),
+                    ranked.c.channel_id
+                ).filter(
+                    ranked.c.rank <= CHANNEL_HISTORY_CAPACITY
+                ).order_by(ranked.c.channel_id, ranked.c.id).all()
+                
+                for message in messages:
+                    histories[message.channel_id].append(serialize_message(message))
+                message_count += len(messages)
+        except Exception as e:
+            self.network_logger.error(f"Error preloading hosted channels: {str(e)}")
+            # Whatever was not installed is loaded on first use
+            with self.channel_data_lock:
+                self.preloading = False
+                self.preload_backlog.clear()
+            self.ready.set()
+            return
+        finally:
+            db.close()
+        
+        with self.channel_data_lock:
+            for channel_id in channel_ids:
+                if not self.is_running:
+                    break
+                if channel_id in self.channel_data:
+                    continue  # Hydrated by a request while we were loading
+                
+                history = histories[channel_id]
+                history.complete = len(history) < CHANNEL_HISTORY_CAPACITY
+                # Messages committed after our query was answered
+                history.extend(self.preload_backlog.pop(channel_id, ()))
+                self.channel_data.put(channel_id, {
+                    "info": infos[channel_id],
+                    "history": history
+                })
+                if not self.membership.is_loaded(channel_id):
+                    self.membership.load_channel(
+                        channel_id,
+                        infos[channel_id]["owner_id"],
+                        members[channel_id]
+                    )
+            self.preloading = False
+            self.preload_backlog.clear()
+        
+        self.network_logger.info(
+            f"Preloaded {len(channel_ids)} channels, {message_count} messages "
+            f"in {time.monotonic() - started:.3f}s"
+        )
+        self.ready.set()
+    
+    def snapshot_loop(self):
+        while not self.stop_event.wait(CHANNEL_SNAPSHOT_INTERVAL):
+            if self.is_running:
+                self.save_snapshot()
+    
+    def save_snapshot(self):
+        """Write resident histories and membership. Each channel keeps the
+        seq its copied history ends at, a restart replays what came after;
+        the database's message high-water mark tells a restored database
+        that is behind the snapshot."""
+        if not self.snapshot_path:
+            return False
+        
+        db = SessionLocal()
+        try:
+            high_water = db.query(func.max(Message.id)).scalar() or 0
+        except Exception as e:
+            self.network_logger.error(f"Error reading message high-water mark: {str(e)}")
+            return False
+        finally:
+            db.close()
+        
+        channels = {}
+        with self.channel_data_lock:
+            # Least recently used first, restoring in this order keeps the LRU order
+            for channel_id in self.channel_data.keys():
+                entry = self.channel_data.peek(channel_id)
+                if entry is None:
+                    continue
+                history = entry["history"]
+                channels[channel_id] = {
+                    "messages": history.oldest_first(),
+                    # Committed but not yet recorded messages are replayed from here
+                    "last_seq": history.newest_seq or 0,
+                    "complete": history.complete,
+                    "evicted_id": history.evicted_id,
+                    "members": list(self.membership.members(channel_id).items())
+                        if self.membership.is_loaded(channel_id) else None
+                }
+        
+        return write_snapshot(self.snapshot_path, {
+            "host_id": self.user_id,
+            "high_water": high_water,
+            "channels": channels
+        })
+    
+    def restore_snapshot(self, infos):
+        """Load the last snapshot of still-owned channels and replay messages
+        committed since. False when there is no usable snapshot."""
+        snapshot = read_snapshot(self.snapshot_path, CHANNEL_SNAPSHOT_MAX_AGE)
+        if snapshot is None or snapshot.get("host_id") != self.user_id:
+            return False
+        
+        started = time.monotonic()
+        high_water = snapshot.get("high_water", 0)
+        restored = {}
+        replayed = 0
+        
+        db = SessionLocal()
+        try:
+            current = db.query(func.max(Message.id)).scalar() or 0
+            if current < high_water:
+                self.network_logger.warning(
+                    f"Database is behind the host snapshot ({current} < {high_water}), rebuilding"
+                )
+                return False
+            
+            last_seqs = {}
+            for key, data in snapshot.get("channels", {}).items():
+                channel_id = int(key)
+                if channel_id not in infos:
+                    continue  # Deleted or no longer ours
+                if "last_seq" not in data:
+                    return False  # Written before per-channel replay points
+                history = self.new_history()
+                history.restore(data["messages"], data["complete"], data["evicted_id"])
+                restored[channel_id] = (history, data["members"])
+                last_seqs[channel_id] = data["last_seq"]
+            
+            channel_ids = list(restored)
+            for offset in range(0, len(channel_ids), CHANNEL_PRELOAD_BATCH):
+                batch = channel_ids[offset:offset + CHANNEL_PRELOAD_BATCH]
+                rows = db.query(*MESSAGE_COLUMNS, Message.channel_id).filter(
+                    Message.channel_id.in_(batch),
+                    Message.seq > min(last_seqs[channel_id] for channel_id in batch)
+                ).order_by(Message.channel_id, Message.seq).all()
+                for row in rows:
+                    if row.seq > last_seqs[row.channel_id]:
+                        restored[row.channel_id][0].append(serialize_message(row))
+                        replayed += 1
+        except Exception as e:
+            self.network_logger.error(f"Error restoring host snapshot: {str(e)}")
+            return False
         finally:
             db.close()
+        
+        with self.channel_data_lock:
+            for channel_id, (history, members) in restored.items():
+                self.channel_data.put(channel_id, {
+                    "info": infos[channel_id],
+                    "history": history
+                })
+                if members is not None:
+                    self.membership.load_channel(channel_id, infos[channel_id]["owner_id"], members)
+        
+        self.network_logger.info(
+            f"Restored {len(restored)} channels from snapshot, replayed {replayed} messages "
+            f"in {time.monotonic() - started:.3f}s"
+        )
+        return True
+    
+    def most_active_channels(self, db, channel_ids, limit):
+        """The limit channels with the newest messages, least active first"""
+        latest = dict.fromkeys(channel_ids, 0)
+        for offset in range(0, len(channel_ids), CHANNEL_PRELOAD_BATCH):
+            batch = channel_ids[offset:offset + CHANNEL_PRELOAD_BATCH]
+            rows = db.query(Message.channel_id, func.max(Message.id)).filter(
+                Message.channel_id.in_(batch)
+            ).group_by(Message.channel_id).all()
+            latest.update(rows)
+        return sorted(channel_ids, key=latest.get)[-limit:]
     
+    def new_history(self):
+        return ChannelHistory(CHANNEL_HISTORY_CAPACITY, CHANNEL_HISTORY_MAX_BYTES)
+
+    def channel_entry_size(self, entry):
+        return entry["history"].size_bytes + estimate_message_size(entry["info"])
+
+    def evict_channel(self, channel_id, entry):
+        # Membership of a cold channel is re-read from the database on demand
+        self.membership.invalidate(channel_id)
+        self.network_logger.info(f"Evicted channel {channel_id} from the host cache")
+
+    def get_channel_entry(self, channel_id, fresh=True):
+        """Cached info and history of a hosted channel, loaded on a miss.
+        fresh first records messages written past the host (catch_up)."""
+        entry = self.channel_data.get(channel_id)
+        if entry is None:
+            self.load_channel_data(channel_id)
+            entry = self.channel_data.peek(channel_id)
+        elif fresh:
+            self.catch_up(channel_id, entry)
+        return entry
+
+    def external_writes_loop(self):
+        """Writes made past the host wake nobody, so channels somebody
+        listens to (subscribers, parked polls) look for them regularly"""
+        while not self.stop_event.wait(CHANNEL_DB_POLL_INTERVAL):
+            if self.is_running:
+                self.catch_up_listened_channels()
+                self.prune_subscribers()
+
+    def catch_up_listened_channels(self):
+        with self.subscribers_lock:
+            channel_ids = {channel_id for channel_id, sessions in self.subscribers.items() if sessions}
+        channel_ids |= self.waiters.channel_ids()
+        channel_ids = [channel_id for channel_id in channel_ids if channel_id in self.hosted_channels]
+        if not channel_ids:
+            return
+
+        db = SessionLocal()
+        try:
+            heads = {}
+            for offset in range(0, len(channel_ids), CHANNEL_PRELOAD_BATCH):
+                batch = channel_ids[offset:offset + CHANNEL_PRELOAD_BATCH]
+                heads.update(db.query(Message.channel_id, func.max(Message.seq)).filter(
+                    Message.channel_id.in_(batch)
+                ).group_by(Message.channel_id).all())
+        except Exception as e:
+            self.network_logger.error(f"Error reading channel heads: {str(e)}")
+            return
+        finally:
+            db.close()
+
+        for channel_id, head in heads.items():
+            entry = self.channel_data.peek(channel_id)
+            if entry is not None and head > (entry["history"].newest_seq or 0):
+                self.catch_up(channel_id, entry, head)
+
+    def catch_up(self, channel_id, entry, head=None):
+        """Record messages that reached the database without passing through
+        this host (members' own clients, MessageHandler, the server), so the
+        history, pushes and parked polls include them. head is the channel's
+        newest seq in the database if the caller already read it."""
+        if channel_id not in self.hosted_channels:
+            return  # Standbys get every message from their primary's stream
+        history = entry["history"]
+        db = SessionLocal()
+        try:
+            if head is None:
+                head = db.query(func.coalesce(func.max(Message.seq), 0)).filter(
+                    Message.channel_id == channel_id
+                ).scalar()
+            if head <= (history.newest_seq or 0):
+                return
+
+            with self.write_locks.setdefault(channel_id, threading.Lock()):
+                # Writes through this host may have recorded some meanwhile
+                rows = db.query(*MESSAGE_COLUMNS).filter(
+                    Message.channel_id == channel_id,
+                    Message.seq > (history.newest_seq or 0)
+                ).order_by(Message.seq).all()
+                for row in rows:
+                    self.record_message(channel_id, serialize_message(row))
+        except Exception as e:
+            self.network_logger.error(f"Error catching up channel {channel_id}: {str(e)}")
+        finally:
+            db.close()
+
+    def cache_stats(self):
+        return self.channel_data.stats()
+
     def load_channel_data(self, channel_id):
         """Load channel data from database for the specified channel"""
+        with self.channel_data_lock:
+            # Messages committed after our query are recorded here and merged
+            # before the history is installed, as preloading does
+            loading = self.hydrating.setdefault(channel_id, {"loaders": 0, "messages": []})
+            loading["loaders"] += 1
+        
         db = SessionLocal()
         try:
             # Get channel info
@@ -106,43 +686,34 @@ class ChannelHost:
                 self.network_logger.error(f"Channel {channel_id} not found")
                 return
             
-            # Get messages
+            # Get the most recent messages, enough to fill the history ring
             messages = db.query(Message).filter(
                 Message.channel_id == channel_id
-            ).order_by(Message.created_at.desc()).limit(100).all()
+            ).order_by(Message.id.desc()).limit(CHANNEL_HISTORY_CAPACITY).all()
+
+            history = self.new_history()
+            history.extend(serialize_message(msg) for msg in reversed(messages))
+            history.complete = len(messages) < CHANNEL_HISTORY_CAPACITY
             
             # Get members
             members = db.query(ChannelMembership).filter(
                 ChannelMembership.channel_id == channel_id
             ).all()
             
-            # Store data for synchronization
-            self.channel_data[channel_id] = {
-                "info": {
-                    "name": channel.name,
-                    "is_private": channel.is_private,
-                    "created_at": channel.created_at.isoformat() if channel.created_at else None,
-                    "owner_id": channel.owner_id
-                },
-                "messages": [
-                    {
-                        "id": msg.id,
-                        "content": msg.content,
-                        "sender_id": msg.sender_id,
-                        "created_at": msg.created_at.isoformat() if msg.created_at else None,
-                        "has_media": msg.has_media,
-                        "media_type": msg.media_type,
-                        "media_path": msg.media_path,
-                        "media_name": msg.media_name
-                    } for msg in messages
-                ],
-                "members": [
-                    {
-                        "user_id": member.user_id,
-                        "joined_at": member.joined_at.isoformat() if member.joined_at else None
-                    } for member in members
-                ]
-            }
+            # Store data for synchronization, unless a concurrent load won
+            with self.channel_data_lock:
+                if channel_id in self.channel_data:
+                    return
+                history.extend(loading["messages"])
+                self.channel_data.put(channel_id, {
+                    "info": self.channel_info(channel),
+                    "history": history
+                })
+                self.membership.load_channel(
+                    channel_id,
+                    channel.owner_id,
+                    [(member.user_id, member.role) for member in members]
+                )
             
             # Log success
             self.network_logger.info(f"Loaded data for channel {channel_id} ({channel.name})")
@@ -163,121 +734,317 @@ class ChannelHost:
             )
         finally:
             db.close()
+            with self.channel_data_lock:
+                loading["loaders"] -= 1
+                if not loading["loaders"]:
+                    self.hydrating.pop(channel_id, None)
     
-    def accept_connections(self):
+    def run_loop(self):
         while self.is_running:
             try:
-                client_socket, address = self.server_socket.accept()
-                
-                # Log connection
-                self.logger.log_connection(
-                    address[0], 
-                    address[1], 
-                    "accept", 
-                    "connected"
-                )
-                
-                # Start a thread to handle this client
-                threading.Thread(
-                    target=self.handle_client,
-                    args=(client_socket, address),
-                    daemon=True
-                ).start()
-                
+                events = self.selector.select()
             except Exception as e:
-                if self.is_running:  
-                    self.network_logger.error(f"Error accepting connection: {str(e)}")
+                if self.is_running:
+                    self.network_logger.error(f"Channel host event loop failed: {str(e)}")
+                break
+            profiling.checkpoint()
+            
+            for key, mask in events:
+                if key.fileobj is self.server_socket:
+                    self.accept_connections()
+                elif key.fileobj is self.wake_reader:
+                    self.handle_attention()
+                else:
+                    session = key.data
+                    if mask & selectors.EVENT_READ:
+                        self.read_session(session)
+                    if mask & selectors.EVENT_WRITE and not session.closed:
+                        self.write_session(session)
     
-    def handle_client(self, client_socket, address):
+    def wake_loop(self):
         try:
-            auth_data = client_socket.recv(1024)
-            auth_json = json.loads(auth_data.decode('utf-8'))
-            
-            if 'user_id' not in auth_json:
-                self.network_logger.warning(f"Client {address} did not provide user_id")
-                client_socket.close()
+            self.wake_writer.send(b'\0')
+        except (BlockingIOError, InterruptedError):
+            pass  # A wakeup is already pending
+        except Exception:
+            pass
+    
+    def request_attention(self, session):
+        """Called from any thread when a session has queued output or was closed"""
+        with self.attention_lock:
+            self.attention.add(session)
+        self.wake_loop()
+    
+    def handle_attention(self):
+        try:
+            while self.wake_reader.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        
+        with self.attention_lock:
+            sessions, self.attention = self.attention, set()
+        
+        for session in sessions:
+            if session.closed:
+                self.close_session(session)
+                continue
+            events = selectors.EVENT_READ
+            if session.wants_write:
+                events |= selectors.EVENT_WRITE
+            try:
+                self.selector.modify(session.sock, events, session)
+            except (KeyError, ValueError):
+                pass  # Already unregistered
+    
+    def accept_connections(self):
+        while True:
+            try:
+                client_socket, address = self.server_socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except Exception as e:
+                if self.is_running:
+                    self.network_logger.error(f"Error accepting connection: {str(e)}")
                 return
             
-            user_id = auth_json['user_id']
-            self.client_connections[user_id] = (address[0], address[1])
+            try:
+                client_socket.setblocking(False)
+                client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                session = HostSession(client_socket, address, self.request_attention)
+                self.selector.register(client_socket, selectors.EVENT_READ, session)
+            except Exception as e:
+                self.network_logger.error(f"Error registering connection from {address}: {str(e)}")
+                client_socket.close()
+                continue
             
-            # Log successful authentication
+            # Log connection
             self.logger.log_connection(
                 address[0], 
                 address[1], 
-                "authenticate", 
-                f"success - User ID: {user_id}"
-            )
-            
-            # Send acknowledgment
-            response = {
-                "status": "authenticated",
-                "host_id": self.user_id,
-                "timestamp": datetime.now().isoformat()
-            }
-            client_socket.send(json.dumps(response).encode('utf-8'))
-            
-            # Handle client requests
-            while self.is_running:
-                try:
-                    client_socket.settimeout(1.0)
-                    data = client_socket.recv(8192)
-                    
-                    if not data:
-                        break
-                    
-                    # Log data reception
-                    self.logger.log_data_transaction(
-                        "receive",
-                        address[0],
-                        address[1],
-                        "request",
-                        len(data)
-                    )
-                    
-                    # Process the request
-                    request = json.loads(data.decode('utf-8'))
-                    response = self.process_client_request(request, user_id)
-                    
-                    # Send response
-                    response_data = json.dumps(response).encode('utf-8')
-                    client_socket.send(response_data)
-                    
-                    # Log response
-                    self.logger.log_data_transaction(
-                        "send",
-                        address[0],
-                        address[1],
-                        "response",
-                        len(response_data)
-                    )
-                    
-                except socket.timeout:
-                    continue
-                except json.JSONDecodeError:
-                    self.network_logger.warning(f"Received invalid JSON from {address}")
-                    continue
-                except Exception as e:
-                    self.network_logger.error(f"Error handling client {address}: {str(e)}")
-                    break
-            
-            if user_id in self.client_connections:
-                del self.client_connections[user_id]
-            
-            # Log disconnection
-            self.logger.log_connection(
-                address[0],
-                address[1],
-                "disconnect",
-                f"user_id: {user_id}"
+                "accept", 
+                "connected"
             )
-            
+    
+    def read_session(self, session):
+        try:
+            data = session.sock.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
         except Exception as e:
-            self.network_logger.error(f"Error in client handler for {address}: {str(e)}")
-        finally:
-            client_socket.close()
+            self.network_logger.warning(f"Error reading from client {session.address}: {str(e)}")
+            data = b''
+        
+        if not data:
+            self.close_session(session)
+            return
+        
+        try:
+            frames = session.reader.feed(data)
+        except FrameError as e:
+            self.network_logger.warning(f"Dropping client {session.address}: {str(e)}")
+            self.close_session(session)
+            return
+        
+        for frame in frames:
+            if session.closed:
+                return
+            if session.user_id is None:
+                self.authenticate(session, frame)
+            else:
+                self.dispatch_request(session, frame)
+    
+    def write_session(self, session):
+        try:
+            done = session.flush()
+        except Exception as e:
+            self.network_logger.warning(f"Dropping client {session.address}: {str(e)}")
+            self.close_session(session)
+            return
+        
+        if done:
+            try:
+                self.selector.modify(session.sock, selectors.EVENT_READ, session)
+            except (KeyError, ValueError):
+                pass
+    
+    def authenticate(self, session, data):
+        address = session.address
+        try:
+            auth_json = decode(data)
+        except (CodecError, ValueError):
+            auth_json = {}
+        
+        if 'user_id' not in auth_json:
+            self.network_logger.warning(f"Client {address} did not provide user_id")
+            self.close_session(session)
+            return
+        
+        user_id = auth_json['user_id']
+        session.user_id = user_id
+        self.client_connections[user_id] = (address[0], address[1])
+        self.sessions.add(session)
+        
+        # Log successful authentication
+        self.logger.log_connection(
+            address[0], 
+            address[1], 
+            "authenticate", 
+            f"success - User ID: {user_id}"
+        )
+        
+        # Wire options both sides support
+        session.codec = negotiate(auth_json.get('formats'))
+        codecs = [codec for codec in auth_json.get('codecs', []) if codec in CHANNEL_CODECS]
+        if "zlib" in codecs:
+            session.compress_threshold = CHANNEL_COMPRESS_THRESHOLD
+        session.columnar = "columnar" in codecs
+
+        # Send acknowledgment
+        response = {
+            "status": "authenticated",
+            "host_id": self.user_id,
+            "codecs": codecs,
+            "format": session.codec.name,
+            "timestamp": datetime.now().isoformat()
+        }
+        if auth_json.get('channel_ids'):
+            # Subscribing touches the database, keep it off the loop thread
+            self.executor.submit(self.finish_handshake, session, response, auth_json['channel_ids'])
+            return
+        self.send_to_session(session, response)
+
+    def finish_handshake(self, session, response, channel_ids):
+        """Subscribe the channels named in the handshake, then acknowledge it"""
+        try:
+            subscription = self.handle_subscribe({"channel_ids": channel_ids}, session.user_id, session)
+        except Exception as e:
+            self.network_logger.error(f"Error subscribing {session.address} at handshake: {str(e)}")
+            subscription = {"subscribed": [], "rejected": list(channel_ids)}
+        response["subscribed"] = subscription.get("subscribed", [])
+        response["rejected"] = subscription.get("rejected", list(channel_ids))
+        self.send_to_session(session, response)
+    
+    def dispatch_request(self, session, data):
+        address = session.address
+        RECEIVED_BYTES.inc(len(data))
+        
+        # Log data reception
+        self.logger.log_data_transaction(
+            "receive",
+            address[0],
+            address[1],
+            "request",
+            len(data)
+        )
+        
+        try:
+            request = decode(data)
+        except (CodecError, ValueError):
+            self.network_logger.warning(f"Received an undecodable request from {address}")
+            return
+        
+        if 'tag' in request:
+            # Tagged requests run concurrently and may be answered out of order
+            self.executor.submit(self.run_request, session, request)
+            return
+        
+        # Untagged requests keep the one-at-a-time ordering clients rely on
+        with session.serial_lock:
+            session.serial.append(request)
+            if len(session.serial) > 1:
+                return
+        self.executor.submit(self.run_serial_requests, session)
+    
+    def run_serial_requests(self, session):
+        while True:
+            with session.serial_lock:
+                request = session.serial[0]
+            self.run_request(session, request)
+            with session.serial_lock:
+                session.serial.popleft()
+                if not session.serial:
+                    return
+    
+    def run_request(self, session, request):
+        if session.closed:
+            return
+        profiling.checkpoint()
+        started = time.monotonic()
+        try:
+            response = self.process_client_request(request, session.user_id, session)
+        except Exception as e:
+            self.network_logger.error(f"Error handling request from {session.address}: {str(e)}")
+            response = {"status": "error", "message": str(e)}
+        
+        elapsed = time.monotonic() - started
+        action = str(request.get('action'))
+        if response is not None and str(response.get('message', '')).startswith("Unknown action"):
+            action = "unknown"  # keep client-chosen strings out of the label set
+        metrics.histogram("channel_host_request_seconds", "Channel host request handling time",
+                          action=action).record(elapsed)
+        metrics.counter("channel_host_requests_total", "Channel host requests handled", action=action,
+                        status="parked" if response is None else str(response.get('status'))).inc()
+        
+        if response is None:
+            # Long-poll: answered later from record_message or on timeout
+            return
+        self.respond(session, request, response, elapsed)
+    
+    def respond(self, session, request, response, latency=None):
+        """Send a response, echoing the request's tag so pipelined clients can match it"""
+        if 'tag' in request:
+            response['tag'] = request['tag']
+        self.send_to_session(session, response, latency)
+    
+    def close_session(self, session):
+        """Unregister and close a connection, event loop thread only"""
+        try:
+            self.selector.unregister(session.sock)
+        except (KeyError, ValueError):
+            pass
+        with session.send_lock:
+            session.closed = True
+        try:
+            session.sock.close()
+        except Exception:
+            pass
+        
+        user_id = session.user_id
+        if user_id is None:
+            return
+        
+        self.drop_session(session)
+        address = session.address
+        if self.client_connections.get(user_id) == (address[0], address[1]):
+            del self.client_connections[user_id]
+        
+        # Log disconnection
+        self.logger.log_connection(
+            address[0],
+            address[1],
+            "disconnect",
+            f"user_id: {user_id}"
+        )
+    
+    def drop_session(self, session):
+        self.sessions.discard(session)
+        self.waiters.cancel_session(session)
+        with self.subscribers_lock:
+            for channel_id in session.channels:
+                subscribers = self.subscribers.get(channel_id)
+                if subscribers:
+                    subscribers.discard(session)
+                    if not subscribers:
+                        del self.subscribers[channel_id]
+                replicas = self.replicas.get(channel_id)
+                if replicas:
+                    replicas.pop(session, None)
+                    if not replicas:
+                        del self.replicas[channel_id]
+            session.channels.clear()
     
-    def process_client_request(self, request, user_id):
+    def process_client_request(self, request, user_id, session=None):
         if 'action' not in request:
             return {"status": "error", "message": "Missing action parameter"}
         
@@ -288,46 +1055,106 @@ class ChannelHost:
             return self.handle_get_channel_info(request, user_id)
         elif action == "get_channel_messages":
             return self.handle_get_channel_messages(request, user_id)
+        elif action == "get_channel_messages_batch":
+            return self.handle_get_channel_messages_batch(request, user_id)
         elif action == "send_message":
             return self.handle_send_message(request, user_id)
         elif action == "fetch_updates":
-            return self.handle_fetch_updates(request, user_id)
+            return self.handle_fetch_updates(request, user_id, session)
+        elif action == "sync":
+            return self.handle_sync(request, user_id)
+        elif action == "subscribe":
+            return self.handle_subscribe(request, user_id, session)
+        elif action == "unsubscribe":
+            return self.handle_unsubscribe(request, user_id, session)
+        elif action == "replicate":
+            return self.handle_replicate(request, user_id, session)
+        elif action == "refresh_membership":
+            return self.handle_refresh_membership(request, user_id)
+        elif action == "ping":
+            return {"status": "success", "host_id": self.user_id}
         else:
             return {"status": "error", "message": f"Unknown action: {action}"}
     
+    def handle_subscribe(self, request, user_id, session):
+        if session is None:
+            return {"status": "error", "message": "Subscriptions need a persistent connection"}
+        channel_ids = request.get('channel_ids')
+        if channel_ids is None and 'channel_id' in request:
+            channel_ids = [request['channel_id']]
+        if not channel_ids:
+            return {"status": "error", "message": "Missing channel_ids parameter"}
+        
+        subscribed = []
+        rejected = []
+        for channel_id in channel_ids:
+            if not self.serves_channel(channel_id) or not self.is_channel_member(channel_id, user_id):
+                rejected.append(channel_id)
+                continue
+            
+            with self.subscribers_lock:
+                self.subscribers.setdefault(channel_id, set()).add(session)
+                session.channels.add(channel_id)
+            
+            # Lets the client detect messages it missed before subscribing
+            entry = self.get_channel_entry(channel_id)
+            subscribed.append({
+                "channel_id": channel_id,
+                "last_message_id": entry["history"].newest_id if entry else None,
+                "last_seq": self.head_seq(channel_id, entry),
+                "standby": self.standby_address(channel_id)
+            })
+        
+        return {
+            "status": "success",
+            "subscribed": subscribed,
+            "rejected": rejected
+        }
+    
+    def handle_unsubscribe(self, request, user_id, session):
+        if session is None:
+            return {"status": "error", "message": "Subscriptions need a persistent connection"}
+        channel_ids = request.get('channel_ids')
+        if channel_ids is None and 'channel_id' in request:
+            channel_ids = [request['channel_id']]
+        
+        with self.subscribers_lock:
+            for channel_id in channel_ids or list(session.channels):
+                session.channels.discard(channel_id)
+                subscribers = self.subscribers.get(channel_id)
+                if subscribers:
+                    subscribers.discard(session)
+                    if not subscribers:
+                        del self.subscribers[channel_id]
+        
+        return {"status": "success"}
+    
     def handle_get_channel_info(self, request, user_id):
         if 'channel_id' not in request:
             return {"status": "error", "message": "Missing channel_id parameter"}
         
         channel_id = request['channel_id']
-        if channel_id not in self.hosted_channels:
+        if not self.serves_channel(channel_id):
             return {"status": "error", "message": "Channel not hosted on this server"}
 
         if not self.is_channel_member(channel_id, user_id):
             return {"status": "error", "message": "User is not a member of this channel"}
 
-        if channel_id in self.channel_data:
-            return {
-                "status": "success",
-                "channel_info": self.channel_data[channel_id]["info"]
-            }
-        else:
-            # If not in cache, try to load 
-            self.load_channel_data(channel_id)
-            if channel_id in self.channel_data:
-                return {
-                    "status": "success",
-                    "channel_info": self.channel_data[channel_id]["info"]
-                }
-            else:
-                return {"status": "error", "message": "Failed to load channel data"}
+        entry = self.get_channel_entry(channel_id)
+        if entry is None:
+            return {"status": "error", "message": "Failed to load channel data"}
+
+        return {
+            "status": "success",
+            "channel_info": entry["info"]
+        }
     
     def handle_get_channel_messages(self, request, user_id):
         if 'channel_id' not in request:
             return {"status": "error", "message": "Missing channel_id parameter"}
         
         channel_id = request['channel_id']
-        if channel_id not in self.hosted_channels:
+        if not self.serves_channel(channel_id):
             return {"status": "error", "message": "Channel not hosted on this server"}
         
         # Check if user is a member
@@ -339,148 +1166,164 @@ class ChannelHost:
         before_id = request.get('before_id', None)
         
         # Return channel messages from cached data
-        if channel_id in self.channel_data:
-            messages = self.channel_data[channel_id]["messages"]
-            
-            if before_id:
-                try:
-                    before_index = next(i for i, msg in enumerate(messages) if msg["id"] == before_id)
-                    messages = messages[before_index + 1:]
-                except (StopIteration, IndexError):
-                    pass
-            
-            # Limit the number of messages
-            messages = messages[:limit]
-            
-            return {
-                "status": "success",
-                "messages": messages
-            }
+        entry = self.get_channel_entry(channel_id)
+        if entry is None:
+            return {"status": "error", "message": "Failed to load channel data"}
+
+        history = entry["history"]
+        if before_id:
+            messages = history.before(before_id, limit)
         else:
-            self.load_channel_data(channel_id)
-            if channel_id in self.channel_data:
-                messages = self.channel_data[channel_id]["messages"][:limit]
-                return {
-                    "status": "success",
-                    "messages": messages
-                }
-            else:
-                return {"status": "error", "message": "Failed to load channel data"}
-    
-def handle_send_message(self, request, user_id):
-    if 'channel_id' not in request:
-        return {"status": "error", "message": "Missing channel_id parameter"}
-    if 'content' not in request and not request.get('has_media', False):
-        return {"status": "error", "message": "Message must have content or media"}
+            messages = history.latest(limit)
+
+        return {
+            "status": "success",
+            "messages": messages
+        }
+
+    def handle_get_channel_messages_batch(self, request, user_id):
+        """get_channel_messages for several channels in one round trip; each
+        entry of channels carries channel_id and optionally limit/before_id"""
+        channels = request.get('channels')
+        if not isinstance(channels, list) or not channels:
+            return {"status": "error", "message": "Missing channels parameter"}
+
+        results = []
+        for item in channels:
+            if not isinstance(item, dict):
+                item = {"channel_id": item}
+            item.setdefault('limit', request.get('limit', 50))
+            result = self.handle_get_channel_messages(item, user_id)
+            result["channel_id"] = item.get('channel_id')
+            results.append(result)
+
+        return {
+            "status": "success",
+            "results": results
+        }
 
-    channel_id = request['channel_id']
+    def handle_send_message(self, request, user_id):
+        if 'channel_id' not in request:
+            return {"status": "error", "message": "Missing channel_id parameter"}
+        if 'content' not in request and not request.get('has_media', False):
+            return {"status": "error", "message": "Message must have content or media"}
 
-    if channel_id not in self.hosted_channels:
-        return {"status": "error", "message": "Channel not hosted on this server"}
+        channel_id = request['channel_id']
 
-    if not self.is_channel_member(channel_id, user_id):
-        return {"status": "error", "message": "User is not a member of this channel"}
+        if channel_id not in self.hosted_channels:
+            replica = self.standby.get(channel_id)
+            if replica is None:
+                return {"status": "error", "message": "Channel not hosted on this server"}
+            if replica.confirm_primary():
+                return {
+                    "status": "error",
+                    "message": "Not the primary host of this channel",
+                    "redirect": [replica.primary_host, replica.primary_port]
+                }
+            # The primary is gone, writes make us take over right away
+            replica.promote()
+
+        if not self.is_channel_member(channel_id, user_id):
+            return {"status": "error", "message": "User is not a member of this channel"}
 
-    db = SessionLocal()
-    try:
         content = request.get('content', '')
-        has_media = request.get('has_media', False)
-        media_type = request.get('media_type', None)
         media_path = request.get('media_path', None)
-        media_name = request.get('media_name', None)
-
-        new_message = Message(
-            content=content,
-            sender_id=user_id,
-            channel_id=channel_id,
-            has_media=has_media,
-            media_type=media_type,
-            media_path=media_path,
-            media_name=media_name
-        )
-        db.add(new_message)
-        db.commit()
-
-        db.refresh(new_message)
-
-        message_dict = {
-            "id": new_message.id,
-            "content": new_message.content,
-            "sender_id": new_message.sender_id,
-            "created_at": new_message.created_at.isoformat() if new_message.created_at else None,
-            "has_media": new_message.has_media,
-            "media_type": new_message.media_type,
-            "media_path": new_message.media_path,
-            "media_name": new_message.media_name
-        }
+        try:
+            message = self.write_message(
+                channel_id,
+                user_id,
+                content=content,
+                has_media=request.get('has_media', False),
+                media_type=request.get('media_type', None),
+                media_path=media_path,
+                media_name=request.get('media_name', None)
+            )
 
-        if channel_id in self.channel_data:
-            self.channel_data[channel_id]["messages"].insert(0, message_dict)
-            if len(self.channel_data[channel_id]["messages"]) > 200:
-                self.channel_data[channel_id]["messages"] = self.channel_data[channel_id]["messages"][:100]
+            self.logger.log_data_transaction(
+                "message",
+                "localhost", 
+                self.host_port,
+                "channel_message",
+                len(content) + (len(media_path) if media_path else 0)
+            )
 
-        self.logger.log_data_transaction(
-            "message",
-            "localhost", 
-            self.host_port,
-            "channel_message",
-            len(content) + (len(media_path) if media_path else 0)
-        )
+            return {
+                "status": "success",
+                "message_id": message["id"],
+                "seq": message["seq"],
+                "timestamp": message["created_at"]
+            }
 
-        self.notify_channel_members(channel_id, {
-            "type": "new_message",
-            "channel_id": channel_id,
-            "message": message_dict
-        }, exclude_user_ids=[user_id])
+        except Exception as e:
+            self.network_logger.error(f"Error sending message to channel {channel_id}: {str(e)}")
+            return {"status": "error", "message": f"Failed to send message: {str(e)}"}
 
-        return {
-            "status": "success",
-            "message_id": new_message.id,
-            "timestamp": new_message.created_at.isoformat() if new_message.created_at else None
-        }
+    def write_message(self, channel_id, user_id, **fields):
+        """Insert a message into a channel hosted here and push it to the
+        channel's subscribers but its sender; returns the serialized message"""
+        db = SessionLocal()
+        try:
+            # One write per channel at a time, so pushes go out in seq order
+            with self.write_locks.setdefault(channel_id, threading.Lock()):
+                new_message = add_channel_message(
+                    db,
+                    attempts=CHANNEL_WRITE_RETRIES,
+                    commit=self.commit,
+                    sender_id=user_id,
+                    channel_id=channel_id,
+                    **fields
+                )
+                db.refresh(new_message)
+                message_dict = serialize_message(new_message)
+                self.record_message(channel_id, message_dict, exclude_user_ids=[user_id])
+            return message_dict
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
 
-    except Exception as e:
-        db.rollback()
-        self.network_logger.error(f"Error sending message to channel {channel_id}: {str(e)}")
-        return {"status": "error", "message": f"Failed to send message: {str(e)}"}
-    finally:
-        db.close()
-
-
-def handle_fetch_updates(self, request, user_id):
-    if 'channel_id' not in request:
-        return {"status": "error", "message": "Missing channel_id parameter"}
-    if 'last_message_id' not in request:
-        return {"status": "error", "message": "Missing last_message_id parameter"}
-
-    channel_id = request['channel_id']
-    last_message_id = request['last_message_id']
-
-    if channel_id not in self.hosted_channels:
-        return {"status": "error", "message": "Channel not hosted on this server"}
-
-    if not self.is_channel_member(channel_id, user_id):
-        return {"status": "error", "message": "User is not a member of this channel"}
-
-    db = SessionLocal()
-    try:
-        messages = db.query(Message).filter(
-            Message.channel_id == channel_id,
-            Message.id > last_message_id
-        ).order_by(Message.created_at).all()
-
-        message_dicts = [
-            {
-                "id": msg.id,
-                "content": msg.content,
-                "sender_id": msg.sender_id,
-                "created_at": msg.created_at.isoformat() if msg.created_at else None,
-                "has_media": msg.has_media,
-                "media_type": msg.media_type,
-                "media_path": msg.media_path,
-                "media_name": msg.media_name
-            } for msg in messages
-        ]
+
+    def handle_fetch_updates(self, request, user_id, session=None):
+        if 'channel_id' not in request:
+            return {"status": "error", "message": "Missing channel_id parameter"}
+        if 'last_message_id' not in request:
+            return {"status": "error", "message": "Missing last_message_id parameter"}
+
+        channel_id = request['channel_id']
+        last_message_id = request['last_message_id']
+        wait = min(float(request.get('wait', 0) or 0), LONG_POLL_MAX_WAIT)
+        stream = bool(request.get('stream', False))
+
+        if not self.serves_channel(channel_id):
+            return {"status": "error", "message": "Channel not hosted on this server"}
+
+        if not self.is_channel_member(channel_id, user_id):
+            return {"status": "error", "message": "User is not a member of this channel"}
+
+        can_park = session is not None and wait > 0
+        deadline = time.monotonic() + wait
+        while True:
+            with self.channel_data_lock:
+                recorded = self.record_counts.get(channel_id, 0)
+            message_dicts = self.messages_since(channel_id, last_message_id)
+            if message_dicts is None:
+                return {"status": "error", "message": "Failed to fetch updates"}
+            if not can_park or not (stream or not message_dicts):
+                parked = False
+                break
+
+            # Park the request; record_message or the deadline answers it.
+            # A message recorded since we looked would not wake it, so look again.
+            with self.channel_data_lock:
+                if self.record_counts.get(channel_id, 0) == recorded:
+                    self.waiters.park(UpdateWaiter(
+                        session, user_id, request, channel_id,
+                        message_dicts[-1]["id"] if message_dicts else last_message_id,
+                        deadline, stream
+                    ))
+                    parked = True
+                    break
 
         self.logger.log_data_transaction(
             "fetch",
@@ -490,154 +1333,735 @@ def handle_fetch_updates(self, request, user_id):
             len(message_dicts)
         )
 
+        if parked:
+            if not stream:
+                return None
+
+            return {
+                "status": "success",
+                "channel_id": channel_id,
+                "new_messages": message_dicts,
+                "streaming": True
+            }
+
         return {
             "status": "success",
             "channel_id": channel_id,
             "new_messages": message_dicts
         }
 
-    except Exception as e:
-        self.network_logger.error(f"Error fetching updates for channel {channel_id}: {str(e)}")
-        return {"status": "error", "message": f"Failed to fetch updates: {str(e)}"}
-    finally:
-        db.close()
+    def handle_sync(self, request, user_id):
+        """Exactly the messages each channel gained after the client's last
+        seq, oldest first. A channel with more than fits in one response is
+        marked "more" and the client asks again from where it got to."""
+        channels = request.get('channels')
+        if not isinstance(channels, list) or not channels:
+            return {"status": "error", "message": "Missing channels parameter"}
+        limit = min(int(request.get('limit', CHANNEL_SYNC_MAX_MESSAGES)), CHANNEL_SYNC_MAX_MESSAGES)
 
+        results = []
+        for item in channels:
+            channel_id = item.get('channel_id')
+            last_seq = item.get('last_seq') or 0
+            if not self.serves_channel(channel_id):
+                results.append({"channel_id": channel_id, "status": "error",
+                                "message": "Channel not hosted on this server"})
+                continue
+            if not self.is_channel_member(channel_id, user_id):
+                results.append({"channel_id": channel_id, "status": "error",
+                                "message": "User is not a member of this channel"})
+                continue
 
-def is_channel_member(self, channel_id, user_id):
-    if channel_id in self.channel_data:
-        channel_info = self.channel_data[channel_id]["info"]
-        if channel_info["owner_id"] == user_id:
-            return True
-        for member in self.channel_data[channel_id]["members"]:
-            if member["user_id"] == user_id:
-                return True
-        return False
-
-    db = SessionLocal()
-    try:
-        channel = db.query(Channel).get(channel_id)
-        if channel and channel.owner_id == user_id:
-            return True
+            messages = self.messages_after_seq(channel_id, last_seq, limit + 1)
+            if messages is None:
+                results.append({"channel_id": channel_id, "status": "error",
+                                "message": "Failed to fetch updates"})
+                continue
+            results.append({
+                "channel_id": channel_id,
+                "status": "success",
+                "messages": messages[:limit],
+                "more": len(messages) > limit,
+                "head_seq": self.head_seq(channel_id)
+            })
 
-        membership = db.query(ChannelMembership).filter(
-            ChannelMembership.channel_id == channel_id,
-            ChannelMembership.user_id == user_id
-        ).first()
+        return {
+            "status": "success",
+            "results": results
+        }
 
-        return membership is not None
-    except Exception as e:
-        self.network_logger.error(f"Error checking channel membership: {str(e)}")
-        return False
-    finally:
-        db.close()
+    def messages_after_seq(self, channel_id, last_seq, limit):
+        """Up to limit messages with seq > last_seq, oldest first"""
+        entry = self.get_channel_entry(channel_id)
+        if entry and entry["history"].covers_after_seq(last_seq):
+            return entry["history"].since_seq(last_seq, limit)
 
+        db = SessionLocal()
+        try:
+            rows = db.query(*MESSAGE_COLUMNS).filter(
+                Message.channel_id == channel_id,
+                Message.seq > last_seq
+            ).order_by(Message.seq).limit(limit).all()
+
+            return [serialize_message(row) for row in rows]
 
-def notify_channel_members(self, channel_id, data, exclude_user_ids=None):
-    pass
+        except Exception as e:
+            self.network_logger.error(f"Error syncing channel {channel_id}: {str(e)}")
+            return None
+        finally:
+            db.close()
 
+    def head_seq(self, channel_id, entry=None):
+        """Seq of the channel's newest message, 0 for an empty channel"""
+        entry = entry or self.channel_data.peek(channel_id)
+        if entry is not None and (entry["history"].newest_seq or entry["history"].complete):
+            return entry["history"].newest_seq or 0
 
-def create_channel(self, name, is_private=False):
-    db = SessionLocal()
-    try:
-        new_channel = Channel(
-            name=name,
-            owner_id=self.user_id,
-            is_private=is_private
-        )
-        db.add(new_channel)
-        db.commit()
+        db = SessionLocal()
+        try:
+            return db.query(func.coalesce(func.max(Message.seq), 0)).filter(
+                Message.channel_id == channel_id
+            ).scalar()
+        except Exception as e:
+            self.network_logger.error(f"Error reading head of channel {channel_id}: {str(e)}")
+            return None
+        finally:
+            db.close()
+
+    def messages_since(self, channel_id, last_message_id, fresh=True):
+        """Messages newer than last_message_id, oldest first, from the history
+        ring when it reaches back far enough and from the database otherwise"""
+        entry = self.get_channel_entry(channel_id, fresh)
+        if entry and entry["history"].covers_after(last_message_id):
+            return entry["history"].since(last_message_id)
+
+        db = SessionLocal()
+        try:
+            messages = db.query(Message).filter(
+                Message.channel_id == channel_id,
+                Message.id > last_message_id
+            ).order_by(Message.id).all()
 
-        db.refresh(new_channel)
+            return [serialize_message(msg) for msg in messages]
 
-        membership = ChannelMembership(
-            channel_id=new_channel.id,
-            user_id=self.user_id
+        except Exception as e:
+            self.network_logger.error(f"Error fetching updates for channel {channel_id}: {str(e)}")
+            return None
+        finally:
+            db.close()
+
+    def answer_waiter(self, waiter):
+        # Called from record_message, possibly under the channel's write lock
+        messages = self.messages_since(waiter.channel_id, waiter.last_message_id, fresh=False)
+        if not messages:
+            # wake() took a one-shot waiter out, wait on for the next message
+            if not waiter.stream:
+                self.waiters.park(waiter)
+            return
+        waiter.last_message_id = messages[-1]["id"]
+
+        if waiter.stream:
+            response = {
+                "type": "stream_update",
+                "channel_id": waiter.channel_id,
+                "new_messages": messages
+            }
+        else:
+            response = {
+                "status": "success",
+                "channel_id": waiter.channel_id,
+                "new_messages": messages
+            }
+        self.respond(waiter.session, waiter.request, response)
+
+    def expire_waiter(self, waiter):
+        # A write made past the host since the last look would otherwise be
+        # answered as "no updates"
+        messages = self.messages_since(waiter.channel_id, waiter.last_message_id)
+        if messages:
+            waiter.last_message_id = messages[-1]["id"]
+            if waiter.stream:
+                self.respond(waiter.session, waiter.request, {
+                    "type": "stream_update",
+                    "channel_id": waiter.channel_id,
+                    "new_messages": messages
+                })
+            else:
+                self.respond(waiter.session, waiter.request, {
+                    "status": "success",
+                    "channel_id": waiter.channel_id,
+                    "new_messages": messages
+                })
+                return
+
+        if waiter.stream:
+            response = {"type": "stream_end", "channel_id": waiter.channel_id}
+        else:
+            response = {
+                "status": "success",
+                "channel_id": waiter.channel_id,
+                "new_messages": [],
+                "timed_out": True
+            }
+        self.respond(waiter.session, waiter.request, response)
+
+    def commit(self, db):
+        with DB_COMMIT_SECONDS.time():
+            db.commit()
+
+    def register_gauges(self):
+        """Live state read at scrape time, labelled by port when a process runs several hosts"""
+        port = str(self.host_port)
+        gauges = (
+            ("channel_host_sessions", "Connected client sessions", lambda: len(self.sessions)),
+            ("channel_host_channels", "Channels hosted", lambda: len(self.hosted_channels)),
+            ("channel_host_resident_channels", "Channels with history in memory", lambda: len(self.channel_data)),
+            ("channel_host_outbuf_bytes", "Bytes queued for slow clients (fan-out backlog)",
+             lambda: sum(len(session.outbuf) for session in list(self.sessions))),
+            ("channel_host_backlogged_sessions", "Sessions with bytes waiting to be sent",
+             lambda: sum(1 for session in list(self.sessions) if session.outbuf)),
+            ("channel_host_worker_queue", "Requests waiting for a worker thread",
+             lambda: self.executor._work_queue.qsize() if self.executor else 0),
+            ("channel_host_parked_polls", "Long-poll requests waiting for a message", self.waiters.pending_count),
         )
-        db.add(membership)
-        db.commit()
-
-        self.hosted_channels[new_channel.id] = self.host_port
-
-        self.channel_data[new_channel.id] = {
-            "info": {
-                "name": new_channel.name,
-                "is_private": new_channel.is_private,
-                "created_at": new_channel.created_at.isoformat() if new_channel.created_at else None,
-                "owner_id": new_channel.owner_id
-            },
-            "messages": [],
-            "members": [
-                {
-                    "user_id": self.user_id,
-                    "joined_at": datetime.now().isoformat()
-                }
-            ]
+        for name, description, function in gauges:
+            metrics.gauge(name, description, port=port).set_function(function)
+
+    def send_to_session(self, session, response, latency=None):
+        try:
+            if session.columnar:
+                response = pack_response(response)
+            if "type" in response:
+                size = session.push(response)
+            else:
+                response_data = session.codec.encode(response)
+                session.send(response_data)
+                size = len(response_data)
+            
+            # Log response
+            self.logger.log_data_transaction(
+                "send",
+                session.address[0],
+                session.address[1],
+                "response",
+                size,
+                latency
+            )
+        except Exception as e:
+            self.network_logger.warning(f"Dropping client {session.address}: {str(e)}")
+            self.drop_session(session)
+            session.close()
+
+    def record_message(self, channel_id, message_dict, exclude_user_ids=None):
+        """Add a committed message to the channel's history and tell its members"""
+        with self.channel_data_lock:
+            # Cold channels are not woken up, the database has the message
+            entry = self.channel_data.peek(channel_id)
+            if entry is not None:
+                entry["history"].append(message_dict)
+                self.channel_data.resize(channel_id)
+            else:
+                if self.preloading:
+                    self.preload_backlog.setdefault(channel_id, []).append(message_dict)
+                loading = self.hydrating.get(channel_id)
+                if loading is not None:
+                    loading["messages"].append(message_dict)
+            self.record_counts[channel_id] = self.record_counts.get(channel_id, 0) + 1
+
+        self.notify_channel_members(channel_id, {
+            "type": "new_message",
+            "channel_id": channel_id,
+            "message": message_dict
+        }, exclude_user_ids=exclude_user_ids)
+
+        for waiter in self.waiters.wake(channel_id):
+            self.answer_waiter(waiter)
+
+    def is_channel_member(self, channel_id, user_id):
+        known = self.membership.is_member(channel_id, user_id)
+        if known:
+            return True
+        if known is False and self.membership.recently_denied(channel_id, user_id):
+            return False
+
+        db = SessionLocal()
+        try:
+            if known is None:
+                # Hydrate the whole channel once, later checks stay in memory
+                channel = db.query(Channel).get(channel_id)
+                if not channel:
+                    return False
+                members = db.query(ChannelMembership.user_id, ChannelMembership.role).filter(
+                    ChannelMembership.channel_id == channel_id
+                ).all()
+                self.membership.load_channel(channel_id, channel.owner_id, members)
+                if self.membership.is_member(channel_id, user_id):
+                    return True
+            else:
+                # The user may have joined from their own client since we loaded
+                membership = db.query(ChannelMembership).filter(
+                    ChannelMembership.channel_id == channel_id,
+                    ChannelMembership.user_id == user_id
+                ).first()
+                if membership:
+                    self.membership.add_member(channel_id, user_id, membership.role)
+                    return True
+
+            self.membership.remember_denied(channel_id, user_id)
+            return False
+        except Exception as e:
+            self.network_logger.error(f"Error checking channel membership: {str(e)}")
+            return False
+        finally:
+            db.close()
+
+    def add_member(self, channel_id, user_id, role="member"):
+        self.membership.add_member(channel_id, user_id, role)
+        self.notify_replicas(channel_id, {
+            "type": "membership",
+            "channel_id": channel_id,
+            "user_id": user_id,
+            "role": role
+        })
+
+    def remove_member(self, channel_id, user_id):
+        self.membership.remove_member(channel_id, user_id)
+        self.notify_replicas(channel_id, {
+            "type": "membership",
+            "channel_id": channel_id,
+            "user_id": user_id,
+            "role": None
+        })
+        
+        # A removed member must stop receiving the channel's pushes
+        with self.subscribers_lock:
+            subscribers = self.subscribers.get(channel_id, set())
+            for session in [s for s in subscribers if s.user_id == user_id]:
+                subscribers.discard(session)
+                session.channels.discard(channel_id)
+
+    def invalidate_membership(self, channel_id=None):
+        self.membership.invalidate(channel_id)
+
+    def membership_invalidated(self, channel_id):
+        with self.subscribers_lock:
+            if channel_id is None:
+                self.stale_memberships.update(self.subscribers)
+            elif self.subscribers.get(channel_id):
+                self.stale_memberships.add(channel_id)
+
+    def prune_subscribers(self):
+        """Drop subscriptions of users who left a channel past the host,
+        found when the channel's members were reloaded"""
+        with self.subscribers_lock:
+            channel_ids = list(self.stale_memberships)
+            self.stale_memberships.clear()
+            listeners = {
+                channel_id: {session.user_id for session in self.subscribers.get(channel_id, ())}
+                for channel_id in channel_ids
+            }
+
+        for channel_id, user_ids in listeners.items():
+            for user_id in user_ids:
+                if not self.is_channel_member(channel_id, user_id):
+                    self.remove_member(channel_id, user_id)
+
+    def handle_refresh_membership(self, request, user_id):
+        """The client changed its membership past the host (e.g. left the
+        channel), reload the channel's members from the database"""
+        if 'channel_id' not in request:
+            return {"status": "error", "message": "Missing channel_id parameter"}
+
+        channel_id = request['channel_id']
+        if not self.serves_channel(channel_id):
+            return {"status": "error", "message": "Channel not hosted on this server"}
+
+        self.invalidate_membership(channel_id)
+        member = self.is_channel_member(channel_id, user_id)
+        if not member:
+            self.remove_member(channel_id, user_id)
+
+        return {"status": "success", "channel_id": channel_id, "member": member}
+
+    def designate_replica(self, channel_id, user_id):
+        """Make a member the channel's hot standby"""
+        db = SessionLocal()
+        try:
+            membership = db.query(ChannelMembership).filter(
+                ChannelMembership.channel_id == channel_id,
+                ChannelMembership.user_id == user_id
+            ).first()
+            if not membership or membership.role == "owner":
+                return False
+            membership.role = CHANNEL_REPLICA_ROLE
+            self.commit(db)
+        except Exception as e:
+            db.rollback()
+            self.network_logger.error(f"Error designating replica for channel {channel_id}: {str(e)}")
+            return False
+        finally:
+            db.close()
+
+        self.add_member(channel_id, user_id, CHANNEL_REPLICA_ROLE)
+        return True
+
+    def standby_loop(self):
+        """Follow the primaries of channels we were made replica of, also
+        ones designated or hosted after we started"""
+        while self.is_running:
+            self.follow_replica_channels()
+            if self.stop_event.wait(CHANNEL_STANDBY_CHECK_INTERVAL):
+                return
+
+    def follow_replica_channels(self):
+        """Start a ChannelReplica per primary host of the channels whose
+        membership gives us the replica role; returns the ones started"""
+        db = SessionLocal()
+        try:
+            channel_ids = [row.channel_id for row in db.query(ChannelMembership.channel_id).filter(
+                ChannelMembership.user_id == self.user_id,
+                ChannelMembership.role == CHANNEL_REPLICA_ROLE
+            ).all()]
+        except Exception as e:
+            self.network_logger.error(f"Error loading replica channels: {str(e)}")
+            return []
+        finally:
+            db.close()
+
+        channel_ids = [channel_id for channel_id in channel_ids
+                       if channel_id not in self.standby and channel_id not in self.hosted_channels]
+        if not channel_ids:
+            return []
+
+        primaries = {}  # (host, port) -> channel ids
+        for channel_id, route in self.directory.lookup_many(channel_ids).items():
+            if route.get("host") and route.get("host_id") != self.user_id:
+                primaries.setdefault((route["host"], route["port"]), []).append(channel_id)
+
+        started = []
+        for (host, port), primary_channels in primaries.items():
+            replica = ChannelReplica(self, host, port, primary_channels, advertise_host=self.advertise_host)
+            if replica.start():
+                started.append(replica)
+            else:
+                replica.stop()
+                self.network_logger.warning(f"Could not stand by for channels {primary_channels} "
+                                            f"of {host}:{port}")
+        return started
+
+    def serves_channel(self, channel_id):
+        """Hosted here, or followed as a standby that can answer reads"""
+        return channel_id in self.hosted_channels or channel_id in self.standby
+
+    def standby_address(self, channel_id):
+        replicas = self.replicas.get(channel_id)
+        if not replicas:
+            return None
+        return list(next(iter(replicas.values())))
+
+    def handle_replicate(self, request, user_id, session):
+        """A designated member's host asks to stand by for some of our channels.
+        It gets their current state, then every new message and a heartbeat."""
+        if session is None:
+            return {"status": "error", "message": "Replication needs a persistent connection"}
+        address = (request.get('host') or session.address[0], request.get('port'))
+        if address[1] is None:
+            return {"status": "error", "message": "Missing port parameter"}
+
+        channels = []
+        rejected = []
+        for channel_id in request.get('channel_ids') or []:
+            if (channel_id not in self.hosted_channels
+                    or not self.is_channel_member(channel_id, user_id)
+                    or self.membership.get_role(channel_id, user_id) != CHANNEL_REPLICA_ROLE):
+                rejected.append(channel_id)
+                continue
+
+            # Subscribe before copying state so no message falls in between
+            with self.subscribers_lock:
+                self.subscribers.setdefault(channel_id, set()).add(session)
+                self.replicas.setdefault(channel_id, {})[session] = address
+                session.channels.add(channel_id)
+                session.replica = True
+
+            entry = self.get_channel_entry(channel_id)
+            if entry is None:
+                rejected.append(channel_id)
+                continue
+            history = entry["history"]
+            channels.append({
+                "channel_id": channel_id,
+                "info": entry["info"],
+                "messages": history.oldest_first(),
+                "complete": history.complete,
+                "evicted_id": history.evicted_id,
+                "members": list(self.membership.members(channel_id).items())
+            })
+
+            # Members learn where to go if we disappear
+            self.notify_channel_members(channel_id, {
+                "type": "replica_announce",
+                "channel_id": channel_id,
+                "host": address[0],
+                "port": address[1]
+            }, exclude_user_ids=[user_id])
+
+            self.logger.log_channel_hosting(
+                channel_id,
+                entry["info"]["name"],
+                "replicate",
+                f"standby {address[0]}:{address[1]} (user {user_id})"
+            )
+
+        return {
+            "status": "success",
+            "channels": channels,
+            "rejected": rejected,
+            "heartbeat_interval": CHANNEL_HEARTBEAT_INTERVAL
         }
 
+    def heartbeat_loop(self):
+        while not self.stop_event.wait(CHANNEL_HEARTBEAT_INTERVAL):
+            with self.subscribers_lock:
+                sessions = {session for replicas in self.replicas.values() for session in replicas}
+            if not sessions:
+                continue
+
+            heartbeat = {
+                "type": "heartbeat",
+                "host_id": self.user_id,
+                "timestamp": time.time()
+            }
+            bodies = {}
+            for session in sessions:
+                try:
+                    session.push(heartbeat, bodies)
+                except Exception as e:
+                    self.network_logger.warning(f"Dropping replica {session.address}: {str(e)}")
+                    self.drop_session(session)
+                    session.close()
+
+    def notify_replicas(self, channel_id, data):
+        with self.subscribers_lock:
+            sessions = list(self.replicas.get(channel_id, ()))
+        for session in sessions:
+            self.send_to_session(session, data)
+
+    def install_replica_channel(self, channel_id, data):
+        """Take over a primary's state for a channel we stand by for"""
+        history = self.new_history()
+        history.restore(data["messages"], data["complete"], data["evicted_id"])
+        with self.channel_data_lock:
+            self.channel_data.put(channel_id, {
+                "info": data["info"],
+                "history": history
+            })
+        self.membership.load_channel(channel_id, data["info"]["owner_id"], data["members"])
+
+    def advertise_channels(self, channel_ids):
+        """Publish channels we host in the routing directory"""
+        if self.directory is None or not channel_ids:
+            return
+        response = self.directory.register(self.user_id, channel_ids, self.advertise_host, self.host_port)
+        if response.get("status") != "success":
+            self.network_logger.warning(f"Could not publish hosted channels: {response.get('message')}")
+        elif response.get("rejected"):
+            self.network_logger.warning(f"Directory refused channels {response['rejected']}")
+
+    def host_channel(self, channel_id):
+        """Start hosting a channel we own, e.g. one created from the UI"""
+        self.hosted_channels[channel_id] = self.host_port
+        self.load_channel_data(channel_id)
+        self.advertise_channels([channel_id])
+
+    def promote_channel(self, channel_id):
+        """The primary is gone, host the channel here"""
+        self.hosted_channels[channel_id] = self.host_port
+        self.advertise_channels([channel_id])
+        entry = self.channel_data.peek(channel_id)
+        self.network_logger.warning(f"Took over hosting of channel {channel_id}")
         self.logger.log_channel_hosting(
-            new_channel.id, 
-            new_channel.name, 
-            "create", 
+            channel_id,
+            entry["info"]["name"] if entry else "unknown",
+            "promote",
             "success"
         )
 
-        return new_channel.id
-    except Exception as e:
-        db.rollback()
-        self.network_logger.error(f"Error creating channel: {str(e)}")
-        self.logger.log_channel_hosting(
-            0, name, "create", f"error: {str(e)}"
+    def demote_channel(self, channel_id, primary_host, primary_port):
+        """The primary is back, send our members to it and go back to standby"""
+        self.hosted_channels.pop(channel_id, None)
+        if self.directory is not None:
+            self.directory.unregister(self.advertise_host, self.host_port, [channel_id])
+        self.notify_channel_members(channel_id, {
+            "type": "redirect",
+            "channel_id": channel_id,
+            "host": primary_host,
+            "port": primary_port
+        })
+        self.network_logger.info(f"Handed channel {channel_id} back to {primary_host}:{primary_port}")
+
+
+    def notify_channel_members(self, channel_id, data, exclude_user_ids=None):
+        with self.subscribers_lock:
+            subscribers = list(self.subscribers.get(channel_id, ()))
+        if not subscribers:
+            return
+        
+        exclude_user_ids = set(exclude_user_ids or ())
+        
+        # Serialize once per wire format, then fan the same bytes out
+        bodies = {}
+        sent = 0
+        for session in subscribers:
+            # A standby needs the whole log, including its own user's messages
+            if session.user_id in exclude_user_ids and not session.replica:
+                continue
+            try:
+                sent += session.push(data, bodies)
+            except Exception as e:
+                self.network_logger.warning(f"Dropping subscriber {session.address}: {str(e)}")
+                self.drop_session(session)
+                session.close()
+        
+        self.logger.log_data_transaction(
+            "push",
+            "localhost",
+            self.host_port,
+            "channel_update",
+            sent
         )
-        return None
-    finally:
-        db.close()
 
 
-def stop_hosting(self):
-    if not self.is_running:
-        return
+    def create_channel(self, name, is_private=False):
+        db = SessionLocal()
+        try:
+            new_channel = Channel(
+                name=name,
+                owner_id=self.user_id,
+                is_private=is_private
+            )
+            db.add(new_channel)
+            self.commit(db)
+
+            db.refresh(new_channel)
+
+            membership = ChannelMembership(
+                channel_id=new_channel.id,
+                user_id=self.user_id
+            )
+            db.add(membership)
+            self.commit(db)
+
+            self.hosted_channels[new_channel.id] = self.host_port
+            self.advertise_channels([new_channel.id])
 
-    self.is_running = False
+            self.channel_data.put(new_channel.id, {
+                "info": self.channel_info(new_channel),
+                "history": self.new_history()
+            })
+            self.membership.load_channel(new_channel.id, self.user_id, [])
 
-    try:
-        self.client_connections.clear()
-    except Exception as e:
-        logging.error(f"Error clearing client connections: {str(e)}")
+            self.logger.log_channel_hosting(
+                new_channel.id, 
+                new_channel.name, 
+                "create", 
+                "success"
+            )
+
+            return new_channel.id
+        except Exception as e:
+            db.rollback()
+            self.network_logger.error(f"Error creating channel: {str(e)}")
+            self.logger.log_channel_hosting(
+                0, name, "create", f"error: {str(e)}"
+            )
+            return None
+        finally:
+            db.close()
+
+
+    def stop_hosting(self):
+        if not self.is_running:
+            return
+
+        self.is_running = False
+
+        # Let the event loop leave select() before tearing its sockets down
+        self.wake_loop()
+        if self.loop_thread and self.loop_thread is not threading.current_thread():
+            self.loop_thread.join(timeout=2.0)
+        self.loop_thread = None
+
+        if self.executor:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+        if self.metrics_server:
+            self.metrics_server.stop()
+            self.metrics_server = None
+
+        self.stop_event.set()
+        self.save_snapshot()
 
-    if self.server_socket:
         try:
-            self.server_socket.close()
+            self.waiters.stop()
+            self.client_connections.clear()
+            for key in list(self.selector.get_map().values()):
+                if isinstance(key.data, HostSession):
+                    self.close_session(key.data)
+            self.sessions.clear()
+            with self.subscribers_lock:
+                self.subscribers.clear()
         except Exception as e:
-            logging.error(f"Error closing server socket: {str(e)}")
+            logging.error(f"Error clearing client connections: {str(e)}")
 
-    try:
-        if hasattr(self, 'logger') and self.logger:
-            try:
-                self.logger.log_connection(
-                    "localhost", 
-                    self.host_port, 
-                    "stop_hosting", 
-                    "success"
-                )
-                self.logger.close()
-            except Exception as le:
-                logging.error(f"Error using logger: {str(le)}")
-    except Exception as e:
-        logging.error(f"Error accessing logger: {str(e)}")
-
-    try:
-        if hasattr(self, 'network_logger') and self.network_logger:
-            try:
-                self.network_logger.info(f"Stopped channel hosting on port {self.host_port}")
-            except Exception as e:
-                logging.info(f"Stopped channel hosting on port {self.host_port}")
-    except Exception as e:
-        logging.error(f"Error using network logger: {str(e)}")
+        for sock in (self.server_socket, self.wake_reader, self.wake_writer):
+            if sock:
+                try:
+                    sock.close()
+                except Exception as e:
+                    logging.error(f"Error closing server socket: {str(e)}")
+        try:
+            self.selector.close()
+        except Exception as e:
+            logging.error(f"Error closing selector: {str(e)}")
+        self.wake_reader = self.wake_writer = None
+
+        try:
+            if hasattr(self, 'logger') and self.logger:
+                try:
+                    self.logger.log_connection(
+                        "localhost", 
+                        self.host_port, 
+                        "stop_hosting", 
+                        "success"
+                    )
+                    self.logger.close()
+                except Exception as le:
+                    logging.error(f"Error using logger: {str(le)}")
+        except Exception as e:
+            logging.error(f"Error accessing logger: {str(e)}")
+
+        try:
+            if hasattr(self, 'network_logger') and self.network_logger:
+                try:
+                    self.network_logger.info(f"Stopped channel hosting on port {self.host_port}")
+                except Exception as e:
+                    logging.info(f"Stopped channel hosting on port {self.host_port}")
+        except Exception as e:
+            logging.error(f"Error using network logger: {str(e)}")
+
+        if self.directory is not None:
+            self.directory.unregister(self.advertise_host, self.host_port)
 
-    try:
-        self.hosted_channels.clear()
-        self.channel_data.clear()
-    except Exception as e:
-        logging.error(f"Error clearing channel data: {str(e)}")
+        for replica in set(self.standby.values()):
+            replica.stop()
 
-    self.host_port = None
+        try:
+            self.hosted_channels.clear()
+            self.standby.clear()
+            self.channel_data.clear()
+        except Exception as e:
+            logging.error(f"Error clearing channel data: {str(e)}")
+
+        self.host_port = None
@@ -0,0 +1,146 @@
+import logging
+import threading
+import time
+from src.client.channel_client import ChannelHostClient
+from src.client.config import (CLIENT_HOST, CHANNEL_FAILOVER_TIMEOUT,
+                               CHANNEL_HEARTBEAT_INTERVAL, CHANNEL_PRIMARY_PROBE_INTERVAL)
+
+
+class ChannelReplica:
+    """Hot standby for channels hosted by another member's ChannelHost.
+
+    Streams the primary's message log into the local host's caches and
+    watches its heartbeats. When they stop, the local host takes the channels
+    over and members that were told about this standby fail over to it. Once
+    the primary is reachable again the channels are handed back.
+    """
+
+    def __init__(self, local_host, primary_host, primary_port, channel_ids,
+                 advertise_host=CLIENT_HOST, failover_timeout=CHANNEL_FAILOVER_TIMEOUT):
+        self.local_host = local_host
+        self.primary_host = primary_host
+        self.primary_port = primary_port
+        self.channel_ids = list(channel_ids)
+        self.advertise_host = advertise_host
+        self.failover_timeout = failover_timeout
+        self.client = None
+        self.last_heartbeat = 0.0
+        self.promoted = False
+        self.running = False
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def start(self):
+        self.running = True
+        self.stop_event.clear()
+        connected = self.connect()
+        threading.Thread(target=self._monitor, daemon=True).start()
+        return connected
+
+    def stop(self):
+        self.running = False
+        self.stop_event.set()
+        if self.client:
+            self.client.close()
+        for channel_id in self.channel_ids:
+            if self.local_host.standby.get(channel_id) is self:
+                del self.local_host.standby[channel_id]
+
+    def connect(self):
+        """Connect to the primary and copy the state of our channels"""
+        client = ChannelHostClient(
+            self.local_host.user_id, self.primary_host, self.primary_port, failover=False
+        )
+        client.add_update_callback(self._on_update)
+        if not client.connect():
+            return False
+
+        response = client.request(
+            "replicate",
+            channel_ids=self.channel_ids,
+            host=self.advertise_host,
+            port=self.local_host.host_port
+        )
+        if response.get("status") != "success":
+            logging.error(f"Primary {self.primary_host}:{self.primary_port} refused replication: "
+                          f"{response.get('message')}")
+            client.close()
+            return False
+
+        for channel in response["channels"]:
+            self.local_host.install_replica_channel(channel["channel_id"], channel)
+            self.local_host.standby[channel["channel_id"]] = self
+        if response["rejected"]:
+            logging.warning(f"Primary rejected replication of channels {response['rejected']}")
+
+        self.last_heartbeat = time.monotonic()
+        if self.client:
+            self.client.close()
+        self.client = client
+        logging.info(f"Standing by for channels {self.channel_ids} of "
+                     f"{self.primary_host}:{self.primary_port}")
+        return True
+
+    def primary_alive(self):
+        return (self.client is not None and self.client.is_connected
+                and time.monotonic() - self.last_heartbeat < self.failover_timeout)
+
+    def confirm_primary(self):
+        """Ask the primary directly, a member failing over may notice it is
+        gone before our heartbeat timeout does"""
+        if not self.primary_alive():
+            return False
+        response = self.client.request("ping", timeout=self.failover_timeout)
+        return response.get("status") == "success"
+
+    def promote(self):
+        with self.lock:
+            if self.promoted or not self.running:
+                return
+            self.promoted = True
+            for channel_id, replica in list(self.local_host.standby.items()):
+                if replica is self:
+                    self.local_host.promote_channel(channel_id)
+
+    def demote(self):
+        with self.lock:
+            if not self.promoted:
+                return
+            self.promoted = False
+            for channel_id, replica in list(self.local_host.standby.items()):
+                if replica is self:
+                    self.local_host.demote_channel(channel_id, self.primary_host, self.primary_port)
+
+    def _on_update(self, message):
+        message_type = message.get("type")
+        if message_type == "heartbeat":
+            self.last_heartbeat = time.monotonic()
+        elif message_type == "new_message":
+            self.last_heartbeat = time.monotonic()
+            self.local_host.record_message(message["channel_id"], message["message"])
+        elif message_type == "catch_up":
+            # Messages the stream skipped, synced from the primary in order
+            for channel_message in message["new_messages"]:
+                self.local_host.record_message(message["channel_id"], channel_message)
+        elif message_type == "membership":
+            if message.get("role") is None:
+                self.local_host.membership.remove_member(message["channel_id"], message["user_id"])
+            else:
+                self.local_host.membership.add_member(
+                    message["channel_id"], message["user_id"], message["role"]
+                )
+
+    def _monitor(self):
+        next_probe = 0.0
+        while not self.stop_event.wait(CHANNEL_HEARTBEAT_INTERVAL):
+            if not self.promoted:
+                if not self.primary_alive():
+                    logging.warning(f"Primary {self.primary_host}:{self.primary_port} went silent, "
+                                    f"taking over channels {self.channel_ids}")
+                    self.promote()
+                    next_probe = time.monotonic() + CHANNEL_PRIMARY_PROBE_INTERVAL
+            elif time.monotonic() >= next_probe:
+                # Hand the channels back as soon as the primary hosts them again
+                next_probe = time.monotonic() + CHANNEL_PRIMARY_PROBE_INTERVAL
+                if self.connect():
+                    self.demote()
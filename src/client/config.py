@@ -24,6 +24,53 @@ ALLOWED_FILE_TYPES = ['.txt', '.pdf', '.jpg', '.png', '.mp4']
 MESSAGE_CACHE_SIZE = 1000
 IMAGE_CACHE_SIZE = 50 * 1024 * 1024
 
+# Realtime delivery
+REALTIME_ACK_TIMEOUT = 2.0  # seconds before the first resend
+REALTIME_MAX_RETRY_DELAY = 60.0
+REALTIME_MESSAGE_TTL = 24 * 60 * 60  # drop undelivered messages after a day
+REALTIME_DEDUP_WINDOW = 5000  # remembered msg_ids per client
+REALTIME_BATCH_WINDOW_MS = 16  # inbound events are delivered to the UI once per frame
+REALTIME_HELLO_TIMEOUT = 2.0  # wait for a peer's wire format answer, then fall back to JSON
+OUTBOX_DIR = "outbox"
+
+# Wire formats offered to hosts and peers, most preferred first (src/common/codec.py).
+# ("bin1", "json") opts in to the binary format with peers that support it.
+WIRE_FORMATS = ("json",)
+
+# Fallback DB resync of the open conversation, friends and requests. New
+# messages arrive through RealtimeHandler.messages_received; this only
+# catches what a push missed (e.g. a peer that was offline).
+UI_POLL_INTERVAL_MS = 30000
+
+# Channel hosting
+MEMBERSHIP_NEGATIVE_TTL = 5.0  # seconds a failed membership check is trusted
+MEMBERSHIP_POSITIVE_TTL = 60.0  # seconds a loaded member list is trusted before reloading
+CHANNEL_HISTORY_CAPACITY = 200  # cached messages per hosted channel
+CHANNEL_HISTORY_MAX_BYTES = 512 * 1024  # memory budget per channel history
+LONG_POLL_MAX_WAIT = 60.0  # longest a fetch_updates request may be parked
+CHANNEL_CACHE_MAX_ENTRIES = 64  # hosted channels kept resident, least recently used go first
+CHANNEL_CACHE_MAX_BYTES = 32 * 1024 * 1024
+CHANNEL_PRELOAD_MODE = "background"  # "eager", "background" or "lazy"
+CHANNEL_PRELOAD_BATCH = 500  # channel ids per IN (...) clause
+CHANNEL_SNAPSHOT_DIR = "snapshots"
+CHANNEL_SNAPSHOT_INTERVAL = 300  # seconds between cache snapshots
+CHANNEL_SNAPSHOT_MAX_AGE = 24 * 60 * 60  # older snapshots are ignored at startup
+CHANNEL_REPLICA_ROLE = "replica"  # membership role of a channel's hot standby
+CHANNEL_HEARTBEAT_INTERVAL = 1.0  # primary -> standby heartbeats
+CHANNEL_FAILOVER_TIMEOUT = 3.0  # silence before a standby takes over
+CHANNEL_PRIMARY_PROBE_INTERVAL = 5.0  # how often a promoted standby looks for its primary
+CHANNEL_STANDBY = True  # stand by for channels whose owner designated us as replica
+CHANNEL_STANDBY_CHECK_INTERVAL = 30.0  # how often a host looks for primaries to follow
+CHANNEL_ROUTE_TTL = 60.0  # seconds a cached channel -> host route is trusted
+CHANNEL_HOST_WORKERS = 4  # threads running database-bound requests
+CHANNEL_HOST_MAX_OUTBUF = 8 * 1024 * 1024  # unsent bytes before a slow client is dropped
+CHANNEL_SYNC_MAX_MESSAGES = 500  # per channel and sync response, the client asks again for more
+CHANNEL_WRITE_RETRIES = 3  # attempts when a concurrent write took the same seq
+CHANNEL_DB_POLL_INTERVAL = 1.0  # how often channels with listeners look for writes made past the host
+CHANNEL_HOST_CLIENT_TIMEOUT = 3.0  # the GUI waits this long on another member's channel host
+CHANNEL_CODECS = ("zlib", "columnar")  # wire options offered and accepted at handshake
+CHANNEL_COMPRESS_THRESHOLD = 1024  # frames larger than this are zlib-compressed once agreed
+
 # P2P
 P2P_PORT_RANGE = (5002, 9999)  
 P2P_BUFFER_SIZE = 4096
@@ -32,4 +79,23 @@ P2P_BUFFER_SIZE = 4096
 LOG_LEVEL = "INFO"
 LOG_FILE = "client.log"
 MAX_LOG_SIZE = 5 * 1024 * 1024  # 5MB
-MAX_LOG_FILES = 3 
\ No newline at end of file
+MAX_LOG_FILES = 3
+LOG_QUEUE_SIZE = 10000  # SystemLogger entries waiting for the writer thread
+LOG_BATCH_SIZE = 512  # entries written per batch
+LOG_FLUSH_INTERVAL = 0.5  # seconds between flushes while entries keep coming
+LOG_OVERFLOW_POLICY = "drop"  # queue full: "drop" (counted, noted in the log) or "block"
+LOG_BLOCK_TIMEOUT = 1.0  # longest a "block" caller waits before dropping the entry
+LOG_ROTATE_INTERVAL = 24 * 60 * 60  # SystemLogger starts a new file at least this often
+LOG_RETENTION_BYTES = 100 * 1024 * 1024  # rotated (gzipped) logs kept per directory
+# Network log routing (src/client/log_routing.py): the longest logger name
+# prefix listed decides which sinks get a record, from which level
+LOG_SINK_LEVELS = {"system": "INFO"}  # "system" is the SystemLogger file
+LOG_ROUTES = {
+    "network": {"system": "INFO"},
+    "network.channel_host": {"system": "INFO"},
+    "network.media": {"system": "INFO"},
+    "network.realtime": {"system": "WARNING"},
+}
+METRICS_DUMP_INTERVAL = 60  # seconds between metrics summaries in the network log
+METRICS_HOST = "127.0.0.1"
+CHANNEL_HOST_METRICS_PORT = None  # serve /metrics from each ChannelHost on this port (0 = any free one) 
\ No newline at end of file
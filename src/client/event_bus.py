@@ -0,0 +1,48 @@
+from PySide6.QtCore import QObject, QTimer, Signal
+import threading
+from typing import List
+
+
+class InboundEventBus(QObject):
+    """Collects events posted from network threads and hands them to the UI
+    thread in batches, at most one batch per window."""
+
+    batch_ready = Signal(list)
+    _wake = Signal()
+
+    def __init__(self, window_ms: int = 16, parent=None):
+        super().__init__(parent)
+        self.window_ms = window_ms
+        self._pending: List[dict] = []
+        self._lock = threading.Lock()
+        self._scheduled = False
+
+        # Owned by the thread that created the bus, normally the UI thread
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+        self._wake.connect(self._schedule_flush)
+
+    def post(self, event: dict):
+        """Thread-safe: queue an event for the next batch"""
+        with self._lock:
+            self._pending.append(event)
+            if self._scheduled:
+                return
+            self._scheduled = True
+
+        # Only the first event of a window wakes the UI thread
+        self._wake.emit()
+
+    def _schedule_flush(self):
+        if not self._timer.isActive():
+            self._timer.start(self.window_ms)
+
+    def flush(self):
+        with self._lock:
+            events = self._pending
+            self._pending = []
+            self._scheduled = False
+
+        if events:
+            self.batch_ready.emit(events)
@@ -0,0 +1,51 @@
+import gzip
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+SNAPSHOT_VERSION = 2
+
+
+def write_snapshot(path: str, snapshot: dict):
+    """Write a gzipped JSON snapshot atomically, a crash never leaves half a file"""
+    try:
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        snapshot["version"] = SNAPSHOT_VERSION
+        snapshot["saved_at"] = time.time()
+        data = json.dumps(snapshot, separators=(',', ':')).encode('utf-8')
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(gzip.compress(data, compresslevel=1))
+        os.replace(tmp_path, path)
+        return True
+    except Exception as e:
+        logging.error(f"Error saving host snapshot {path}: {str(e)}")
+        return False
+
+
+def read_snapshot(path: str, max_age: Optional[float] = None) -> Optional[dict]:
+    """The snapshot at path, or None if it is missing, unreadable, from another
+    version or older than max_age seconds"""
+    if not path or not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, "rb") as f:
+            snapshot = json.loads(gzip.decompress(f.read()).decode('utf-8'))
+    except Exception as e:
+        logging.error(f"Error reading host snapshot {path}: {str(e)}")
+        return None
+
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        logging.info(f"Ignoring host snapshot {path} from version {snapshot.get('version')}")
+        return None
+    if max_age is not None and time.time() - snapshot.get("saved_at", 0) > max_age:
+        logging.info(f"Ignoring stale host snapshot {path}")
+        return None
+    return snapshot
@@ -0,0 +1,84 @@
+import logging
+import threading
+from src.client.config import LOG_ROUTES, LOG_SINK_LEVELS
+
+# Network log records (the "network" logger and its children) go through one
+# LogRouter handler. Sinks are registered by name, so registering the same
+# name again replaces the handler instead of adding a second one, and each
+# subsystem is routed to the sinks of the longest LOG_ROUTES prefix matching
+# its logger name, at that route's level.
+
+ROOT_LOGGER = "network"
+
+
+def _level(level):
+    return logging.getLevelName(level) if isinstance(level, str) else level
+
+
+class LogRouter(logging.Handler):
+    def __init__(self, routes=None, sink_levels=None):
+        super().__init__()
+        self.sinks = {}  # name -> handler
+        self.routes = {}  # logger name prefix -> {sink name: level}
+        self.resolved = {}  # logger name -> [(handler, level)], rebuilt on changes
+        self.registry_lock = threading.Lock()
+        for prefix, sinks in (routes or {}).items():
+            self.set_route(prefix, sinks)
+        self.sink_levels = {name: _level(level) for name, level in (sink_levels or {}).items()}
+
+    def add_sink(self, name, handler, level=None):
+        """Register or replace the sink called name"""
+        if level is None:
+            level = self.sink_levels.get(name, logging.NOTSET)
+        handler.setLevel(_level(level))
+        with self.registry_lock:
+            self.sinks[name] = handler
+            self.resolved = {}
+        return handler
+
+    def remove_sink(self, name, handler=None):
+        """Unregister name, only if it is still handler when one is given"""
+        with self.registry_lock:
+            if handler is not None and self.sinks.get(name) is not handler:
+                return
+            self.sinks.pop(name, None)
+            self.resolved = {}
+
+    def set_route(self, prefix, sinks):
+        """Send records from prefix and its children to {sink name: level}"""
+        with self.registry_lock:
+            self.routes[prefix] = {name: _level(level) for name, level in sinks.items()}
+            self.resolved = {}
+        # Records below every route's level are dropped by the logger already
+        logger = logging.getLogger(ROOT_LOGGER)
+        levels = [level for route in self.routes.values() for level in route.values()]
+        logger.setLevel(min(levels) if levels else logging.WARNING)
+
+    def _resolve(self, name):
+        targets = self.resolved.get(name)
+        if targets is not None:
+            return targets
+        with self.registry_lock:
+            prefix = name
+            while prefix not in self.routes and "." in prefix:
+                prefix = prefix.rsplit(".", 1)[0]
+            route = self.routes.get(prefix, {})
+            targets = [(self.sinks[sink], level) for sink, level in route.items() if sink in self.sinks]
+            self.resolved[name] = targets
+        return targets
+
+    def emit(self, record):
+        for handler, level in self._resolve(record.name):
+            if record.levelno >= level and record.levelno >= handler.level:
+                handler.handle(record)
+
+
+ROUTER = LogRouter(LOG_ROUTES, LOG_SINK_LEVELS)
+
+
+def install():
+    """Attach ROUTER to the network logger; safe to call any number of times"""
+    logger = logging.getLogger(ROOT_LOGGER)
+    if ROUTER not in logger.handlers:
+        logger.addHandler(ROUTER)
+    return ROUTER
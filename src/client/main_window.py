@@ -9,7 +9,8 @@ from src.client.auth_dialog import AuthDialog
 from src.client.channel_dialog import ChannelDialog
 from src.client.friend_dialog import FriendDialog
 from src.client.settings_dialog import SettingsDialog
-from src.database.models import User, Channel, Message, FriendRequest, Friendship, ChannelMembership
+from src.database.models import (User, Channel, Message, FriendRequest, Friendship, ChannelMembership,
+                                 add_channel_message)
 from src.database.config import SessionLocal
 import logging
 from sqlalchemy import or_, and_
@@ -29,7 +30,11 @@ import subprocess
 import signal
 from src.client.system_logger import SystemLogger
 from src.client.channel_host import ChannelHost
+from src.client.channel_directory import ChannelDirectory
+from src.client.channel_client import ChannelHostClient
 from src.client.media_transfer import MediaTransferNode
+from src.common import profiling
+from src.client.config import OUTBOX_DIR, UI_POLL_INTERVAL_MS, CHANNEL_HOST_CLIENT_TIMEOUT
 import socket
 import random
 
@@ -223,11 +228,12 @@ class MainWindow(QMainWindow):
         
         self.system_logger = None
         self.channel_host = None
+        self.host_clients = {}  # channel_id -> ChannelHostClient of channels other members host
         self.base_port = self.find_available_base_port()
         
         self.update_timer = QTimer()
         self.update_timer.timeout.connect(self.auto_update_ui)
-        self.update_timer.start(1000)
+        self.update_timer.start(UI_POLL_INTERVAL_MS)
         
         self.init_ui_structure()
         
@@ -482,6 +488,12 @@ class MainWindow(QMainWindow):
         about_action.triggered.connect(self.show_about)
         help_menu.addAction(about_action)
         
+        # Not in any menu: profiling and memory snapshots for support sessions
+        diagnostics_action = QAction("Diagnostics", self)
+        diagnostics_action.setShortcut("Ctrl+Shift+F12")
+        diagnostics_action.triggered.connect(self.run_diagnostics_command)
+        self.addAction(diagnostics_action)
+        
     def show_network_info(self):
         if not self.current_user_id:
             QMessageBox.information(self, "Network Info", "You need to be logged in to view network information.")
@@ -535,8 +547,7 @@ class MainWindow(QMainWindow):
                     for new_channel in new_channels:
                         channel_id = new_channel.id
                         
-                        self.channel_host.hosted_channels[channel_id] = self.channel_host.host_port
-                        self.channel_host.load_channel_data(channel_id)
+                        self.channel_host.host_channel(channel_id)
                         
                         if self.system_logger:
                             self.system_logger.log_channel_hosting(
@@ -568,6 +579,7 @@ class MainWindow(QMainWindow):
             if self.channel_host:
                 self.channel_host.stop_hosting()
                 self.channel_host = None
+            self.close_host_clients()
             
             if self.system_logger:
                 self.system_logger.log_connection("localhost", self.port, "user_logout", f"User ID: {self.current_user_id}")
@@ -622,6 +634,7 @@ class MainWindow(QMainWindow):
         
         if self.channel_host:
             self.channel_host.stop_hosting()
+        self.close_host_clients()
         
         VideoOpenerThread.terminate_all()
         
@@ -657,6 +670,8 @@ class MainWindow(QMainWindow):
         try:
             if hasattr(self, 'channel_host') and self.channel_host:
                 self.channel_host.stop_hosting()
+            if hasattr(self, 'host_clients'):
+                self.close_host_clients()
         except Exception as e:
             logging.error(f"Error stopping channel host: {str(e)}")
                 
@@ -706,7 +721,7 @@ class MainWindow(QMainWindow):
             username = "User"
             status_to_set = "online"  
             
-            self.system_logger = SystemLogger()
+            self.system_logger = SystemLogger.shared()
             self.system_logger.log(f"User {self.current_user_id} logged in - Port: {self.port}")
             
             db = SessionLocal()
@@ -745,17 +760,22 @@ class MainWindow(QMainWindow):
             if hasattr(self, 'settings_menu') and self.settings_menu:
                 self.settings_menu.setEnabled(True)
 
-            self.realtime_handler = RealtimeHandler(self.port)
+            self.realtime_handler = RealtimeHandler(
+                self.port,
+                outbox_path=os.path.join(OUTBOX_DIR, f"realtime_outbox_{self.current_user_id}.json"),
+                user_id=self.current_user_id,
+                directory=getattr(self, "channel_directory", None)
+            )
             self.realtime_handler.start()
             
             self.realtime_handler.friend_request_received.connect(self.handle_friend_request_received)
             self.realtime_handler.friend_request_accepted.connect(self.handle_friend_request_accepted)
             self.realtime_handler.friend_request_rejected.connect(self.handle_friend_request_rejected)
-            self.realtime_handler.message_received.connect(self.handle_message_received)
+            self.realtime_handler.messages_received.connect(self.handle_messages_received)
             self.realtime_handler.status_changed.connect(self.handle_status_changed)
             
             if self.current_user_id or self.visitor_username:
-                self.update_timer.start(1000)
+                self.update_timer.start(UI_POLL_INTERVAL_MS)
             else:
                 logging.warning("UI update timer not started due to missing user ID or visitor username.")
             
@@ -776,7 +796,7 @@ class MainWindow(QMainWindow):
                 self.settings_menu.setEnabled(False)
                 
             if self.visitor_username:
-                self.update_timer.start(1000)
+                self.update_timer.start(UI_POLL_INTERVAL_MS)
             else:
                 logging.warning("UI update timer not started for visitor due to missing visitor username.")
             
@@ -787,7 +807,15 @@ class MainWindow(QMainWindow):
         if not self.current_user_id:
             return
 
-        self.channel_host = ChannelHost(self.current_user_id, self.base_port + 1)
+        if getattr(self, "channel_directory", None) is None:
+            self.channel_directory = ChannelDirectory()
+            self.channel_directory.start()
+
+        self.channel_host = ChannelHost(
+            self.current_user_id,
+            self.base_port + 1,
+            directory=self.channel_directory
+        )
         
         success = self.channel_host.start_hosting()
         
@@ -802,6 +830,65 @@ class MainWindow(QMainWindow):
             if self.system_logger:
                 self.system_logger.log(f"Failed to start channel hosting for user {self.current_user_id}")
             
+    def host_client_for(self, channel_id):
+        """Connection to the member hosting channel_id, or None when we host
+        it ourselves, nobody hosts it or there is no routing directory"""
+        if (self.channel_host and self.channel_host.is_running
+                and channel_id in self.channel_host.hosted_channels):
+            return None
+        if not self.current_user_id or getattr(self, "channel_directory", None) is None:
+            return None
+
+        client = self.host_clients.pop(channel_id, None)
+        if client is not None:
+            if client.is_connected:
+                self.host_clients[channel_id] = client
+                return client
+            client.close()
+
+        client = ChannelHostClient.for_channel(self.channel_directory, self.current_user_id, channel_id,
+                                               timeout=CHANNEL_HOST_CLIENT_TIMEOUT)
+        if client is not None:
+            self.host_clients[channel_id] = client
+        return client
+
+    def close_host_clients(self):
+        for client in self.host_clients.values():
+            client.close()
+        self.host_clients.clear()
+
+    def send_through_channel_host(self, channel_id, fields):
+        client = self.host_client_for(channel_id)
+        if client is None:
+            return False
+        response = client.send_message(channel_id, **fields)
+        if response.get("status") != "success":
+            logging.warning(f"Channel host did not take message for channel {channel_id}: {response.get('message')}")
+            return False
+        return True
+
+    def load_channel_messages_from_host(self):
+        client = self.host_client_for(self.current_channel)
+        if client is None:
+            return False
+        response = client.get_channel_messages(self.current_channel, limit=100)
+        if response.get("status") != "success":
+            return False
+
+        messages = list(reversed(response["messages"]))  # the host answers newest first
+        db = SessionLocal()
+        try:
+            sender_ids = {message["sender_id"] for message in messages}
+            senders = db.query(User).filter(User.id.in_(sender_ids)).all()
+            sender_map = {sender.id: sender.username for sender in senders}
+        finally:
+            db.close()
+
+        for message in messages:
+            sender_name = sender_map.get(message["sender_id"], f"User {message['sender_id']}")
+            self.show_received_message(dict(message, sender_username=sender_name))
+        return True
+
     def update_status_button(self):
         channel_info_layout = self.centralWidget().findChild(QHBoxLayout, "channelInfoLayout")
         if not channel_info_layout:
@@ -919,10 +1006,53 @@ class MainWindow(QMainWindow):
             db.close()
             
     def edit_channel(self, channel_id: int):
+        menu = QMenu(self)
+        edit_action = menu.addAction("Edit channel")
+        standby_action = menu.addAction("Set standby host...")
+        action = menu.exec(QCursor.pos())
+        if action == standby_action:
+            self.choose_channel_standby(channel_id)
+            return
+        if action != edit_action:
+            return
+
         dialog = ChannelDialog(self.current_user_id, self)
         dialog.edit_channel(channel_id)
         if dialog.exec() == QDialog.DialogCode.Accepted:
             self.load_channels()
+
+    def choose_channel_standby(self, channel_id: int):
+        """Let the owner pick the member whose host takes the channel over
+        while the owner is offline"""
+        if not getattr(self, "channel_host", None):
+            QMessageBox.warning(self, "Standby Host", "Channel hosting is not running.")
+            return
+
+        db = SessionLocal()
+        try:
+            members = db.query(User.id, User.username).join(
+                ChannelMembership, ChannelMembership.user_id == User.id
+            ).filter(
+                ChannelMembership.channel_id == channel_id,
+                ChannelMembership.role != "owner"
+            ).order_by(User.username).all()
+        finally:
+            db.close()
+        if not members:
+            QMessageBox.information(self, "Standby Host", "The channel has no other members yet.")
+            return
+
+        names = [member.username for member in members]
+        name, ok = QInputDialog.getItem(
+            self, "Standby Host", "Member that hosts the channel while you are offline:", names, 0, False
+        )
+        if not ok:
+            return
+        user_id = members[names.index(name)].id
+        if self.channel_host.designate_replica(channel_id, user_id):
+            QMessageBox.information(self, "Standby Host", f"{name} now stands by for this channel.")
+        else:
+            QMessageBox.warning(self, "Standby Host", f"Could not make {name} the standby host.")
             
     def load_friends(self):
         self.friend_list.clear()
@@ -1039,6 +1169,9 @@ class MainWindow(QMainWindow):
             return
         if not self.current_user_id and not self.visitor_username:
             return
+        # The channel's host serves its history from memory
+        if self.current_user_id and self.load_channel_messages_from_host():
+            return
             
         db = SessionLocal()
         try:
@@ -1199,17 +1332,21 @@ class MainWindow(QMainWindow):
                 media_type = self.selected_media_type
                 media_name = os.path.basename(self.selected_media_path)
             
-            new_message = Message(
-                content=message,
-                sender_id=sender_id_to_use,
-                channel_id=self.current_channel,
-                has_media=has_media,
-                media_type=media_type,
-                media_path=media_path,
-                media_name=media_name
-            )
-            db.add(new_message)
-            db.commit()
+            fields = {
+                "content": message,
+                "has_media": has_media,
+                "media_type": media_type,
+                "media_path": media_path,
+                "media_name": media_name
+            }
+            hosted_here = (self.channel_host and self.channel_host.is_running
+                           and channel.id in self.channel_host.hosted_channels)
+            if hosted_here:
+                # Through our host, which numbers and pushes the channel's writes in order
+                self.channel_host.write_message(channel.id, sender_id_to_use, **fields)
+            elif not self.send_through_channel_host(channel.id, fields):
+                # Nobody reachable hosts it, the database numbers the message
+                add_channel_message(db, sender_id=sender_id_to_use, channel_id=self.current_channel, **fields)
 
             if self.system_logger:
                 self.system_logger.log_data_transaction(
@@ -1279,27 +1416,13 @@ class MainWindow(QMainWindow):
                             len(message) + (len(media_path) if media_path else 0)
                         )
                 
-                if self.channel_host and self.channel_host.is_running and channel.id in self.channel_host.hosted_channels:
-                    if self.system_logger:
-                        self.system_logger.log_channel_hosting(
-                            channel.id,
-                            channel.name,
-                            "message",
-                            f"from user {self.current_user_id}"
-                        )
-                    
-                    if self.channel_host.channel_data.get(channel.id):
-                        message_dict = {
-                            "id": new_message.id,
-                            "content": new_message.content,
-                            "sender_id": new_message.sender_id,
-                            "created_at": new_message.created_at.isoformat() if new_message.created_at else None,
-                            "has_media": new_message.has_media,
-                            "media_type": new_message.media_type,
-                            "media_path": new_message.media_path,
-                            "media_name": new_message.media_name
-                        }
-                        self.channel_host.channel_data[channel.id]["messages"].insert(0, message_dict)
+                if hosted_here and self.system_logger:
+                    self.system_logger.log_channel_hosting(
+                        channel.id,
+                        channel.name,
+                        "message",
+                        f"from user {self.current_user_id}"
+                    )
                     
         except Exception as e:
             logging.error(f"Error sending channel message: {str(e)}")
@@ -1448,6 +1571,16 @@ class MainWindow(QMainWindow):
         if dialog.exec() == QDialog.DialogCode.Accepted:
              self.update_ui_after_auth()
 
+    def run_diagnostics_command(self):
+        command, ok = QInputDialog.getText(
+            self, "Diagnostics", "Command (" + ", ".join(profiling.COMMANDS) + "):"
+        )
+        if not ok or not command.strip():
+            return
+        reply = profiling.PROFILER.handle_command(command)
+        logging.info(f"Diagnostics command '{command.strip()}': {reply}")
+        QMessageBox.information(self, "Diagnostics", reply)
+
     def show_about(self):
         QMessageBox.about(self, "About",
             "Hybrid ParadigmChat Chat Application\n"
@@ -1471,6 +1604,7 @@ class MainWindow(QMainWindow):
             if self.channel_host:
                 self.channel_host.stop_hosting()
                 self.channel_host = None
+            self.close_host_clients()
             
             if self.system_logger:
                 self.system_logger.log_connection("localhost", self.port, "user_logout", f"User ID: {self.current_user_id}")
@@ -1525,6 +1659,7 @@ class MainWindow(QMainWindow):
         
         if self.channel_host:
             self.channel_host.stop_hosting()
+        self.close_host_clients()
         
         VideoOpenerThread.terminate_all()
         
@@ -1560,6 +1695,8 @@ class MainWindow(QMainWindow):
         try:
             if hasattr(self, 'channel_host') and self.channel_host:
                 self.channel_host.stop_hosting()
+            if hasattr(self, 'host_clients'):
+                self.close_host_clients()
         except Exception as e:
             logging.error(f"Error stopping channel host: {str(e)}")
                 
@@ -1718,83 +1855,75 @@ class MainWindow(QMainWindow):
                 self.pending_list.takeItem(i)
                 break
                 
-    def handle_message_received(self, data: dict):
-        logging.debug(f"Nhận được tin nhắn: {data}")
-        
-        if self.system_logger:
-            msg_type = "direct" if data.get("is_direct") else "channel"
-            self.system_logger.log_data_transaction(
-                "receive",
-                "localhost",
-                self.port,
-                f"{msg_type}_message",
-                len(data.get("content", "")) + 
-                (len(data.get("media_path", "")) if data.get("has_media") else 0)
-            )
-        
-        if data.get("is_direct"):
-            sender_id = data["sender_id"]
-            
-            if self.current_friend == sender_id:
-                sender_display = f"<b>{data['sender_username']}</b>"
-                
-                if data.get("has_media"):
-                    if data['media_type'] == "image":
-                        if data['content']:
-                            self.append_to_chat(f"{sender_display}: {data['content']}")
-                        self.append_to_chat(f'<img src="{data["media_path"]}" width="200" />')
-                    else:  
-                        if data['content']:
-                            self.append_to_chat(f"{sender_display}: {data['content']}<br/><i>[Video]</i>")
-                        else:
-                            self.append_to_chat(f"{sender_display}: <i>[Video]</i>")
-                            
-                        thumbnail_path = self.generate_video_thumbnail(data["media_path"])
-                        
-                        file_path = os.path.abspath(data["media_path"])
-                        file_url = QUrl.fromLocalFile(file_path).toString()
-                        self.append_to_chat(f'<a href="{file_url}"><img src="{thumbnail_path}" width="320" height="180" style="border:2px solid #5865f2; border-radius:8px;"/></a>')
+    def handle_messages_received(self, messages: list):
+        profiling.checkpoint()
+        channels_changed = False
+        friends_changed = False
+        read_current_friend = False
+
+        for data in messages:
+            logging.debug(f"Nhận được tin nhắn: {data}")
+
+            if self.system_logger:
+                msg_type = "direct" if data.get("is_direct") else "channel"
+                self.system_logger.log_data_transaction(
+                    "receive",
+                    "localhost",
+                    self.port,
+                    f"{msg_type}_message",
+                    len(data.get("content", "")) + 
+                    (len(data.get("media_path", "")) if data.get("has_media") else 0)
+                )
+
+            if data.get("is_direct"):
+                if self.current_friend == data["sender_id"]:
+                    self.show_received_message(data)
+                    read_current_friend = True
                 else:
-                    self.append_to_chat(f"{sender_display}: {data['content']}")
-                    
-                self.mark_messages_as_read(self.current_friend)
+                    sender_id = data["sender_id"]
+                    self.unread_friend_messages[sender_id] = self.unread_friend_messages.get(sender_id, 0) + 1
+                    friends_changed = True
             else:
-                current_count = self.unread_friend_messages.get(sender_id, 0)
-                self.unread_friend_messages[sender_id] = current_count + 1
-                self.load_friends()
-        else:
-            channel_id = data.get("channel_id") 
-            if self.current_channel == channel_id:
-                if data['sender_id'] == self.current_user_id:
-                    sender_display = "<b>~You~</b>"
-                else:
-                    sender_display = f"<b>{data['sender_username']}</b>"
-                
-                if data.get("has_media"):
-                    if data['media_type'] == "image":
-                        if data['content']:
-                            self.append_to_chat(f"{sender_display}: {data['content']}")
-                        self.append_to_chat(f'<img src="{data["media_path"]}" width="200" />')
-                    else:  
-                        if data['content']:
-                            self.append_to_chat(f"{sender_display}: {data['content']}<br/><i>[Video]</i>")
-                        else:
-                            self.append_to_chat(f"{sender_display}: <i>[Video]</i>")
-                            
-                        thumbnail_path = self.generate_video_thumbnail(data["media_path"])
-                        
-                        file_path = os.path.abspath(data["media_path"])
-                        file_url = QUrl.fromLocalFile(file_path).toString()
-                        self.append_to_chat(f'<a href="{file_url}"><img src="{thumbnail_path}" width="320" height="180" style="border:2px solid #5865f2; border-radius:8px;"/></a>')
+                channel_id = data.get("channel_id")
+                if self.current_channel == channel_id:
+                    self.show_received_message(data)
                 else:
+                    self.unread_channel_messages[channel_id] = self.unread_channel_messages.get(channel_id, 0) + 1
+                    channels_changed = True
+
+        # One repaint per batch, however many messages it carried
+        if read_current_friend:
+            self.mark_messages_as_read(self.current_friend)
+        if friends_changed:
+            self.load_friends()
+        if channels_changed:
+            self.load_channels()
+
+    def show_received_message(self, data: dict):
+        if data['sender_id'] == self.current_user_id:
+            sender_display = "<b>~You~</b>"
+        else:
+            sender_display = f"<b>{data['sender_username']}</b>"
+
+        if data.get("has_media"):
+            if data['media_type'] == "image":
+                if data['content']:
                     self.append_to_chat(f"{sender_display}: {data['content']}")
-            else:
-                current_count = self.unread_channel_messages.get(channel_id, 0)
-                self.unread_channel_messages[channel_id] = current_count + 1
-                self.load_channels()
-                
-        self.load_recent_messages()
-        
+                self.append_to_chat(f'<img src="{data["media_path"]}" width="200" />')
+            else:  
+                if data['content']:
+                    self.append_to_chat(f"{sender_display}: {data['content']}<br/><i>[Video]</i>")
+                else:
+                    self.append_to_chat(f"{sender_display}: <i>[Video]</i>")
+
+                thumbnail_path = self.generate_video_thumbnail(data["media_path"])
+
+                file_path = os.path.abspath(data["media_path"])
+                file_url = QUrl.fromLocalFile(file_path).toString()
+                self.append_to_chat(f'<a href="{file_url}"><img src="{thumbnail_path}" width="320" height="180" style="border:2px solid #5865f2; border-radius:8px;"/></a>')
+        else:
+            self.append_to_chat(f"{sender_display}: {data['content']}")
+
     def handle_status_changed(self, data: dict):
         for i in range(self.friend_list.count()):
             item = self.friend_list.item(i)
@@ -1833,6 +1962,8 @@ class MainWindow(QMainWindow):
             db.close()
 
     def auto_update_ui(self):
+        """Fallback resync every UI_POLL_INTERVAL_MS, pushes do the live updates"""
+        profiling.checkpoint()  # starts or stops profiling the UI thread during a profile run
         if self.current_user_id:
             self.load_friends()
             
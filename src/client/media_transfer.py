@@ -7,11 +7,15 @@ import logging
 import time
 from datetime import datetime
 from src.client.system_logger import SystemLogger
+from src.client.config import WIRE_FORMATS
+from src.common.codec import JSON, decode, get_codec, negotiate
+from src.common import metrics
 import struct
 import random
 
 class MediaTransferNode:
     def __init__(self, user_id, username, media_port=None):
+        self.network_logger = logging.getLogger('network.media')
         self.user_id = user_id
         self.username = username
         self.is_running = False
@@ -20,8 +24,9 @@ class MediaTransferNode:
         self.media_port = media_port if media_port else self._find_available_port(9000, 9999)
         
         self.peer_connections = {}  # {user_id: (address, port)}
+        self.peer_codecs = {}  # {user_id: wire format agreed at authentication}
         
-        self.logger = SystemLogger(log_dir="logs/media_transfers")
+        self.logger = SystemLogger.shared()
         self.logger.log(f"Initialized media transfer node for user {username} (ID: {user_id}) on port {self.media_port}")
         
         self.media_cache = {}  # {media_id: {"path": path, "type": type, "size": size}}
@@ -48,7 +53,7 @@ class MediaTransferNode:
                 test_socket.settimeout(0.5)  # Short timeout
                 test_socket.bind(('0.0.0.0', port))
                 test_socket.close()
-                logging.info(f"Found available media transfer port: {port}")
+                self.network_logger.info(f"Found available media transfer port: {port}")
                 return port
             except socket.error:
                 continue
@@ -64,12 +69,12 @@ class MediaTransferNode:
                 test_socket.settimeout(0.5)  # Short timeout
                 test_socket.bind(('0.0.0.0', port))
                 test_socket.close()
-                logging.info(f"Found available media transfer port: {port}")
+                self.network_logger.info(f"Found available media transfer port: {port}")
                 return port
             except socket.error:
                 continue
                 
-        logging.warning("Could not find available port in specified range, using random high port")
+        self.network_logger.warning("Could not find available port in specified range, using random high port")
         return random.randint(10000, 60000)
         
     def start(self):
@@ -97,7 +102,7 @@ class MediaTransferNode:
             
             return True
         except Exception as e:
-            logging.error(f"Error starting media transfer node: {str(e)}")
+            self.network_logger.error(f"Error starting media transfer node: {str(e)}")
             self.logger.log_connection(
                 "0.0.0.0", 
                 self.media_port, 
@@ -128,7 +133,7 @@ class MediaTransferNode:
                 continue
             except Exception as e:
                 if self.is_running:  # Only log if we're still supposed to be running
-                    logging.error(f"Error accepting media connection: {str(e)}")
+                    self.network_logger.error(f"Error accepting media connection: {str(e)}")
                     
     def _handle_peer(self, client_socket, address):
         try:
@@ -143,8 +148,10 @@ class MediaTransferNode:
                 
             peer_id = auth_json['user_id']
             peer_username = auth_json['username']
+            codec = negotiate(auth_json.get('formats'))
             
             self.peer_connections[peer_id] = (address[0], address[1], client_socket)
+            self.peer_codecs[peer_id] = codec
             
             self.logger.log_connection(
                 address[0],
@@ -157,6 +164,7 @@ class MediaTransferNode:
                 "status": "authenticated",
                 "user_id": self.user_id,
                 "username": self.username,
+                "format": codec.name,
                 "timestamp": datetime.now().isoformat()
             }
             client_socket.send(json.dumps(response).encode('utf-8'))
@@ -182,7 +190,7 @@ class MediaTransferNode:
                     buffer += chunk
                     
                     if len(buffer) == message_size:
-                        message = json.loads(buffer.decode('utf-8'))
+                        message = decode(buffer)
                         self._handle_peer_message(message, peer_id, peer_username)
                         
                         buffer = b''
@@ -191,7 +199,7 @@ class MediaTransferNode:
                 except socket.timeout:
                     continue
                 except Exception as e:
-                    logging.error(f"Error handling peer {peer_id}: {str(e)}")
+                    self.network_logger.error(f"Error handling peer {peer_id}: {str(e)}")
                     break
                     
             if peer_id in self.peer_connections:
@@ -205,7 +213,7 @@ class MediaTransferNode:
             )
             
         except Exception as e:
-            logging.error(f"Error in peer handler for {address}: {str(e)}")
+            self.network_logger.error(f"Error in peer handler for {address}: {str(e)}")
         finally:
             client_socket.close()
             
@@ -259,6 +267,8 @@ class MediaTransferNode:
                 f"media_{media_type}",
                 len(media_data)
             )
+            metrics.counter("media_received_bytes_total", "Media bytes received and stored").inc(len(media_data))
+            metrics.counter("media_received_total", "Media transfers received").inc()
             
             self.media_cache[media_id] = {
                 "path": os.path.relpath(media_path, os.getcwd()),
@@ -284,7 +294,7 @@ class MediaTransferNode:
                 callback(message_data)
                 
         except Exception as e:
-            logging.error(f"Error handling received media: {str(e)}")
+            self.network_logger.error(f"Error handling received media: {str(e)}")
             
     def _handle_media_request(self, message, peer_id):
         try:
@@ -314,7 +324,7 @@ class MediaTransferNode:
                 )
                 
         except Exception as e:
-            logging.error(f"Error handling media request: {str(e)}")
+            self.network_logger.error(f"Error handling media request: {str(e)}")
             
     def send_media(self, media_path, media_type, target_id, is_channel=False, content=''):
         try:
@@ -364,7 +374,7 @@ class MediaTransferNode:
                         content
                     )
                 else:
-                    logging.warning(f"Peer {target_id} not connected, cannot send media directly")
+                    self.network_logger.warning(f"Peer {target_id} not connected, cannot send media directly")
                     return None
                     
             return {
@@ -375,12 +385,12 @@ class MediaTransferNode:
             }
             
         except Exception as e:
-            logging.error(f"Error sending media: {str(e)}")
+            self.network_logger.error(f"Error sending media: {str(e)}")
             return None
             
     def send_media_to_peer(self, peer_id, media_id, media_type, media_name, media_data_b64, target_id, is_channel, content=''):
         if peer_id not in self.peer_connections:
-            logging.warning(f"Peer {peer_id} not connected, cannot send media")
+            self.network_logger.warning(f"Peer {peer_id} not connected, cannot send media")
             return False
             
         try:
@@ -398,26 +408,31 @@ class MediaTransferNode:
                 "timestamp": datetime.now().isoformat()
             }
             
-            message_json = json.dumps(message)
-            message_bytes = message_json.encode('utf-8')
+            message_bytes = self.peer_codecs.get(peer_id, JSON).encode(message)
             
             peer_socket = self.peer_connections[peer_id][2]
             
             header = struct.pack('!Q', len(message_bytes))
+            started = time.monotonic()
             peer_socket.sendall(header + message_bytes)
+            elapsed = time.monotonic() - started
+            metrics.histogram("media_send_seconds", "Time to write one media transfer",
+                              media_type=str(media_type)).record(elapsed)
+            metrics.counter("media_sent_bytes_total", "Media transfer bytes written").inc(len(header) + len(message_bytes))
             
             self.logger.log_data_transaction(
                 "send",
                 self.peer_connections[peer_id][0],
                 self.peer_connections[peer_id][1],
                 f"media_{media_type}",
-                len(media_data_b64)
+                len(media_data_b64),
+                elapsed
             )
             
             return True
             
         except Exception as e:
-            logging.error(f"Error sending media to peer {peer_id}: {str(e)}")
+            self.network_logger.error(f"Error sending media to peer {peer_id}: {str(e)}")
             
             if peer_id in self.peer_connections:
                 try:
@@ -430,7 +445,7 @@ class MediaTransferNode:
             
     def connect_to_peer(self, peer_id, peer_username, peer_address, peer_port):
         if peer_id in self.peer_connections:
-            logging.info(f"Already connected to peer {peer_id}")
+            self.network_logger.info(f"Already connected to peer {peer_id}")
             return True
             
         try:
@@ -442,6 +457,7 @@ class MediaTransferNode:
             auth_message = {
                 "user_id": self.user_id,
                 "username": self.username,
+                "formats": list(WIRE_FORMATS),
                 "timestamp": datetime.now().isoformat()
             }
             client_socket.send(json.dumps(auth_message).encode('utf-8'))
@@ -450,11 +466,12 @@ class MediaTransferNode:
             response = json.loads(response_data.decode('utf-8'))
             
             if response.get('status') != 'authenticated':
-                logging.error(f"Failed to authenticate with peer {peer_id}")
+                self.network_logger.error(f"Failed to authenticate with peer {peer_id}")
                 client_socket.close()
                 return False
                 
             self.peer_connections[peer_id] = (peer_address, peer_port, client_socket)
+            self.peer_codecs[peer_id] = get_codec(response.get('format'))
             
             self.logger.log_connection(
                 peer_address,
@@ -472,7 +489,7 @@ class MediaTransferNode:
             return True
             
         except Exception as e:
-            logging.error(f"Error connecting to peer {peer_id}: {str(e)}")
+            self.network_logger.error(f"Error connecting to peer {peer_id}: {str(e)}")
             return False
             
     def _handle_peer_connection(self, client_socket, address, peer_id, peer_username):
@@ -498,7 +515,7 @@ class MediaTransferNode:
                     buffer += chunk
                     
                     if len(buffer) == message_size:
-                        message = json.loads(buffer.decode('utf-8'))
+                        message = decode(buffer)
                         self._handle_peer_message(message, peer_id, peer_username)
                         
                         buffer = b''
@@ -507,7 +524,7 @@ class MediaTransferNode:
                 except socket.timeout:
                     continue
                 except Exception as e:
-                    logging.error(f"Error handling messages from peer {peer_id}: {str(e)}")
+                    self.network_logger.error(f"Error handling messages from peer {peer_id}: {str(e)}")
                     break
                     
             if peer_id in self.peer_connections:
@@ -521,7 +538,7 @@ class MediaTransferNode:
             )
             
         except Exception as e:
-            logging.error(f"Error in peer connection handler for {peer_id}: {str(e)}")
+            self.network_logger.error(f"Error in peer connection handler for {peer_id}: {str(e)}")
         finally:
             client_socket.close()
             
@@ -558,4 +575,4 @@ class MediaTransferNode:
         
         self.logger.close()
         
-        logging.info(f"Stopped media transfer node on port {self.media_port}") 
\ No newline at end of file
+        self.network_logger.info(f"Stopped media transfer node on port {self.media_port}") 
\ No newline at end of file
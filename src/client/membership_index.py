@@ -0,0 +1,122 @@
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class MembershipIndex:
+    """Per-channel member sets and role maps for constant-time authorization.
+
+    Channels that were never loaded answer None so the caller can hydrate
+    them; denials are cached for a short time because members may join from
+    another client without this host hearing about it. Loaded channels
+    expire after positive_ttl for the same reason with leaves.
+    """
+
+    def __init__(self, negative_ttl: float = 5.0, positive_ttl: Optional[float] = None):
+        self.negative_ttl = negative_ttl
+        self.positive_ttl = positive_ttl
+        self._roles: Dict[int, Dict[int, str]] = {}  # channel_id -> {user_id: role}
+        self._loaded_at: Dict[int, float] = {}  # channel_id -> monotonic load time
+        self._owners: Dict[int, int] = {}  # channel_id -> owner_id
+        self._denied: Dict[Tuple[int, int], float] = {}  # (channel_id, user_id) -> expiry
+        self._listeners: List[Callable[[Optional[int]], None]] = []
+        self._lock = threading.Lock()
+
+    def load_channel(self, channel_id: int, owner_id: int, members: Iterable[Tuple[int, str]]):
+        roles = {user_id: role or "member" for user_id, role in members}
+        if owner_id is not None:
+            roles[owner_id] = "owner"
+
+        with self._lock:
+            self._roles[channel_id] = roles
+            self._owners[channel_id] = owner_id
+            self._loaded_at[channel_id] = time.monotonic()
+            self._clear_denied(channel_id)
+
+    def is_loaded(self, channel_id: int) -> bool:
+        return channel_id in self._roles
+
+    def is_member(self, channel_id: int, user_id: int) -> Optional[bool]:
+        roles = self._fresh_roles(channel_id)
+        if roles is None:
+            return None
+        return user_id in roles
+
+    def get_role(self, channel_id: int, user_id: int) -> Optional[str]:
+        roles = self._fresh_roles(channel_id)
+        if roles is None:
+            return None
+        return roles.get(user_id)
+
+    def get_owner(self, channel_id: int) -> Optional[int]:
+        return self._owners.get(channel_id)
+
+    def members(self, channel_id: int) -> Dict[int, str]:
+        with self._lock:
+            return dict(self._roles.get(channel_id, {}))
+
+    def member_count(self, channel_id: int) -> int:
+        return len(self._roles.get(channel_id, ()))
+
+    def add_member(self, channel_id: int, user_id: int, role: str = "member"):
+        with self._lock:
+            roles = self._roles.get(channel_id)
+            if roles is not None:
+                roles[user_id] = role
+            self._denied.pop((channel_id, user_id), None)
+
+    def remove_member(self, channel_id: int, user_id: int):
+        with self._lock:
+            roles = self._roles.get(channel_id)
+            if roles is not None and roles.get(user_id) != "owner":
+                roles.pop(user_id, None)
+
+    def remember_denied(self, channel_id: int, user_id: int):
+        with self._lock:
+            self._denied[(channel_id, user_id)] = time.monotonic() + self.negative_ttl
+
+    def recently_denied(self, channel_id: int, user_id: int) -> bool:
+        expiry = self._denied.get((channel_id, user_id))
+        if expiry is None:
+            return False
+        if expiry < time.monotonic():
+            with self._lock:
+                self._denied.pop((channel_id, user_id), None)
+            return False
+        return True
+
+    def invalidate(self, channel_id: Optional[int] = None):
+        """Forget one channel (or all of them when channel_id is None)"""
+        with self._lock:
+            if channel_id is None:
+                self._roles.clear()
+                self._owners.clear()
+                self._loaded_at.clear()
+                self._denied.clear()
+            else:
+                self._roles.pop(channel_id, None)
+                self._owners.pop(channel_id, None)
+                self._loaded_at.pop(channel_id, None)
+                self._clear_denied(channel_id)
+
+        for listener in list(self._listeners):
+            listener(channel_id)
+
+    def add_invalidation_listener(self, callback: Callable[[Optional[int]], None]):
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    def _fresh_roles(self, channel_id: int) -> Optional[Dict[int, str]]:
+        roles = self._roles.get(channel_id)
+        if roles is None or self.positive_ttl is None:
+            return roles
+        loaded_at = self._loaded_at.get(channel_id)
+        if loaded_at is not None and time.monotonic() - loaded_at > self.positive_ttl:
+            # Members may have left from another client, reload from the database
+            self.invalidate(channel_id)
+            return None
+        return roles
+
+    def _clear_denied(self, channel_id: int):
+        for key in [key for key in self._denied if key[0] == channel_id]:
+            del self._denied[key]
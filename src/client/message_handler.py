@@ -1,4 +1,4 @@
-from database.models import ChannelMembership, Message, User, Channel
+from database.models import ChannelMembership, Message, User, Channel, add_channel_message
 from database.config import SessionLocal
 import logging
 from datetime import datetime, timedelta
@@ -18,13 +18,12 @@ class MessageHandler:
             if not membership:
                 return False, "Not a member of this channel"
             
-            new_message = Message(
+            add_channel_message(
+                db,
                 content=content,
                 sender_id=self.current_user_id,
                 channel_id=channel_id
             )
-            db.add(new_message)
-            db.commit()
             
             return True, "Message sent successfully"
             
@@ -0,0 +1,231 @@
+from typing import Dict, Iterable, List, Optional
+
+# Rough per-message bookkeeping cost on top of the field values
+MESSAGE_OVERHEAD_BYTES = 64
+
+
+def estimate_message_size(message: dict) -> int:
+    size = MESSAGE_OVERHEAD_BYTES
+    for value in message.values():
+        if isinstance(value, str):
+            size += len(value)
+        else:
+            size += 8
+    return size
+
+
+class ChannelHistory:
+    """Fixed-capacity ring buffer of a channel's most recent messages.
+
+    Messages are kept in ascending id order, so paging is a binary search over
+    the ring and appending the newest message never shifts existing entries.
+    The oldest messages are evicted once either the entry capacity or the
+    byte budget is exceeded.
+    """
+
+    def __init__(self, capacity: int = 200, max_bytes: Optional[int] = None):
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self._slots: List[Optional[dict]] = [None] * capacity
+        self._ids: List[int] = [0] * capacity
+        self._sizes: List[int] = [0] * capacity
+        self._start = 0
+        self._count = 0
+        self._bytes = 0
+        self._base = 0  # absolute position of the oldest entry
+        self._positions: Dict[int, int] = {}  # message id -> absolute position
+        # True while the ring still holds every message the channel ever had
+        self.complete = True
+        self._evicted_id: Optional[int] = None  # newest message dropped so far
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    @property
+    def evicted_id(self) -> Optional[int]:
+        return self._evicted_id
+
+    @property
+    def oldest_id(self) -> Optional[int]:
+        return self._ids[self._start] if self._count else None
+
+    @property
+    def newest_id(self) -> Optional[int]:
+        return self._ids[self._slot(self._count - 1)] if self._count else None
+
+    def _slot(self, index: int) -> int:
+        return (self._start + index) % self.capacity
+
+    def _bisect_left(self, message_id: int) -> int:
+        low, high = 0, self._count
+        while low < high:
+            mid = (low + high) // 2
+            if self._ids[self._slot(mid)] < message_id:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def _index_of(self, message_id: int) -> Optional[int]:
+        position = self._positions.get(message_id)
+        if position is None:
+            return None
+        return position - self._base
+
+    def _evict_oldest(self):
+        slot = self._start
+        self._evicted_id = self._ids[slot]
+        self._positions.pop(self._ids[slot], None)
+        self._bytes -= self._sizes[slot]
+        self._slots[slot] = None
+        self._start = (self._start + 1) % self.capacity
+        self._count -= 1
+        self._base += 1
+        self.complete = False
+
+    def append(self, message: dict):
+        message_id = message["id"]
+
+        index = self._index_of(message_id)
+        if index is not None:
+            slot = self._slot(index)
+            self._bytes -= self._sizes[slot]
+            self._sizes[slot] = estimate_message_size(message)
+            self._bytes += self._sizes[slot]
+            self._slots[slot] = message
+            return
+
+        newest_id = self.newest_id
+        if newest_id is not None and message_id < newest_id:
+            self._insert_out_of_order(message)
+            return
+
+        if self._count == self.capacity:
+            self._evict_oldest()
+
+        slot = self._slot(self._count)
+        size = estimate_message_size(message)
+        self._slots[slot] = message
+        self._ids[slot] = message_id
+        self._sizes[slot] = size
+        self._positions[message_id] = self._base + self._count
+        self._count += 1
+        self._bytes += size
+
+        while self.max_bytes is not None and self._bytes > self.max_bytes and self._count > 1:
+            self._evict_oldest()
+
+    def _insert_out_of_order(self, message: dict):
+        # Rare: a write that committed after a newer one. Rebuild in order.
+        if self._count and message["id"] < self.oldest_id and not self.complete:
+            return  # Older than anything we hold, the DB still serves it
+        messages = self.oldest_first()
+        messages.insert(self._bisect_left(message["id"]), message)
+        complete, evicted_id = self.complete, self._evicted_id
+        self.clear()
+        self.complete, self._evicted_id = complete, evicted_id
+        self.extend(messages)
+
+    def extend(self, messages: Iterable[dict]):
+        """Append messages given in ascending id order"""
+        for message in messages:
+            self.append(message)
+
+    def restore(self, messages: List[dict], complete: bool, evicted_id: Optional[int]):
+        """Refill from a snapshot taken with oldest_first(), filling the slots
+        directly instead of appending one message at a time"""
+        self.clear()
+        sizes = [estimate_message_size(message) for message in messages]
+
+        # Keep the newest messages that fit both limits
+        start = max(0, len(messages) - self.capacity)
+        total = sum(sizes[start:])
+        while self.max_bytes is not None and total > self.max_bytes and len(messages) - start > 1:
+            total -= sizes[start]
+            start += 1
+        if start:
+            evicted_id = max(evicted_id or 0, messages[start - 1]["id"])
+            complete = False
+
+        for index, message in enumerate(messages[start:]):
+            self._slots[index] = message
+            self._ids[index] = message["id"]
+            self._sizes[index] = sizes[start + index]
+            self._positions[message["id"]] = index
+        self._count = len(messages) - start
+        self._bytes = total
+        self.complete = complete
+        self._evicted_id = evicted_id
+
+    def clear(self):
+        self._slots = [None] * self.capacity
+        self._start = 0
+        self._count = 0
+        self._bytes = 0
+        self._base = 0
+        self._positions.clear()
+        self.complete = True
+        self._evicted_id = None
+
+    def oldest_first(self) -> List[dict]:
+        return [self._slots[self._slot(i)] for i in range(self._count)]
+
+    def _newest_first(self, end: int, limit: int) -> List[dict]:
+        start = max(0, end - limit)
+        return [self._slots[self._slot(i)] for i in range(end - 1, start - 1, -1)]
+
+    def latest(self, limit: int) -> List[dict]:
+        """The newest messages, newest first"""
+        return self._newest_first(self._count, limit)
+
+    def before(self, before_id: int, limit: int) -> List[dict]:
+        """Messages older than before_id, newest first"""
+        end = self._index_of(before_id)
+        if end is None:
+            end = self._bisect_left(before_id)
+        return self._newest_first(end, limit)
+
+    def covers_after(self, after_id: int) -> bool:
+        """Whether every message with id > after_id is held in the ring"""
+        if self.complete or not self._count:
+            return self.complete
+        if self._evicted_id is not None and after_id >= self._evicted_id:
+            return True
+        return after_id >= self.oldest_id - 1
+
+    def since(self, after_id: int) -> List[dict]:
+        """Messages newer than after_id, oldest first"""
+        start = self._bisect_left(after_id + 1)
+        return [self._slots[self._slot(i)] for i in range(start, self._count)]
+
+    @property
+    def newest_seq(self) -> Optional[int]:
+        return self._slots[self._slot(self._count - 1)].get("seq") if self._count else None
+
+    def _bisect_seq(self, seq: int) -> int:
+        # seq grows with id within a channel, so the ring is in seq order too
+        low, high = 0, self._count
+        while low < high:
+            mid = (low + high) // 2
+            if (self._slots[self._slot(mid)].get("seq") or 0) <= seq:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def covers_after_seq(self, after_seq: int) -> bool:
+        """Whether every message with seq > after_seq is held in the ring"""
+        if self.complete or not self._count:
+            return self.complete
+        oldest_seq = self._slots[self._start].get("seq")
+        return oldest_seq is not None and after_seq >= oldest_seq - 1
+
+    def since_seq(self, after_seq: int, limit: Optional[int] = None) -> List[dict]:
+        """Messages with seq > after_seq, oldest first"""
+        start = self._bisect_seq(after_seq)
+        end = self._count if limit is None else min(self._count, start + limit)
+        return [self._slots[self._slot(i)] for i in range(start, end)]
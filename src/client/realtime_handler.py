@@ -3,22 +3,61 @@ import socket
 import threading
 import json
 import logging
-from typing import Dict, List, Optional
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from src.common.framing import send_frame, recv_frame
+from src.common.codec import JSON, decode, get_codec, negotiate
+from src.common import metrics
+from src.client.event_bus import InboundEventBus
+from src.client.config import (REALTIME_ACK_TIMEOUT, REALTIME_MAX_RETRY_DELAY,
+                               REALTIME_MESSAGE_TTL, REALTIME_DEDUP_WINDOW,
+                               REALTIME_BATCH_WINDOW_MS, REALTIME_HELLO_TIMEOUT,
+                               WIRE_FORMATS, CLIENT_HOST)
 
 class RealtimeHandler(QObject):
     # Signals
     friend_request_received = Signal(dict) 
     friend_request_accepted = Signal(dict)  
     friend_request_rejected = Signal(dict)  
-    message_received = Signal(dict)  
+    messages_received = Signal(list)
     status_changed = Signal(dict)  
     
-    def __init__(self, port: int):
+    def __init__(self, port: int, outbox_path: Optional[str] = None,
+                 user_id: Optional[int] = None, directory=None):
         super().__init__()
+        self.network_logger = logging.getLogger('network.realtime')
         self.port = port
+        self.user_id = user_id
+        # ChannelDirectory where peers publish their realtime ports
+        self.directory = directory
         self.connections: Dict[int, socket.socket] = {}  # user_id -> socket
+        self.peers: Dict[int, Tuple[str, int]] = {}  # user_id -> (host, port)
+        self.peer_codecs = {}  # user_id -> wire format agreed on our connection to them
         self.listen_thread = None
+        self.retry_thread = None
         self.running = False
+
+        # Outbox of messages waiting for a receiver ack: msg_id -> entry
+        self.outbox_path = outbox_path
+        self.outbox: "OrderedDict[str, dict]" = OrderedDict()
+        self.outbox_lock = threading.Lock()
+        self.outbox_dirty = False
+        self.save_lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.retry_event = threading.Event()
+
+        # Recently processed msg_ids, used to drop redelivered messages
+        self.seen_ids: "OrderedDict[str, None]" = OrderedDict()
+        self.seen_lock = threading.Lock()
+
+        # Inbound events reach the UI in batches rather than one signal each
+        self.event_bus = InboundEventBus(REALTIME_BATCH_WINDOW_MS, self)
+        self.event_bus.batch_ready.connect(self._dispatch_batch)
+
+        self.load_outbox()
         
     def start(self):
         self.running = True
@@ -26,14 +65,24 @@ class RealtimeHandler(QObject):
         self.listen_thread.daemon = True
         self.listen_thread.start()
         
+        self.retry_thread = threading.Thread(target=self._retry_loop, daemon=True)
+        self.retry_thread.start()
+
+        if self.directory is not None and self.user_id is not None:
+            self.directory.register_peer(self.user_id, CLIENT_HOST, self.port)
+
     def stop(self):
         self.running = False
-        for sock in self.connections.values():
+        self.retry_event.set()
+        if self.directory is not None and self.user_id is not None:
+            self.directory.unregister_peer(self.user_id)
+        for sock in list(self.connections.values()):
             try:
                 sock.close()
             except:
                 pass
         self.connections.clear()
+        self.save_outbox()
         
     def _listen_for_connections(self):
         server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -44,74 +93,305 @@ class RealtimeHandler(QObject):
         while self.running:
             try:
                 client_socket, address = server_socket.accept()
-                threading.Thread(target=self._handle_connection, args=(client_socket,)).start()
+                threading.Thread(target=self._handle_connection, args=(client_socket,), daemon=True).start()
             except:
                 break
                 
         server_socket.close()
         
     def _handle_connection(self, sock: socket.socket):
+        codec = JSON  # until the peer says hello
         try:
             while self.running:
-                data = sock.recv(4096)
-                if not data:
+                data = recv_frame(sock)
+                if data is None:
                     break
                     
-                message = json.loads(data.decode())
-                self._process_message(message)
+                message = decode(data)
+                if message.get("type") == "hello":
+                    # Answered in JSON, the peer switches once it reads it
+                    codec = negotiate(message.get("formats"))
+                    send_frame(sock, JSON.encode({"type": "hello", "format": codec.name}))
+                    continue
+                self._receive(message, sock, codec)
         except:
             pass
         finally:
             sock.close()
             
-    def _process_message(self, message: dict):
-        message_type = message.get("type")
-        if not message_type:
+    def _receive(self, message: dict, sock: socket.socket, codec=JSON):
+        if message.get("type") == "ack":
+            self._handle_ack(message.get("msg_id"))
             return
             
-        if message_type == "friend_request":
-            self.friend_request_received.emit(message)
-        elif message_type == "friend_request_accepted":
-            self.friend_request_accepted.emit(message)
-        elif message_type == "friend_request_rejected":
-            self.friend_request_rejected.emit(message)
-        elif message_type == "message":
-            self.message_received.emit(message)
-        elif message_type == "status_change":
-            self.status_changed.emit(message)
+        msg_id = message.get("msg_id")
+        if msg_id:
+            # Ack every copy, the sender may have missed the previous ack
+            try:
+                send_frame(sock, codec.encode({"type": "ack", "msg_id": msg_id}))
+            except Exception as e:
+                self.network_logger.error(f"Error sending ack for {msg_id}: {str(e)}")
+
+            if self._already_seen(msg_id):
+                return
+
+        self._process_message(message)
+
+    def _already_seen(self, msg_id: str) -> bool:
+        with self.seen_lock:
+            if msg_id in self.seen_ids:
+                return True
+            self.seen_ids[msg_id] = None
+            while len(self.seen_ids) > REALTIME_DEDUP_WINDOW:
+                self.seen_ids.popitem(last=False)
+            return False
+
+    def _process_message(self, message: dict):
+        if message.get("type"):
+            self.event_bus.post(message)
+
+    def _dispatch_batch(self, events: List[dict]):
+        messages = []
+        for message in events:
+            message_type = message["type"]
+
+            if message_type == "friend_request":
+                self.friend_request_received.emit(message)
+            elif message_type == "friend_request_accepted":
+                self.friend_request_accepted.emit(message)
+            elif message_type == "friend_request_rejected":
+                self.friend_request_rejected.emit(message)
+            elif message_type == "message":
+                messages.append(message)
+            elif message_type == "status_change":
+                self.status_changed.emit(message)
+
+        if messages:
+            self.messages_received.emit(messages)
             
     def connect_to_user(self, user_id: int, host: str, port: int) -> bool:
+        self.peers[user_id] = (host, port)
         if user_id in self.connections:
             return True
             
         try:
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             sock.connect((host, port))
+            self.peer_codecs[user_id] = self._say_hello(sock)
             self.connections[user_id] = sock
+
+            # Acks for our messages come back on the outgoing connection
+            threading.Thread(target=self._read_acks, args=(user_id, sock), daemon=True).start()
+
+            self.retry_event.set()
             return True
         except Exception as e:
-            logging.error(f"Error connecting to user {user_id}: {str(e)}")
+            self.network_logger.error(f"Error connecting to user {user_id}: {str(e)}")
             return False
             
-    def send_message(self, user_id: int, message: dict) -> bool:
-        if user_id not in self.connections:
+    def _say_hello(self, sock: socket.socket):
+        """Agree on a wire format for what we send on sock; peers that do not
+        answer get JSON"""
+        if WIRE_FORMATS == ("json",):
+            return JSON
+        try:
+            sock.settimeout(REALTIME_HELLO_TIMEOUT)
+            send_frame(sock, JSON.encode({"type": "hello", "formats": list(WIRE_FORMATS)}))
+            data = recv_frame(sock)
+            answer = decode(data) if data else {}
+            return get_codec(answer.get("format")) if answer.get("type") == "hello" else JSON
+        except socket.timeout:
+            return JSON
+        finally:
+            sock.settimeout(None)
+
+    def _read_acks(self, user_id: int, sock: socket.socket):
+        try:
+            while self.running:
+                data = recv_frame(sock)
+                if data is None:
+                    break
+                self._receive(decode(data), sock, self.peer_codecs.get(user_id, JSON))
+        except:
+            pass
+        finally:
+            self._drop_connection(user_id, sock)
+
+    def _drop_connection(self, user_id: int, sock: socket.socket):
+        if self.connections.get(user_id) is sock:
+            del self.connections[user_id]
+        try:
+            sock.close()
+        except:
+            pass
+
+    def send_message(self, user_id: int, message: dict) -> str:
+        """Queue a message in the outbox and return its msg_id.
+
+        The retry thread delivers it, saves the outbox once for everything
+        queued since its last pass and resends until acknowledged or expired,
+        so callers on the UI thread never wait for the network or the disk.
+        """
+        message = dict(message)
+        message.setdefault("msg_id", uuid.uuid4().hex)
+
+        with self.outbox_lock:
+            self.outbox[message["msg_id"]] = {
+                "user_id": user_id,
+                "message": message,
+                "attempts": 0,
+                "created_at": time.time(),
+                "next_retry": 0
+            }
+            self.outbox_dirty = True
+        self.retry_event.set()
+
+        return message["msg_id"]
+
+    def _transmit(self, msg_id: str) -> bool:
+        with self.outbox_lock:
+            entry = self.outbox.get(msg_id)
+            if entry is None:
+                return True
+            user_id = entry["user_id"]
+            entry["attempts"] += 1
+            delay = min(REALTIME_ACK_TIMEOUT * (2 ** (entry["attempts"] - 1)), REALTIME_MAX_RETRY_DELAY)
+            entry["next_retry"] = time.time() + delay
+            message = entry["message"]
+
+        if user_id not in self.connections and user_id in self.peers:
+            host, port = self.peers[user_id]
+            if not self.connect_to_user(user_id, host, port):
+                # The peer may be back on another port, look it up again next time
+                self.peers.pop(user_id, None)
+
+        sock = self.connections.get(user_id)
+        if sock is None:
             return False
             
         try:
-            sock = self.connections[user_id]
-            sock.send(json.dumps(message).encode())
+            data = self.peer_codecs.get(user_id, JSON).encode(message)
+            started = time.perf_counter()
+            with self.send_lock:
+                send_frame(sock, data)
+            metrics.histogram("realtime_send_seconds", "Time to write a realtime frame").record(
+                time.perf_counter() - started)
+            metrics.counter("realtime_sent_bytes_total", "Realtime payload bytes written").inc(len(data))
+            metrics.counter("realtime_sends_total", "Realtime frames written",
+                            retry=str(entry["attempts"] > 1).lower()).inc()
             return True
         except Exception as e:
-            logging.error(f"Error sending message to user {user_id}: {str(e)}")
+            self.network_logger.error(f"Error sending message to user {user_id}: {str(e)}")
+            metrics.counter("realtime_send_errors_total", "Realtime frames that could not be written").inc()
+            self._drop_connection(user_id, sock)
             return False
+
+    def _handle_ack(self, msg_id: Optional[str]):
+        with self.outbox_lock:
+            entry = self.outbox.pop(msg_id, None) if msg_id else None
+            if entry is not None:
+                self.outbox_dirty = True
+        if entry is not None:
+            # From send_message() to the receiver's ack, retries included
+            metrics.histogram("realtime_delivery_seconds", "Realtime message send to ack").record(
+                time.time() - entry["created_at"])
+
+    def _retry_loop(self):
+        while self.running:
+            self.retry_event.wait(REALTIME_ACK_TIMEOUT)
+            self.retry_event.clear()
+            if not self.running:
+                break
+
+            now = time.time()
+            due = []
+            recipients = set()
+            with self.outbox_lock:
+                for msg_id, entry in list(self.outbox.items()):
+                    if now - entry["created_at"] > REALTIME_MESSAGE_TTL:
+                        self.network_logger.warning(f"Dropping undelivered message {msg_id} for user {entry['user_id']}")
+                        del self.outbox[msg_id]
+                        self.outbox_dirty = True
+                    elif entry["next_retry"] <= now:
+                        due.append(msg_id)
+                        recipients.add(entry["user_id"])
+
+            # New entries are written before they go out, so a crash mid-send
+            # still leaves them in the outbox
+            if self.outbox_dirty:
+                self.save_outbox()
+
+            self._resolve_peers(recipients - set(self.connections) - set(self.peers))
+            for msg_id in due:
+                self._transmit(msg_id)
+
+            if self.outbox_dirty:
+                self.save_outbox()
+
+    def _resolve_peers(self, user_ids):
+        """Find where the given peers listen, in one directory request"""
+        if not user_ids or self.directory is None:
+            return
+        try:
+            self.peers.update(self.directory.lookup_peers(user_ids))
+        except Exception as e:
+            self.network_logger.error(f"Error looking up realtime peers: {str(e)}")
+
+    def load_outbox(self):
+        if not self.outbox_path or not os.path.exists(self.outbox_path):
+            return
+
+        try:
+            with open(self.outbox_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            with self.outbox_lock:
+                for entry in entries:
+                    entry["next_retry"] = 0
+                    self.outbox[entry["message"]["msg_id"]] = entry
+            self.network_logger.info(f"Loaded {len(entries)} pending realtime messages from {self.outbox_path}")
+        except Exception as e:
+            self.network_logger.error(f"Error loading realtime outbox: {str(e)}")
+
+    def save_outbox(self):
+        if not self.outbox_path:
+            return
+
+        with self.save_lock:
+            with self.outbox_lock:
+                entries = list(self.outbox.values())
+                self.outbox_dirty = False
+            self._write_outbox(entries)
+
+    def _write_outbox(self, entries: List[dict]):
+        try:
+            directory = os.path.dirname(self.outbox_path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+
+            tmp_path = self.outbox_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.outbox_path)
+        except Exception as e:
+            self.network_logger.error(f"Error saving realtime outbox: {str(e)}")
+
+    def pending_count(self) -> int:
+        with self.outbox_lock:
+            return len(self.outbox)
             
     def broadcast_message(self, message: dict, exclude_user_ids: List[int] = None):
         if exclude_user_ids is None:
             exclude_user_ids = []
             
-        for user_id, sock in self.connections.items():
+        # Presence updates are not worth retrying, a stale one is superseded anyway
+        encoded = {}  # codec name -> payload, each format is encoded once
+        for user_id, sock in list(self.connections.items()):
             if user_id not in exclude_user_ids:
+                codec = self.peer_codecs.get(user_id, JSON)
+                if codec.name not in encoded:
+                    encoded[codec.name] = codec.encode(message)
                 try:
-                    sock.send(json.dumps(message).encode())
+                    with self.send_lock:
+                        send_frame(sock, encoded[codec.name])
                 except:
-                    pass 
\ No newline at end of file
+                    pass 
@@ -1,32 +1,121 @@
 import os
 import time
+import gzip
+import shutil
+import struct
+import queue
+import atexit
 import logging
+import threading
 from datetime import datetime
+from src.client.config import (LOG_QUEUE_SIZE, LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL,
+                               LOG_OVERFLOW_POLICY, LOG_BLOCK_TIMEOUT, MAX_LOG_SIZE,
+                               LOG_ROTATE_INTERVAL, LOG_RETENTION_BYTES)
+from src.client.transaction_log import TransactionLogWriter, TAG_DATA, TAG_CONNECTION, EXTENSION
+from src.client import log_routing
 
 class SystemLogger:
+    """Network log file written by a background thread.
 
-    def __init__(self, log_dir="logs", max_entries=10000, filename=None):
+    log() only queues the entry; the writer formats, writes and flushes in
+    batches. When the queue is full the entry is dropped and counted (the
+    count is written to the log) or, with the "block" policy, the caller
+    waits up to LOG_BLOCK_TIMEOUT for room.
+
+    Connection and data events are also written as binary records to a .tx
+    file beside the text log, for src/client/transaction_log.py to report on.
+
+    Files rotate after max_entries, max_bytes or rotate_interval, whichever
+    comes first. Rotated files are gzipped in the background and the oldest
+    are deleted once the directory holds more than retention_bytes.
+    """
+    
+    _shared = None
+    _shared_lock = threading.Lock()
+    
+    def __init__(self, log_dir="logs", max_entries=10000, filename=None,
+                 queue_size=LOG_QUEUE_SIZE, batch_size=LOG_BATCH_SIZE,
+                 flush_interval=LOG_FLUSH_INTERVAL, overflow_policy=LOG_OVERFLOW_POLICY,
+                 max_bytes=MAX_LOG_SIZE, rotate_interval=LOG_ROTATE_INTERVAL,
+                 retention_bytes=LOG_RETENTION_BYTES):
         self.log_dir = log_dir
         self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.retention_bytes = retention_bytes
         self.entry_count = 0
+        self.bytes_written = 0
+        self.rotate_at = 0.0
+        self.is_shared = False
+        self.archive_lock = threading.Lock()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.reported_dropped = 0
+        self.writer_thread = None
+        self.writer_lock = threading.Lock()
+        self.log_handler = None
         
         if not os.path.exists(log_dir):
             os.makedirs(log_dir)
-            
+        
         if filename is None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"network_log_{timestamp}.txt"
-            
-        self.log_path = os.path.join(log_dir, filename)
+            self.log_path = self.new_log_path()
+        else:
+            self.log_path = os.path.join(log_dir, filename)
         self.current_log_file = None
+        self.transactions = None
         self.open_log_file()
+        self.start_writer()
+        # Trim whatever earlier runs left behind
+        threading.Thread(target=self.archive, args=([],), daemon=True).start()
         
         self.setup_logging()
     
+    @classmethod
+    def shared(cls):
+        """The process-wide logger, created on first use.
+
+        Holders may call close() on it as they would on their own logger; the
+        files stay open until the process exits.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                logger = cls()
+                logger.is_shared = True
+                atexit.register(logger.shutdown)
+                cls._shared = logger
+            return cls._shared
+    
+    @staticmethod
+    def unique_path(base, extension):
+        path = base + extension
+        suffix = 1
+        while os.path.exists(path) or os.path.exists(path + ".gz"):
+            # Rotations within the same second share a timestamp
+            path = f"{base}_{suffix}{extension}"
+            suffix += 1
+        return path
+    
+    def new_log_path(self):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        return self.unique_path(os.path.join(self.log_dir, f"network_log_{timestamp}"), ".txt")
+    
     def open_log_file(self):
-        self.current_log_file = open(self.log_path, 'a', encoding='ascii')
+        self.current_log_file = open(self.log_path, 'a', encoding='utf-8', errors='replace')
+        self.bytes_written = self.current_log_file.tell()
+        self.rotate_at = time.time() + self.rotate_interval
+        self.open_transaction_log()
         self.log_startup_info()
     
+    def open_transaction_log(self):
+        if self.transactions:
+            self.transactions.close()
+        path = self.unique_path(os.path.splitext(self.log_path)[0], EXTENSION)
+        self.transactions = TransactionLogWriter(path, time.time())
+    
     def log_startup_info(self):
         startup_msg = f"=== Log Started at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n"
         startup_msg += f"Max Entries: {self.max_entries}\n"
@@ -40,65 +129,234 @@ class SystemLogger:
             def __init__(self, system_logger):
                 super().__init__()
                 self.system_logger = system_logger
-                
+            
             def emit(self, record):
                 log_entry = self.format(record)
                 self.system_logger.log(log_entry, from_handler=True)
-                
+        
         handler = SystemLogHandler(self)
         handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
         
-        logger = logging.getLogger('network')
-        logger.setLevel(logging.INFO)
-        logger.addHandler(handler)
+        # Replaces the previous logger's sink rather than adding another one
+        self.log_handler = log_routing.install().add_sink("system", handler)
+    
+    def start_writer(self):
+        with self.writer_lock:
+            if self.writer_thread is None or not self.writer_thread.is_alive():
+                self.writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+                self.writer_thread.start()
     
     def log(self, message, from_handler=False):
+        self._enqueue((time.time(), message, from_handler, None))
+    
+    def _enqueue(self, entry):
         if self.current_log_file is None:
+            # Logging after close() reopens the file, as it always has
             try:
                 self.open_log_file()
+                self.start_writer()
                 self.log("WARNING: Log file was None, reopened successfully")
             except Exception as e:
                 return
-                
-        if self.entry_count >= self.max_entries:
-            self.rotate_log()
-            
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
-        if not from_handler:
-            log_entry = f"{timestamp} - {message}\n"
-        else:
-            log_entry = f"{message}\n"
         
-        try:    
-            self.current_log_file.write(log_entry)
-            self.current_log_file.flush()
-            self.entry_count += 1
+        # Formatting and I/O happen on the writer thread
+        try:
+            if self.overflow_policy == "block":
+                self.queue.put(entry, timeout=LOG_BLOCK_TIMEOUT)
+            else:
+                self.queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+    
+    def _writer_loop(self):
+        last_flush = time.monotonic()
+        pending_flush = False
+        stamp_second = None
+        stamp = ""
+        while True:
+            try:
+                first = self.queue.get(timeout=self.flush_interval if pending_flush else None)
+            except queue.Empty:
+                self._flush()
+                pending_flush = False
+                continue
+            
+            batch = [first]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            lines = []
+            stop = False
+            for entry in batch:
+                if entry is None:
+                    stop = True
+                    break
+                created, message, from_handler, record = entry
+                if from_handler:
+                    lines.append((f"{message}\n", None))
+                    continue
+                if record is not None:
+                    message = self.format_record(record)
+                    record = (created,) + record
+                second = int(created)
+                if second != stamp_second:
+                    stamp_second = second
+                    stamp = datetime.fromtimestamp(second).strftime('%Y-%m-%d %H:%M:%S')
+                lines.append((f"{stamp} - {message}\n", record))
+            
+            dropped = self.dropped
+            if dropped != self.reported_dropped:
+                lines.append((f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - WARNING: "
+                              f"{dropped - self.reported_dropped} log entries dropped, queue full\n", None))
+                self.reported_dropped = dropped
+            
+            self._write(lines)
+            pending_flush = True
+            # Flush when the queue runs dry, and at least every flush_interval under load
+            if stop or self.queue.empty() or time.monotonic() - last_flush >= self.flush_interval:
+                self._flush()
+                pending_flush = False
+                last_flush = time.monotonic()
+            if stop:
+                return
+    
+    @staticmethod
+    def format_record(record):
+        kind, action, host, port, label, size, latency = record
+        if kind == TAG_CONNECTION:
+            return f"CONNECTION - {action.upper()} - Host: {host} - Port: {port} - Status: {label}"
+        message = f"DATA - {action.upper()} - Host: {host} - Port: {port} - Type: {label} - Size: {size} bytes"
+        if latency is not None:
+            message += f" - Latency: {latency * 1000:.2f} ms"
+        return message
+    
+    def _write(self, lines):
+        start = 0
+        while start < len(lines):
+            if self.current_log_file is None:
+                return
+            if (self.entry_count >= self.max_entries or self.bytes_written >= self.max_bytes
+                    or time.time() >= self.rotate_at):
+                self.rotate_log()
+            end = min(len(lines), start + self.max_entries - self.entry_count)
+            batch = lines[start:end]
+            text = "".join(line for line, _ in batch)
+            self.bytes_written += len(text.encode('utf-8', 'replace'))
+            try:
+                self.current_log_file.write(text)
+            except (AttributeError, IOError, ValueError) as e:
+                # Write one by one so a single bad entry only loses itself
+                for line, _ in batch:
+                    try:
+                        self.current_log_file.write(line)
+                    except (AttributeError, IOError, ValueError):
+                        pass
+            try:
+                for _, record in batch:
+                    if record is not None:
+                        self.transactions.write(*record)
+            except (AttributeError, IOError, ValueError, struct.error) as e:
+                pass
+            self.entry_count += end - start
+            start = end
+    
+    def _flush(self):
+        try:
+            if self.current_log_file:
+                self.current_log_file.flush()
+            if self.transactions:
+                self.transactions.flush()
         except (AttributeError, IOError, ValueError) as e:
             pass
     
     def log_connection(self, host, port, connection_type="connect", status="success"):
-        self.log(f"CONNECTION - {connection_type.upper()} - Host: {host} - Port: {port} - Status: {status}")
+        self._enqueue((time.time(), None, False, (TAG_CONNECTION, connection_type, host, port, status, 0, None)))
     
-    def log_data_transaction(self, direction, host, port, data_type, size):
-        self.log(f"DATA - {direction.upper()} - Host: {host} - Port: {port} - Type: {data_type} - Size: {size} bytes")
+    def log_data_transaction(self, direction, host, port, data_type, size, latency=None):
+        """latency is in seconds, when the caller measured one"""
+        self._enqueue((time.time(), None, False, (TAG_DATA, direction, host, port, data_type, size, latency)))
     
     def log_channel_hosting(self, channel_id, channel_name, action, status):
         self.log(f"CHANNEL_HOSTING - {action.upper()} - Channel: {channel_name} (ID: {channel_id}) - Status: {status}")
     
     def rotate_log(self):
+        rotated = [self.log_path]
         if self.current_log_file:
             self.current_log_file.write(f"\n=== Log rotated at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} after {self.entry_count} entries ===\n")
             self.current_log_file.close()
+        if self.transactions:
+            rotated.append(self.transactions.path)
         
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.log_path = os.path.join(self.log_dir, f"network_log_{timestamp}.txt")
-        self.current_log_file = open(self.log_path, 'a', encoding='ascii')
+        self.log_path = self.new_log_path()
         self.entry_count = 0
-        self.log_startup_info()
+        self.open_log_file()
+        threading.Thread(target=self.archive, args=(rotated,), daemon=True).start()
+    
+    def archive(self, paths):
+        """Gzip rotated files, then trim the directory to retention_bytes"""
+        with self.archive_lock:
+            for path in paths:
+                try:
+                    with open(path, 'rb') as source, gzip.open(path + ".gz.tmp", 'wb', compresslevel=6) as target:
+                        shutil.copyfileobj(source, target, 1 << 20)
+                    os.replace(path + ".gz.tmp", path + ".gz")
+                    os.remove(path)
+                except OSError as e:
+                    logging.error(f"Error compressing rotated log {path}: {str(e)}")
+            self.enforce_retention()
+    
+    def enforce_retention(self):
+        # Other client processes may be writing to this directory too, so only
+        # files that are closed for sure (gzipped) or long untouched are deleted
+        open_paths = {self.log_path, self.transactions.path if self.transactions else None}
+        stale_before = time.time() - 2 * self.rotate_interval
+        candidates = []
+        total = 0
+        try:
+            # Subdirectories hold logs from when each subsystem had its own logger
+            for root, _, names in os.walk(self.log_dir):
+                for name in names:
+                    path = os.path.join(root, name)
+                    if not name.startswith("network_log_") or path in open_paths or name.endswith(".tmp"):
+                        continue
+                    stat = os.stat(path)
+                    total += stat.st_size
+                    if name.endswith(".gz") or stat.st_mtime < stale_before:
+                        candidates.append((stat.st_mtime, path, stat.st_size))
+        except OSError as e:
+            logging.error(f"Error scanning {self.log_dir} for old logs: {str(e)}")
+            return
+        
+        for _, path, size in sorted(candidates):
+            if total <= self.retention_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError as e:
+                logging.error(f"Error deleting old log {path}: {str(e)}")
     
     def close(self):
+        if self.is_shared:
+            # Other holders still log here; shutdown() runs at exit
+            return
+        self.shutdown()
+    
+    def shutdown(self):
+        log_routing.ROUTER.remove_sink("system", self.log_handler)
         try:
+            # Let the writer drain what was queued before the file goes away
+            writer = self.writer_thread
+            if writer is not None and writer.is_alive():
+                try:
+                    self.queue.put(None, timeout=LOG_BLOCK_TIMEOUT)
+                    writer.join(timeout=5.0)
+                except queue.Full:
+                    pass
+            
             if self.current_log_file:
                 try:
                     self.current_log_file.write(f"\n=== Log closed at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
@@ -108,8 +366,11 @@ class SystemLogger:
                 finally:
                     try:
                         self.current_log_file.close()
+                        if self.transactions:
+                            self.transactions.close()
                     except:
                         pass
                     self.current_log_file = None
+                    self.transactions = None
         except Exception as e:
-            pass 
\ No newline at end of file
+            pass
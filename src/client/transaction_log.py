@@ -0,0 +1,244 @@
+"""Binary transaction log written next to each SystemLogger text log.
+
+    python -m src.client.transaction_log [paths ...] [--interval 60] [--top 20]
+
+reports throughput, bytes per peer and latency percentiles over every .tx
+file found under the given files or directories (default: logs), reading
+one record at a time so rotated files of any size can be summarised.
+"""
+import argparse
+import gzip
+import math
+import os
+import struct
+import sys
+from collections import defaultdict
+from datetime import datetime
+
+# A file is HEADER (magic, version, creation time) followed by records, each
+# starting with a tag byte. Strings (actions, peers, data types) are written
+# once per file as STRING definitions and referred to by id afterwards, so an
+# event record is a fixed EVENT.size bytes.
+MAGIC = b"HPTX"
+VERSION = 1
+HEADER = struct.Struct('<4sBd')
+STRING = struct.Struct('<BHB')  # tag, id, length, then the utf-8 bytes
+EVENT = struct.Struct('<BdHHHHQf')  # tag, time, action, peer, port, label, size, latency ms
+TAG_STRING, TAG_DATA, TAG_CONNECTION = 0, 1, 2
+KINDS = {TAG_DATA: "data", TAG_CONNECTION: "connection"}
+MAX_STRINGS = 0xFFFF
+EXTENSION = ".tx"
+COMPRESSED_EXTENSION = EXTENSION + ".gz"  # rotated files, see SystemLogger.archive
+
+
+class TransactionLogWriter:
+    """Appends records to one .tx file; not thread-safe, SystemLogger's writer thread owns it"""
+
+    def __init__(self, path, created):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, created))
+        self.strings = {}
+
+    def _string_id(self, value):
+        value = str(value)
+        string_id = self.strings.get(value)
+        if string_id is None:
+            if len(self.strings) >= MAX_STRINGS:
+                value = "<other>"
+                string_id = self.strings.get(value)
+                if string_id is not None:
+                    return string_id
+            string_id = len(self.strings)
+            self.strings[value] = string_id
+            raw = value.encode('utf-8')[:255]
+            self.file.write(STRING.pack(TAG_STRING, string_id, len(raw)) + raw)
+        return string_id
+
+    def write(self, created, kind, action, peer, port, label, size=0, latency=None):
+        self.file.write(EVENT.pack(
+            kind, created, self._string_id(action), self._string_id(peer),
+            port if isinstance(port, int) and 0 <= port <= 0xFFFF else 0,
+            self._string_id(label), max(int(size or 0), 0),
+            math.nan if latency is None else latency * 1000.0
+        ))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_records(path, chunk_size=1 << 16):
+    """Yield (kind, time, action, peer, port, label, size, latency_ms) from one file"""
+    with _open(path) as f:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size or header[:4] != MAGIC:
+            raise ValueError(f"{path} is not a transaction log")
+        strings = []
+        buffer = b""
+        pos = 0
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            end = len(buffer)
+            while pos < end:
+                tag = buffer[pos]
+                if tag == TAG_STRING:
+                    if pos + STRING.size > end:
+                        break
+                    _, string_id, length = STRING.unpack_from(buffer, pos)
+                    if pos + STRING.size + length > end:
+                        break
+                    start = pos + STRING.size
+                    strings.append(buffer[start:start + length].decode('utf-8', 'replace'))
+                    pos = start + length
+                elif tag in KINDS:
+                    if pos + EVENT.size > end:
+                        break
+                    _, created, action, peer, port, label, size, latency = EVENT.unpack_from(buffer, pos)
+                    pos += EVENT.size
+                    yield (KINDS[tag], created, strings[action], strings[peer], port,
+                           strings[label], size, latency)
+                else:
+                    raise ValueError(f"{path}: unknown record tag {tag} at offset {HEADER.size + pos}")
+
+
+def _open(path):
+    return gzip.open(path, 'rb') if path.endswith(".gz") else open(path, 'rb')
+
+
+def find_logs(paths):
+    """All .tx files under paths, oldest first by creation time"""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                found.extend(os.path.join(root, name) for name in files
+                             if name.endswith(EXTENSION) or name.endswith(COMPRESSED_EXTENSION))
+        elif os.path.exists(path):
+            found.append(path)
+
+    def created(path):
+        with _open(path) as f:
+            header = f.read(HEADER.size)
+        return HEADER.unpack(header)[2] if len(header) == HEADER.size else 0.0
+
+    return sorted(found, key=created)
+
+
+class LatencyHistogram:
+    """Log-scale buckets (5% wide), so percentiles need no stored samples"""
+    GROWTH = 1.05
+
+    def __init__(self):
+        self.buckets = defaultdict(int)
+        self.count = 0
+        self.maximum = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.maximum = max(self.maximum, value)
+        self.buckets[math.ceil(math.log(max(value, 1e-3), self.GROWTH))] += 1
+
+    def percentile(self, fraction):
+        target = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                return min(self.GROWTH ** bucket, self.maximum)
+        return self.maximum
+
+
+class Report:
+    def __init__(self, interval):
+        self.interval = interval
+        self.records = 0
+        self.first = None
+        self.last = None
+        self.kinds = defaultdict(int)
+        self.total_bytes = 0
+        self.timeline = defaultdict(lambda: [0, 0])  # interval start -> [events, bytes]
+        self.peers = defaultdict(lambda: defaultdict(int))  # peer -> action -> bytes
+        self.latency = defaultdict(LatencyHistogram)  # label -> histogram
+
+    def add(self, record):
+        kind, created, action, peer, port, label, size, latency = record
+        self.records += 1
+        self.first = created if self.first is None else min(self.first, created)
+        self.last = created if self.last is None else max(self.last, created)
+        self.kinds[kind] += 1
+        if kind != "data":
+            return
+        self.total_bytes += size
+        bucket = self.timeline[int(created // self.interval) * self.interval]
+        bucket[0] += 1
+        bucket[1] += size
+        self.peers[f"{peer}:{port}"][action] += size
+        if not math.isnan(latency):
+            self.latency[label].add(latency)
+            self.latency["(all)"].add(latency)
+
+    def print(self, top, out=sys.stdout):
+        if not self.records:
+            print("No transaction records found", file=out)
+            return
+        span = max(self.last - self.first, 1e-9)
+        kinds = ", ".join(f"{count} {kind}" for kind, count in sorted(self.kinds.items()))
+        print(f"{self.records} records ({kinds}) over {span:.1f}s", file=out)
+
+        print(f"\nThroughput: {self.kinds['data'] / span:.1f} events/s, "
+              f"{self.total_bytes / span / 1024:.1f} KiB/s", file=out)
+        print(f"{'interval start':<22}{'events':>10}{'KiB':>12}{'KiB/s':>10}", file=out)
+        for start in sorted(self.timeline):
+            events, size = self.timeline[start]
+            stamp = _format_time(start)
+            print(f"{stamp:<22}{events:>10}{size / 1024:>12.1f}{size / self.interval / 1024:>10.1f}", file=out)
+
+        print(f"\nBytes per peer (top {top})", file=out)
+        actions = sorted({action for peer in self.peers.values() for action in peer})
+        print(f"{'peer':<28}" + "".join(f"{action:>12}" for action in actions) + f"{'total':>12}", file=out)
+        ranked = sorted(self.peers.items(), key=lambda item: sum(item[1].values()), reverse=True)
+        for peer, by_action in ranked[:top]:
+            print(f"{peer:<28}" + "".join(f"{by_action.get(action, 0):>12}" for action in actions)
+                  + f"{sum(by_action.values()):>12}", file=out)
+
+        if self.latency:
+            print(f"\nLatency ms (top {top} labels by count)", file=out)
+            print(f"{'label':<28}{'count':>8}{'p50':>9}{'p90':>9}{'p99':>9}{'p99.9':>9}{'max':>9}", file=out)
+            ranked = sorted(self.latency.items(), key=lambda item: item[1].count, reverse=True)
+            for label, histogram in ranked[:top + 1]:
+                print(f"{label:<28}{histogram.count:>8}"
+                      + "".join(f"{histogram.percentile(p):>9.2f}" for p in (0.5, 0.9, 0.99, 0.999))
+                      + f"{histogram.maximum:>9.2f}", file=out)
+
+
+def _format_time(created):
+    return datetime.fromtimestamp(created).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="*", default=["logs"], help=".tx files or directories to scan")
+    parser.add_argument("--interval", type=float, default=60.0, help="throughput bucket in seconds")
+    parser.add_argument("--top", type=int, default=20, help="rows in the peer and latency tables")
+    args = parser.parse_args(argv)
+
+    report = Report(args.interval)
+    for path in find_logs(args.paths):
+        try:
+            for record in read_records(path):
+                report.add(record)
+        except (ValueError, IndexError, EOFError, OSError, struct.error) as e:
+            # A truncated tail (crash mid-write) only loses that file's last record
+            print(f"Skipping rest of {path}: {e}", file=sys.stderr)
+    report.print(args.top)
+
+
+if __name__ == "__main__":
+    main()
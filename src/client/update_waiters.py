@@ -0,0 +1,131 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+class UpdateWaiter:
+    """A parked fetch_updates request"""
+
+    def __init__(self, session, user_id, request, channel_id, last_message_id, deadline, stream=False):
+        self.session = session
+        self.user_id = user_id
+        self.request = request
+        self.channel_id = channel_id
+        self.last_message_id = last_message_id
+        self.deadline = deadline
+        self.stream = stream
+        self.active = True
+
+
+class UpdateWaiters:
+    """Parked fetch_updates requests, released by a new message or their deadline.
+
+    A single sweeper thread sleeps until the nearest deadline, or indefinitely
+    when nothing is parked, so idle channels cost nothing.
+    """
+
+    def __init__(self, on_timeout):
+        self._on_timeout = on_timeout
+        self._by_channel = {}  # channel_id -> set of waiters
+        self._deadlines = []  # heap of (deadline, seq, waiter)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._sweep, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._by_channel.clear()
+            self._deadlines.clear()
+            self._cond.notify()
+
+    def park(self, waiter):
+        """Wait for a message or the deadline; a woken one-shot waiter may be parked again"""
+        with self._cond:
+            waiter.active = True
+            self._by_channel.setdefault(waiter.channel_id, set()).add(waiter)
+            heapq.heappush(self._deadlines, (waiter.deadline, next(self._seq), waiter))
+            if self._deadlines[0][2] is waiter:
+                self._cond.notify()
+
+    def wake(self, channel_id):
+        """Waiters to answer for a new message. One-shot waiters are removed,
+        streaming ones stay parked until their deadline. A one-shot waiter
+        with nothing to answer yet must be parked again."""
+        with self._cond:
+            waiters = self._by_channel.get(channel_id)
+            if not waiters:
+                return []
+            ready = [waiter for waiter in waiters if waiter.active]
+            for waiter in ready:
+                if not waiter.stream:
+                    self._discard(waiter)
+            return ready
+
+    def cancel(self, waiter):
+        with self._cond:
+            self._discard(waiter)
+
+    def cancel_session(self, session):
+        with self._cond:
+            for waiters in list(self._by_channel.values()):
+                for waiter in [w for w in waiters if w.session is session]:
+                    self._discard(waiter)
+
+    def channel_ids(self):
+        """Channels with parked waiters"""
+        with self._cond:
+            return set(self._by_channel)
+
+    def pending_count(self):
+        with self._cond:
+            return sum(len(waiters) for waiters in self._by_channel.values())
+
+    def _discard(self, waiter):
+        # Heap entries of inactive waiters are skipped by the sweeper
+        waiter.active = False
+        waiters = self._by_channel.get(waiter.channel_id)
+        if waiters is not None:
+            waiters.discard(waiter)
+            if not waiters:
+                del self._by_channel[waiter.channel_id]
+
+    def _sweep(self):
+        while True:
+            expired = []
+            with self._cond:
+                while self._running:
+                    while self._deadlines and not self._deadlines[0][2].active:
+                        heapq.heappop(self._deadlines)
+
+                    if not self._deadlines:
+                        self._cond.wait()
+                        continue
+
+                    delay = self._deadlines[0][0] - time.monotonic()
+                    if delay > 0:
+                        self._cond.wait(delay)
+                        continue
+
+                    while self._deadlines and self._deadlines[0][0] <= time.monotonic():
+                        waiter = heapq.heappop(self._deadlines)[2]
+                        if waiter.active:
+                            self._discard(waiter)
+                            expired.append(waiter)
+                    break
+
+                if not self._running:
+                    return
+
+            for waiter in expired:
+                self._on_timeout(waiter)
@@ -0,0 +1,369 @@
+import json
+import struct
+
+# Wire formats for protocol messages (dicts of JSON-compatible values).
+#
+# "json" is UTF-8 JSON. "bin1" is a compact binary form: a magic byte, then a
+# tagged value tree with zigzag varint integers and with field names and
+# common values (message types, statuses) sent as small ids from SYMBOLS.
+# Dicts whose keys match one of SCHEMAS (the frequent message types) are sent
+# as the schema id and their values only.
+# Binary payloads always start with MAGIC, which no JSON text does, so
+# decode() reads either format and peers only negotiate what they may send.
+#
+# SYMBOLS and SCHEMAS are part of the format: changes belong in a new version.
+
+MAGIC = 0xB1
+
+SYMBOLS = (
+    # Field names
+    "type", "action", "status", "message", "tag", "seq", "id", "msg_id",
+    "user_id", "sender_id", "receiver_id", "channel_id", "channel_ids", "host_id",
+    "content", "created_at", "timestamp", "username", "status_text",
+    "has_media", "media_type", "media_path", "media_name", "media_id", "media_data",
+    "messages", "new_messages", "last_message_id", "last_seq", "head_seq", "more",
+    "limit", "before_id", "wait", "stream", "results", "subscribed", "rejected",
+    "standby", "host", "port", "epoch", "route", "routes", "channels", "channel_info",
+    "name", "owner_id", "is_private", "is_direct", "target_id", "is_channel",
+    "count", "fields", "columns", "deltas", "booleans", "codecs", "format", "formats",
+    "role", "members", "info", "complete", "evicted_id", "watch", "streaming",
+    "timed_out", "redirect", "peer_id", "peer_username", "file_name", "file_size",
+    "sender_username", "friend_id", "friend_username",
+    # Values
+    "success", "error", "authenticated", "new_message", "stream_update", "stream_end",
+    "heartbeat", "membership", "replica_announce", "host_changed", "catch_up",
+    "ack", "hello", "friend_request", "friend_request_accepted", "friend_request_rejected",
+    "status_change", "online", "offline", "invisible", "route_update",
+    "get_channel_info", "get_channel_messages", "get_channel_messages_batch",
+    "send_message", "fetch_updates", "subscribe", "unsubscribe", "sync", "ping",
+    "replicate", "register", "unregister", "lookup", "subscribe_routes",
+    "unsubscribe_routes", "media", "media_request", "image", "video", "audio", "file",
+)
+SYMBOL_IDS = {symbol: index for index, symbol in enumerate(SYMBOLS)}
+
+SCHEMAS = (
+    # serialize_message() on the channel host
+    ("id", "seq", "content", "sender_id", "created_at", "has_media", "media_type",
+     "media_path", "media_name"),
+    ("type", "channel_id", "message"),
+    ("type", "msg_id"),
+    ("type", "user_id", "status"),
+    ("type", "sender_id", "sender_username", "content", "channel_id", "is_direct", "msg_id"),
+    ("type", "sender_id", "sender_username", "content", "is_direct", "msg_id"),
+    ("status", "tag"),
+    ("action", "tag"),
+)
+SCHEMA_IDS = {keys: index for index, keys in enumerate(SCHEMAS)}
+
+# Value tags; 0x80 | n is the integer n for 0 <= n < 128
+(T_NONE, T_FALSE, T_TRUE, T_INT, T_FLOAT, T_STR, T_SYMBOL, T_BYTES, T_LIST, T_DICT,
+ T_SCHEMA, T_PREFIXED) = range(12)
+SMALL_INT = 0x80
+
+DOUBLE = struct.Struct('!d')
+
+
+class CodecError(Exception):
+    pass
+
+
+def _varint(out, value):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _encode_value(out, value):
+    kind = type(value)
+    if kind is str:
+        symbol = SYMBOL_IDS.get(value)
+        if symbol is not None:
+            out.append(T_SYMBOL)
+            _varint(out, symbol)
+        else:
+            raw = value.encode('utf-8')
+            out.append(T_STR)
+            _varint(out, len(raw))
+            out += raw
+    elif kind is int:
+        if 0 <= value < 128:
+            out.append(SMALL_INT | value)
+        else:
+            out.append(T_INT)
+            _varint(out, (value << 1) if value >= 0 else ((-value << 1) - 1))
+    elif kind is dict:
+        _encode_dict(out, value)
+    elif value is None:
+        out.append(T_NONE)
+    elif kind is bool:
+        out.append(T_TRUE if value else T_FALSE)
+    elif kind is list or kind is tuple:
+        out.append(T_LIST)
+        _varint(out, len(value))
+        for item in value:
+            _encode_value(out, item)
+    elif kind is float:
+        out.append(T_FLOAT)
+        out += DOUBLE.pack(value)
+    elif kind is bytes or kind is bytearray:
+        out.append(T_BYTES)
+        _varint(out, len(value))
+        out += value
+    elif isinstance(value, int):
+        _encode_value(out, int(value))
+    else:
+        raise CodecError(f"Cannot encode {kind.__name__}")
+
+
+def _encode_dict(out, value):
+    schema = SCHEMA_IDS.get(tuple(value))
+    if schema is not None:
+        out.append(T_SCHEMA)
+        out.append(schema)
+        _encode_items(out, value.values())
+        return
+
+    out.append(T_DICT)
+    _varint(out, len(value))
+    for key in value:
+        _encode_key(out, key)
+    _encode_items(out, value.values())
+
+
+def _encode_items(out, items):
+    symbol_ids = SYMBOL_IDS
+    append = out.append
+    for item in items:
+        # The common one-byte cases inline, everything else recursively
+        kind = type(item)
+        if kind is int and 0 <= item < 128:
+            append(SMALL_INT | item)
+        elif item is None:
+            append(T_NONE)
+        elif kind is str:
+            symbol = symbol_ids.get(item)
+            if symbol is not None and symbol < 128:
+                append(T_SYMBOL)
+                append(symbol)
+            else:
+                raw = item.encode('utf-8')
+                append(T_STR)
+                _varint(out, len(raw))
+                out += raw
+        else:
+            _encode_value(out, item)
+
+
+def _encode_key(out, key):
+    # Keys are interned ids (even) or inline strings (odd length marker)
+    symbol = SYMBOL_IDS.get(key)
+    if symbol is not None:
+        _varint(out, symbol << 1)
+    else:
+        raw = str(key).encode('utf-8')
+        _varint(out, (len(raw) << 1) | 1)
+        out += raw
+
+
+def _decode_value(data, pos):
+    tag = data[pos]
+    pos += 1
+    if tag >= SMALL_INT:
+        return tag & 0x7F, pos
+    if tag == T_SYMBOL:
+        index = data[pos]
+        if index < 0x80:
+            return SYMBOLS[index], pos + 1
+        index, pos = _read_varint(data, pos)
+        return SYMBOLS[index], pos
+    if tag == T_STR:
+        size = data[pos]
+        if size < 0x80:
+            pos += 1
+        else:
+            size, pos = _read_varint(data, pos)
+        return data[pos:pos + size].decode('utf-8'), pos + size
+    if tag == T_INT:
+        zigzag, pos = _read_varint(data, pos)
+        return (zigzag >> 1) if not zigzag & 1 else -((zigzag + 1) >> 1), pos
+    if tag == T_SCHEMA:
+        keys = SCHEMAS[data[pos]]
+        values, pos = _decode_items(data, pos + 1, len(keys))
+        return dict(zip(keys, values)), pos
+    if tag == T_DICT:
+        return _decode_dict(data, pos)
+    if tag == T_PREFIXED:
+        # Fields put in front of an already encoded dict by add_field()
+        prefix, pos = _decode_dict(data, pos)
+        rest, pos = _decode_value(data, pos)
+        prefix.update(rest)
+        return prefix, pos
+    if tag == T_NONE:
+        return None, pos
+    if tag == T_TRUE:
+        return True, pos
+    if tag == T_FALSE:
+        return False, pos
+    if tag == T_LIST:
+        count, pos = _read_varint(data, pos)
+        result = []
+        append = result.append
+        for _ in range(count):
+            item, pos = _decode_value(data, pos)
+            append(item)
+        return result, pos
+    if tag == T_FLOAT:
+        return DOUBLE.unpack_from(data, pos)[0], pos + DOUBLE.size
+    if tag == T_BYTES:
+        size, pos = _read_varint(data, pos)
+        return bytes(data[pos:pos + size]), pos + size
+    raise CodecError(f"Unknown value tag {tag}")
+
+
+def _decode_dict(data, pos):
+    count = data[pos]
+    if count < 0x80:
+        pos += 1
+    else:
+        count, pos = _read_varint(data, pos)
+    keys = []
+    symbols = SYMBOLS
+    for _ in range(count):
+        marker = data[pos]
+        if marker < 0x80:
+            pos += 1
+        else:
+            marker, pos = _read_varint(data, pos)
+        if marker & 1:
+            size = marker >> 1
+            keys.append(data[pos:pos + size].decode('utf-8'))
+            pos += size
+        else:
+            keys.append(symbols[marker >> 1])
+    values, pos = _decode_items(data, pos, count)
+    return dict(zip(keys, values)), pos
+
+
+def _decode_items(data, pos, count):
+    values = []
+    append = values.append
+    symbols = SYMBOLS
+    for _ in range(count):
+        # The common one-byte cases inline, everything else recursively
+        tag = data[pos]
+        if tag >= SMALL_INT:
+            append(tag & 0x7F)
+            pos += 1
+        elif tag == T_STR and data[pos + 1] < 0x80:
+            size = data[pos + 1]
+            pos += 2
+            append(data[pos:pos + size].decode('utf-8'))
+            pos += size
+        elif tag == T_SYMBOL and data[pos + 1] < 0x80:
+            append(symbols[data[pos + 1]])
+            pos += 2
+        elif tag == T_NONE:
+            append(None)
+            pos += 1
+        elif tag == T_INT:
+            zigzag = 0
+            shift = 0
+            pos += 1
+            while True:
+                byte = data[pos]
+                pos += 1
+                zigzag |= (byte & 0x7F) << shift
+                if byte < 0x80:
+                    break
+                shift += 7
+            append((zigzag >> 1) if not zigzag & 1 else -((zigzag + 1) >> 1))
+        elif tag <= T_TRUE:
+            append(tag == T_TRUE if tag else None)
+            pos += 1
+        else:
+            value, pos = _decode_value(data, pos)
+            append(value)
+    return values, pos
+
+
+class JsonCodec:
+    name = "json"
+
+    def encode(self, message) -> bytes:
+        return json.dumps(message).encode('utf-8')
+
+    def decode(self, data: bytes):
+        return json.loads(data.decode('utf-8'))
+
+    def add_field(self, encoded: bytes, key, value) -> bytes:
+        """Prepend a field to an encoded dict without re-encoding the rest"""
+        return b'{%s: %s, ' % (json.dumps(key).encode('utf-8'), json.dumps(value).encode('utf-8')) + encoded[1:]
+
+
+class BinaryCodec:
+    name = "bin1"
+
+    def encode(self, message) -> bytes:
+        out = bytearray((MAGIC,))
+        _encode_value(out, message)
+        return bytes(out)
+
+    def decode(self, data: bytes):
+        if not data or data[0] != MAGIC:
+            raise CodecError("Not a bin1 payload")
+        try:
+            value, pos = _decode_value(data, 1)
+        except (IndexError, UnicodeDecodeError) as e:
+            raise CodecError(f"Malformed bin1 payload: {e}")
+        if pos != len(data):
+            raise CodecError("Trailing bytes after bin1 payload")
+        return value
+
+    def add_field(self, encoded: bytes, key, value) -> bytes:
+        """Prepend a field to an encoded dict without re-encoding the rest"""
+        if len(encoded) < 2 or encoded[1] not in (T_DICT, T_SCHEMA, T_PREFIXED):
+            raise CodecError("Not an encoded dict")
+        out = bytearray((MAGIC, T_PREFIXED, 1))
+        _encode_key(out, key)
+        _encode_value(out, value)
+        out += memoryview(encoded)[1:]
+        return bytes(out)
+
+
+JSON = JsonCodec()
+BINARY = BinaryCodec()
+CODECS = {codec.name: codec for codec in (BINARY, JSON)}
+SUPPORTED_FORMATS = ("json", "bin1")
+
+
+def get_codec(name):
+    return CODECS.get(name, JSON)
+
+
+def negotiate(offered):
+    """The format to use with a peer that offered these, most preferred
+    first: its first choice we support, json if none match"""
+    for name in offered or ():
+        if name in SUPPORTED_FORMATS:
+            return CODECS[name]
+    return JSON
+
+
+def decode(data: bytes):
+    """Decode a payload in whichever format it is in"""
+    if data[:1] == b'\xb1':
+        return BINARY.decode(data)
+    return JSON.decode(data)
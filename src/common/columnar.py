@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+
+# Message batches are sent column by column under a shared field list instead
+# of as a list of dicts that repeat every key. Timestamps travel as integer
+# microseconds, ids, seqs and timestamps as deltas from the previous row, and
+# columns that are null throughout are left out.
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+TIMESTAMP_FIELDS = {"created_at", "timestamp"}
+DELTA_FIELDS = {"id", "seq", "created_at", "timestamp"}
+BATCH_KEYS = ("messages", "new_messages")
+
+
+def _encode_column(field, values):
+    if field in TIMESTAMP_FIELDS:
+        values = [None if value is None else (datetime.fromisoformat(value) - EPOCH) // MICROSECOND
+                  for value in values]
+    elif values and all(isinstance(value, bool) for value in values):
+        values = [int(value) for value in values]
+    if field in DELTA_FIELDS and None not in values:
+        previous = 0
+        deltas = []
+        for value in values:
+            deltas.append(value - previous)
+            previous = value
+        return deltas, True
+    return values, False
+
+
+def _decode_column(field, values, delta, booleans):
+    if delta:
+        total = 0
+        absolute = []
+        for value in values:
+            total += value
+            absolute.append(total)
+        values = absolute
+    if field in TIMESTAMP_FIELDS:
+        return [None if value is None else (EPOCH + value * MICROSECOND).isoformat() for value in values]
+    if booleans:
+        return [bool(value) for value in values]
+    return values
+
+
+def pack_messages(messages):
+    """Columnar form of a list of message dicts"""
+    fields = []
+    for message in messages:
+        for field in message:
+            if field not in fields:
+                fields.append(field)
+
+    columns = {}
+    deltas = []
+    booleans = []
+    for field in fields:
+        values = [message.get(field) for message in messages]
+        if all(value is None for value in values):
+            continue
+        if all(isinstance(value, bool) for value in values):
+            booleans.append(field)
+        columns[field], delta = _encode_column(field, values)
+        if delta:
+            deltas.append(field)
+
+    return {
+        "count": len(messages),
+        "fields": fields,
+        "columns": columns,
+        "deltas": deltas,
+        "booleans": booleans
+    }
+
+
+def unpack_messages(packed):
+    count = packed["count"]
+    deltas = set(packed["deltas"])
+    booleans = set(packed["booleans"])
+    columns = {
+        field: _decode_column(field, values, field in deltas, field in booleans)
+        for field, values in packed["columns"].items()
+    }
+    nulls = [None] * count
+    fields = [(field, columns.get(field, nulls)) for field in packed["fields"]]
+    return [{field: values[index] for field, values in fields} for index in range(count)]
+
+
+def pack_response(response):
+    """Copy of a response with its message lists in columnar form"""
+    packed = dict(response)
+    for key in BATCH_KEYS:
+        if isinstance(packed.get(key), list):
+            packed[key] = pack_messages(packed[key])
+    if isinstance(packed.get("results"), list):
+        packed["results"] = [pack_response(result) for result in packed["results"]]
+    return packed
+
+
+def unpack_response(response):
+    """Inverse of pack_response, in place"""
+    for key in BATCH_KEYS:
+        if isinstance(response.get(key), dict):
+            response[key] = unpack_messages(response[key])
+    for result in response.get("results") or ():
+        if isinstance(result, dict):
+            unpack_response(result)
+    return response
@@ -0,0 +1,98 @@
+import struct
+import zlib
+
+# Every frame is a 4-byte big-endian payload length followed by the payload.
+# The length's high bit marks a zlib-compressed payload; peers only send those
+# after agreeing on it, readers always understand them.
+HEADER = struct.Struct('!I')
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+COMPRESSED_FLAG = 0x80000000
+
+
+class FrameError(Exception):
+    pass
+
+
+def encode_frame(payload: bytes, compress_threshold=None) -> bytes:
+    """Frame a payload, zlib-compressed if compress_threshold is set and the
+    payload is larger"""
+    if len(payload) > MAX_FRAME_SIZE:
+        raise FrameError(f"Frame of {len(payload)} bytes exceeds limit of {MAX_FRAME_SIZE}")
+    if compress_threshold is not None and len(payload) > compress_threshold:
+        compressed = zlib.compress(payload, 1)
+        if len(compressed) < len(payload):
+            return HEADER.pack(len(compressed) | COMPRESSED_FLAG) + compressed
+    return HEADER.pack(len(payload)) + payload
+
+
+def send_frame(sock, payload: bytes, compress_threshold=None):
+    sock.sendall(encode_frame(payload, compress_threshold))
+
+
+def decompress_payload(payload: bytes) -> bytes:
+    decompressor = zlib.decompressobj()
+    data = decompressor.decompress(payload, MAX_FRAME_SIZE)
+    if decompressor.unconsumed_tail:
+        raise FrameError(f"Compressed frame expands beyond limit of {MAX_FRAME_SIZE}")
+    return data
+
+
+def recv_exact(sock, size: int):
+    """Read exactly size bytes, or return None if the peer closed the connection"""
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = sock.recv(min(remaining, 65536))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_frame(sock):
+    header = recv_exact(sock, HEADER.size)
+    if header is None:
+        return None
+
+    (size,) = HEADER.unpack(header)
+    compressed = size & COMPRESSED_FLAG
+    size &= ~COMPRESSED_FLAG
+    if size > MAX_FRAME_SIZE:
+        raise FrameError(f"Incoming frame of {size} bytes exceeds limit of {MAX_FRAME_SIZE}")
+
+    payload = recv_exact(sock, size)
+    if compressed and payload is not None:
+        return decompress_payload(payload)
+    return payload
+
+
+class FrameReader:
+    """Incremental frame parser for non-blocking sockets.
+
+    Feed it whatever recv() returned; it hands back every frame completed so
+    far and keeps the partial remainder for the next call.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes):
+        self._buffer += data
+        frames = []
+        offset = 0
+        while len(self._buffer) - offset >= HEADER.size:
+            (size,) = HEADER.unpack_from(self._buffer, offset)
+            compressed = size & COMPRESSED_FLAG
+            size &= ~COMPRESSED_FLAG
+            if size > MAX_FRAME_SIZE:
+                raise FrameError(f"Incoming frame of {size} bytes exceeds limit of {MAX_FRAME_SIZE}")
+            end = offset + HEADER.size + size
+            if len(self._buffer) < end:
+                break
+            payload = bytes(self._buffer[offset + HEADER.size:end])
+            frames.append(decompress_payload(payload) if compressed else payload)
+            offset = end
+        if offset:
+            del self._buffer[:offset]
+        return frames
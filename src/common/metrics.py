@@ -0,0 +1,300 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+# In-process metrics: counters, gauges and latency histograms kept in a
+# registry under a name plus optional labels, e.g.
+#
+#     REQUESTS = counter("channel_host_requests_total", action="send_message")
+#     REQUESTS.inc()
+#     with histogram("channel_host_request_seconds", action="send_message").time():
+#         ...
+#
+# Look metrics up once and keep the object: updates are a lock and an add.
+# snapshot() copies every value (histograms as percentiles), dump() logs it
+# with rates since the previous dump, start_dump() does that periodically and
+# exposition() renders the Prometheus text format (see metrics_server.py).
+
+# Histogram buckets are log-linear over integer microseconds, as in HDR
+# histograms: values below 2 ** SUB_BITS get a bucket each, above that every
+# power of two is split into 2 ** (SUB_BITS - 1) buckets, so any recorded
+# value is reported within 1 / 2 ** (SUB_BITS - 1) (1.6%) of itself.
+SUB_BITS = 7
+SUB_COUNT = 1 << SUB_BITS
+HALF_COUNT = SUB_COUNT >> 1
+MAX_MICROS = (1 << 42) - 1  # about 50 days, longer values are clamped
+PERCENTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+def _bucket(micros):
+    bits = micros.bit_length()
+    if bits <= SUB_BITS:
+        return micros
+    shift = bits - SUB_BITS
+    return SUB_COUNT + (shift - 1) * HALF_COUNT + (micros >> shift) - HALF_COUNT
+
+
+def _bucket_value(index):
+    """Midpoint of a bucket in microseconds"""
+    if index < SUB_COUNT:
+        return index
+    shift = (index - SUB_COUNT) // HALF_COUNT + 1
+    base = ((index - SUB_COUNT) % HALF_COUNT + HALF_COUNT) << shift
+    return base + (1 << (shift - 1))
+
+
+BUCKETS = _bucket(MAX_MICROS) + 1
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, labels, description=""):
+        self.name = name
+        self.labels = labels
+        self.description = description
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, labels, description=""):
+        self.name = name
+        self.labels = labels
+        self.description = description
+        self.value = 0
+        self.function = None
+        self.lock = threading.Lock()
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set_function(self, function):
+        """Read the value from function() at snapshot time instead"""
+        self.function = function
+
+    def snapshot(self):
+        if self.function is not None:
+            try:
+                return self.function()
+            except Exception as e:
+                logging.error(f"Error reading gauge {self.name}: {str(e)}")
+                return None
+        return self.value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, labels, description=""):
+        self.name = name
+        self.labels = labels
+        self.description = description
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        micros = min(max(int(seconds * 1e6), 0), MAX_MICROS)
+        index = _bucket(micros)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            if self.minimum is None or seconds < self.minimum:
+                self.minimum = seconds
+            if seconds > self.maximum:
+                self.maximum = seconds
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(time.perf_counter() - start)
+
+    def copy(self):
+        with self.lock:
+            return list(self.counts), self.count, self.total, self.minimum, self.maximum
+
+    def snapshot(self):
+        counts, count, total, minimum, maximum = self.copy()
+        result = {"count": count, "sum": total, "min": minimum or 0.0, "max": maximum}
+        targets = [(p, p * count) for p in PERCENTILES]
+        seen = 0
+        position = 0
+        for index, bucket_count in enumerate(counts):
+            if not bucket_count:
+                continue
+            seen += bucket_count
+            while position < len(targets) and seen >= targets[position][1]:
+                value = min(_bucket_value(index) / 1e6, maximum)
+                result[f"p{targets[position][0] * 100:g}"] = value
+                position += 1
+            if position == len(targets):
+                break
+        for p, _ in targets[position:]:
+            result[f"p{p * 100:g}"] = maximum
+        return result
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}  # (name, labels) -> metric
+        self.lock = threading.Lock()
+        self.last_dump = None  # (monotonic time, {key: counter value})
+        self.dump_thread = None
+        self.dump_stop = threading.Event()
+
+    def _get(self, cls, name, description, labels):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self.metrics.get(key)
+        if metric is None:
+            with self.lock:
+                metric = self.metrics.get(key)
+                if metric is None:
+                    metric = cls(name, key[1], description)
+                    self.metrics[key] = metric
+        if not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} is a {metric.kind}, not a {cls.kind}")
+        return metric
+
+    def counter(self, name, description="", **labels):
+        return self._get(Counter, name, description, labels)
+
+    def gauge(self, name, description="", **labels):
+        return self._get(Gauge, name, description, labels)
+
+    def histogram(self, name, description="", **labels):
+        return self._get(Histogram, name, description, labels)
+
+    def collect(self):
+        with self.lock:
+            return list(self.metrics.values())
+
+    def snapshot(self):
+        """{(name, labels): value}; histograms as count, sum, min, max and percentiles"""
+        return {(metric.name, metric.labels): metric.snapshot() for metric in self.collect()}
+
+    def exposition(self):
+        """Every metric in the Prometheus text format (version 0.0.4).
+        Histograms are exposed as summaries: quantiles, _sum and _count."""
+        families = {}
+        for metric in self.collect():
+            families.setdefault(metric.name, []).append(metric)
+
+        lines = []
+        for name in sorted(families):
+            members = families[name]
+            first = members[0]
+            if first.description:
+                lines.append(f"# HELP {name} {_escape_help(first.description)}")
+            lines.append(f"# TYPE {name} {'summary' if first.kind == 'histogram' else first.kind}")
+            for metric in members:
+                value = metric.snapshot()
+                if metric.kind != "histogram":
+                    if value is not None:
+                        lines.append(f"{name}{_labels(metric.labels)} {_number(value)}")
+                    continue
+                for p in PERCENTILES:
+                    quantile = metric.labels + (("quantile", f"{p:g}"),)
+                    estimate = value[f'p{p * 100:g}'] if value["count"] else float("nan")
+                    lines.append(f"{name}{_labels(quantile)} {_number(estimate)}")
+                lines.append(f"{name}_sum{_labels(metric.labels)} {_number(value['sum'])}")
+                lines.append(f"{name}_count{_labels(metric.labels)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, logger=logging):
+        """Log every metric, with per-second rates for counters since the last dump"""
+        now = time.monotonic()
+        snapshot = self.snapshot()
+        previous_time, previous = self.last_dump or (None, {})
+        self.last_dump = (now, {key: value for key, value in snapshot.items() if not isinstance(value, dict)})
+
+        lines = []
+        for (name, labels), value in sorted(snapshot.items(), key=lambda item: str(item[0])):
+            label_text = ",".join(f"{key}={label}" for key, label in labels)
+            metric = f"{name}{{{label_text}}}" if label_text else name
+            if isinstance(value, dict):
+                if not value["count"]:
+                    continue
+                lines.append(
+                    f"{metric} count={value['count']} "
+                    + " ".join(f"{key}={value[key] * 1000:.2f}ms" for key in value if key.startswith("p"))
+                    + f" max={value['max'] * 1000:.2f}ms"
+                )
+            elif previous_time is not None and (name, labels) in previous:
+                rate = (value - previous[(name, labels)]) / max(now - previous_time, 1e-9)
+                lines.append(f"{metric} {value} ({rate:.1f}/s)")
+            else:
+                lines.append(f"{metric} {value}")
+        if lines:
+            logger.info("Metrics:\n  " + "\n  ".join(lines))
+
+    def start_dump(self, interval, logger=logging):
+        """Dump every interval seconds from a daemon thread; later calls are no-ops"""
+        with self.lock:
+            if self.dump_thread is not None and self.dump_thread.is_alive():
+                return
+            self.dump_stop.clear()
+            self.dump_thread = threading.Thread(target=self._dump_loop, args=(interval, logger), daemon=True)
+            self.dump_thread.start()
+
+    def stop_dump(self):
+        self.dump_stop.set()
+
+    def _dump_loop(self, interval, logger):
+        while not self.dump_stop.wait(interval):
+            try:
+                self.dump(logger)
+            except Exception as e:
+                logging.error(f"Error dumping metrics: {str(e)}")
+
+
+def _escape_help(text):
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+def _number(value):
+    if isinstance(value, float):
+        if value != value:
+            return "NaN"
+        if abs(value) == float("inf"):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(int(value))
+
+
+REGISTRY = MetricsRegistry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
@@ -0,0 +1,60 @@
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.common.metrics import REGISTRY
+
+# GET /metrics on a small HTTP server thread, in the Prometheus text format.
+# Gauges that read live state (client counts, queue depths) are computed per
+# scrape on this thread, so request handling pays nothing for them.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404, "Only /metrics is served here")
+            return
+        try:
+            body = self.registry.exposition().encode('utf-8')
+        except Exception as e:
+            logging.error(f"Error rendering metrics: {str(e)}")
+            self.send_error(500, "Could not render metrics")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would drown the log
+        pass
+
+
+class MetricsServer:
+    def __init__(self, host="127.0.0.1", port=0, registry=REGISTRY):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self.httpd = None
+        self.thread = None
+
+    def start(self):
+        """Listen and serve from a daemon thread; returns the bound port"""
+        handler = type("MetricsHandler", (_MetricsHandler,), {"registry": self.registry})
+        self.httpd = ThreadingHTTPServer((self.host, self.port), handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        logging.info(f"Metrics served on http://{self.host}:{self.port}/metrics")
+        return self.port
+
+    def stop(self):
+        httpd, self.httpd = self.httpd, None
+        if httpd:
+            httpd.shutdown()
+            httpd.server_close()
@@ -0,0 +1,221 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+# On-demand profiling of a running process, driven by text commands (see
+# COMMANDS) from the server's localhost control channel or the client's
+# diagnostics action:
+#
+#     profile 30          cProfile every thread that checks in for 30 seconds
+#     profile stop        end the run early and write the report now
+#     memory start        start tracemalloc
+#     memory snapshot     dump a snapshot, report top allocations and the
+#                         difference from the previous snapshot
+#     memory stop         stop tracemalloc and forget the snapshots
+#
+# cProfile only hooks the thread that enables it (before Python 3.12), so
+# long-running loops call checkpoint(): while a run is active it starts a
+# profiler for the calling thread, afterwards it stops it again from that
+# same thread. Outside a run a checkpoint is one attribute read. The
+# per-thread profiles are merged with pstats into one report.
+
+DIRECTORY = "profiles"
+DEFAULT_SECONDS = 30
+MAX_SECONDS = 600
+TOP = 40  # rows in text reports
+TRACE_FRAMES = 10  # stack depth tracemalloc keeps per allocation
+
+COMMANDS = ("profile <seconds>", "profile stop", "memory start", "memory snapshot", "memory stop")
+
+
+class _Stats:
+    """Already collected profile stats, in the form pstats.Stats accepts"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class CpuRun:
+    def __init__(self, path, seconds):
+        self.path = path
+        self.seconds = seconds
+        self.started = time.time()
+        self.profiles = []  # (thread name, cProfile.Profile)
+        self.timer = None
+
+
+class Profiler:
+    def __init__(self, directory=DIRECTORY):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.run = None
+        self.local = threading.local()
+        self.previous_snapshot = None
+
+    def _path(self, kind):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        return os.path.join(self.directory, f"{kind}-{stamp}-{os.getpid()}-{time.time_ns() % 1000000:06d}")
+
+    def checkpoint(self):
+        """Profile the calling thread while a run is active; cheap otherwise"""
+        run = self.run
+        current = getattr(self.local, "profile", None)
+        if current is None and run is None:
+            return
+        if current is not None:
+            if current[0] is run:
+                return
+            current[1].disable()
+            self.local.profile = None
+        if run is None or sys.getprofile() is not None:
+            return  # leave debuggers and other profilers alone
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return  # Python 3.12+: one profiler already covers every thread
+        with self.lock:
+            if self.run is not run:
+                profile.disable()
+                return
+            run.profiles.append((threading.current_thread().name, profile))
+        self.local.profile = (run, profile)
+
+    def start_cpu(self, seconds=DEFAULT_SECONDS):
+        """Start a run that writes its report after seconds; returns the report path"""
+        seconds = min(max(float(seconds), 0.1), MAX_SECONDS)
+        with self.lock:
+            if self.run is not None:
+                raise RuntimeError(f"A profile is already running, its report goes to {self.run.path}.txt")
+            run = CpuRun(self._path("cpu"), seconds)
+            run.timer = threading.Timer(seconds, self.stop_cpu, args=(run,))
+            run.timer.daemon = True
+            self.run = run
+        run.timer.start()
+        self.checkpoint()
+        logging.info(f"CPU profiling for {seconds:g}s, report in {run.path}.txt")
+        return run.path + ".txt"
+
+    def stop_cpu(self, run=None):
+        """End the active run (only if it is still run) and write its report"""
+        with self.lock:
+            if self.run is None or (run is not None and self.run is not run):
+                return None
+            run, self.run = self.run, None
+            profiles = list(run.profiles)
+        run.timer.cancel()
+        self.checkpoint()  # stops the calling thread's own profiler
+
+        merged = None
+        for _, profile in profiles:
+            profile.snapshot_stats()
+            if sys.version_info >= (3, 12):
+                profile.disable()  # process-wide since 3.12, so any thread can stop it
+            stats = _Stats(profile.stats)
+            if merged is None:
+                merged = pstats.Stats(stats)
+            else:
+                merged.add(stats)
+        # Threads still running stop their own profilers at their next checkpoint
+
+        elapsed = time.time() - run.started
+        threads = ", ".join(sorted({name for name, _ in profiles})) or "none"
+        try:
+            with open(run.path + ".txt", 'w', encoding='utf-8') as f:
+                f.write(f"CPU profile of pid {os.getpid()} over {elapsed:.1f}s\n")
+                f.write(f"Threads: {threads}\n\n")
+                if merged is None:
+                    f.write("No thread reached a profiling checkpoint\n")
+                else:
+                    merged.dump_stats(run.path + ".prof")
+                    merged.stream = f
+                    f.write(f"Top {TOP} by cumulative time\n")
+                    merged.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP)
+                    f.write(f"Top {TOP} by own time\n")
+                    merged.sort_stats(pstats.SortKey.TIME).print_stats(TOP)
+        except Exception as e:
+            logging.error(f"Error writing profile {run.path}: {str(e)}")
+            return None
+        logging.info(f"CPU profile written to {run.path}.txt")
+        return run.path + ".txt"
+
+    def start_memory(self, frames=TRACE_FRAMES):
+        if tracemalloc.is_tracing():
+            return False
+        tracemalloc.start(frames)
+        return True
+
+    def stop_memory(self):
+        self.previous_snapshot = None
+        if not tracemalloc.is_tracing():
+            return False
+        tracemalloc.stop()
+        return True
+
+    def snapshot_memory(self):
+        """Dump a snapshot and a report of it and its difference from the last one"""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not running, send 'memory start' first")
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        path = self._path("memory")
+        snapshot.dump(path + ".snap")
+
+        out = io.StringIO()
+        current, peak = tracemalloc.get_traced_memory()
+        out.write(f"Memory snapshot of pid {os.getpid()}: {current / 1024:.1f} KiB traced, "
+                  f"peak {peak / 1024:.1f} KiB\n\nTop {TOP} allocation sites\n")
+        for stat in snapshot.statistics('lineno')[:TOP]:
+            out.write(f"{stat}\n")
+        if self.previous_snapshot is not None:
+            out.write(f"\nTop {TOP} changes since the previous snapshot\n")
+            for stat in snapshot.compare_to(self.previous_snapshot, 'lineno')[:TOP]:
+                out.write(f"{stat}\n")
+        self.previous_snapshot = snapshot
+
+        with open(path + ".txt", 'w', encoding='utf-8') as f:
+            f.write(out.getvalue())
+        logging.info(f"Memory snapshot written to {path}.txt")
+        return path + ".txt"
+
+    def handle_command(self, text):
+        """Run one of COMMANDS, returning the reply text"""
+        words = text.strip().lower().split()
+        try:
+            if words[:1] == ["profile"] and len(words) <= 2:
+                if words[1:] == ["stop"]:
+                    path = self.stop_cpu()
+                    return f"Profile written to {path}" if path else "No profile is running"
+                if len(words) == 1 or words[1].replace(".", "", 1).isdigit():
+                    path = self.start_cpu(float(words[1]) if len(words) > 1 else DEFAULT_SECONDS)
+                    return f"Profiling, report will be written to {path}"
+            if words[:1] == ["memory"] and len(words) == 2:
+                if words[1] == "start":
+                    return "Tracing allocations" if self.start_memory() else "Already tracing allocations"
+                if words[1] == "stop":
+                    return "Stopped tracing allocations" if self.stop_memory() else "Not tracing allocations"
+                if words[1] == "snapshot":
+                    return f"Snapshot written to {self.snapshot_memory()}"
+        except (RuntimeError, OSError) as e:
+            return f"Error: {str(e)}"
+        return "Commands: " + ", ".join(COMMANDS)
+
+
+def is_command(text):
+    return text.strip().lower().split(" ", 1)[0] in ("profile", "memory")
+
+
+PROFILER = Profiler()
+checkpoint = PROFILER.checkpoint
@@ -0,0 +1,41 @@
+import logging
+from sqlalchemy import inspect, text
+
+
+def add_message_seq(engine):
+    """Give databases created before Message.seq the column, number their
+    channel messages without a seq in id order after the channel's highest
+    seq and add the unique index"""
+    columns = [column["name"] for column in inspect(engine).get_columns("messages")]
+    with engine.begin() as connection:
+        if "seq" not in columns:
+            logging.info("Adding messages.seq")
+            connection.execute(text("ALTER TABLE messages ADD COLUMN seq INTEGER"))
+
+        # Continue after each channel's highest seq, so seqs clients may
+        # already have synced keep their meaning
+        rows = connection.execute(text(
+            "SELECT m.id, COALESCE(numbered.head, 0) "
+            "+ ROW_NUMBER() OVER (PARTITION BY m.channel_id ORDER BY m.id) "
+            "FROM messages m LEFT JOIN (SELECT channel_id, MAX(seq) AS head FROM messages "
+            "WHERE seq IS NOT NULL GROUP BY channel_id) numbered ON numbered.channel_id = m.channel_id "
+            "WHERE m.channel_id IS NOT NULL AND m.seq IS NULL"
+        )).fetchall()
+        if rows:
+            logging.info(f"Numbering {len(rows)} channel messages")
+            connection.execute(
+                text("UPDATE messages SET seq = :seq WHERE id = :id"),
+                [{"id": message_id, "seq": seq} for message_id, seq in rows]
+            )
+
+        connection.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_messages_channel_seq ON messages (channel_id, seq)"
+        ))
+
+
+def upgrade_schema(engine):
+    """Bring an existing database up to the current models"""
+    try:
+        add_message_seq(engine)
+    except Exception as e:
+        logging.error(f"Error upgrading database schema: {str(e)}")
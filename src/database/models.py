@@ -1,5 +1,8 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Enum
-from sqlalchemy.orm import relationship
+from sqlalchemy import (Column, Integer, String, Boolean, DateTime, ForeignKey, Enum,
+                        Index, event, func, select)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import relationship, Session
+from sqlalchemy.orm.attributes import instance_state
 from datetime import datetime
 import enum
 from .config import Base
@@ -64,6 +67,8 @@ class Message(Base):
     is_direct = Column(Boolean, default=False)
     is_read = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Position in the channel's log: 1, 2, 3, ... assigned at write time
+    seq = Column(Integer, nullable=True)
     
     # New fields for media messages
     has_media = Column(Boolean, default=False)
@@ -75,6 +80,55 @@ class Message(Base):
     receiver = relationship("User", foreign_keys=[receiver_id], back_populates="received_messages")
     channel = relationship("Channel", back_populates="messages")
 
+    __table_args__ = (
+        Index("uq_messages_channel_seq", "channel_id", "seq", unique=True),
+    )
+
+
+@event.listens_for(Session, "before_flush")
+def assign_channel_seqs(session, flush_context, instances):
+    """Number new channel messages after the newest seq of their channel.
+
+    A concurrent writer may claim the same seq first; the unique constraint
+    then fails the commit and the writer retries.
+    """
+    pending = [obj for obj in session.new if isinstance(obj, Message) and obj.seq is None]
+    if not pending:
+        return
+
+    next_seqs = {}
+    for message in sorted(pending, key=lambda obj: instance_state(obj).insert_order):
+        channel_id = message.channel_id
+        if channel_id is None and message.channel is not None:
+            channel_id = message.channel.id
+        if channel_id is None:
+            continue  # Direct messages are not numbered
+        if channel_id not in next_seqs:
+            next_seqs[channel_id] = session.execute(
+                select(func.coalesce(func.max(Message.seq), 0) + 1).where(Message.channel_id == channel_id)
+            ).scalar()
+        message.seq = next_seqs[channel_id]
+        next_seqs[channel_id] += 1
+
+
+def add_channel_message(session, attempts=3, commit=None, **fields):
+    """Insert a channel message and commit it, numbering it again when a
+    concurrent writer took the same seq. commit(session) replaces
+    session.commit(), e.g. to time it. Returns the committed Message."""
+    for attempt in range(attempts):
+        message = Message(**fields)
+        session.add(message)
+        try:
+            if commit is None:
+                session.commit()
+            else:
+                commit(session)
+            return message
+        except IntegrityError:
+            session.rollback()
+            if attempt == attempts - 1:
+                raise
+
 class FriendRequest(Base):
     __tablename__ = "friend_requests"
 
@@ -8,9 +8,13 @@ SERVER_HOST = "0.0.0.0"
 SERVER_PORT = 5000  
 MAX_CONNECTIONS = 100
 BUFFER_SIZE = 4096
+MAX_CONTROL_LINE = 1024 * 1024  # longest newline-delimited JSON request
+
+# Channel routing directory
+CHANNEL_REPLICA_ROLE = "replica"  # members allowed to take over hosting
 
 # Database
-DATABASE_URL = "sqlite:///./chat.db"
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./chat.db")
 
 # Security
 SECRET_KEY = "your-secret-key-here"  
@@ -24,4 +28,7 @@ P2P_BUFFER_SIZE = 4096
 LOG_LEVEL = "INFO"
 LOG_FILE = "server.log"
 MAX_LOG_SIZE = 10 * 1024 * 1024
-MAX_LOG_FILES = 5 
\ No newline at end of file
+MAX_LOG_FILES = 5
+METRICS_DUMP_INTERVAL = 60  # seconds between metrics summaries in the log
+METRICS_HOST = "127.0.0.1"  # Prometheus /metrics endpoint, local scrapers only
+METRICS_PORT = 9464  # None turns the endpoint off 
\ No newline at end of file
@@ -0,0 +1,143 @@
+import threading
+import time
+import logging
+from src.server.config import CHANNEL_REPLICA_ROLE
+from src.database.config import SessionLocal
+from src.database.models import Channel, ChannelMembership
+
+
+class RoutingDirectory:
+    """channel_id -> (host, port, epoch) of the ChannelHost serving it.
+
+    A route belongs to the control connection that registered it and goes away
+    with it. Every change bumps the channel's epoch and is pushed to the
+    connections watching that channel, so client caches never need to poll.
+    Users also publish where their RealtimeHandler listens (peers), so
+    senders can deliver what they queued for them.
+    """
+
+    def __init__(self):
+        self.routes = {}  # channel_id -> route dict
+        self.epochs = {}  # channel_id -> last epoch handed out, survives unregister
+        self.owners = {}  # connection -> set of channel_ids it registered
+        self.watchers = {}  # channel_id -> set of connections
+        self.peers = {}  # user_id -> (host, port, connection) of the user's realtime listener
+        self.lock = threading.Lock()
+
+    def may_host(self, user_id, channel_id):
+        """Owners host their channels, designated replicas may take over"""
+        db = SessionLocal()
+        try:
+            channel = db.query(Channel).get(channel_id)
+            if not channel:
+                return False
+            if channel.owner_id == user_id:
+                return True
+            membership = db.query(ChannelMembership).filter(
+                ChannelMembership.channel_id == channel_id,
+                ChannelMembership.user_id == user_id
+            ).first()
+            return membership is not None and membership.role == CHANNEL_REPLICA_ROLE
+        except Exception as e:
+            logging.error(f"Error checking hosting rights for channel {channel_id}: {str(e)}")
+            return False
+        finally:
+            db.close()
+
+    def register(self, connection, user_id, channel_ids, host, port):
+        registered = []
+        rejected = []
+        for channel_id in channel_ids:
+            if not self.may_host(user_id, channel_id):
+                rejected.append(channel_id)
+                continue
+
+            with self.lock:
+                epoch = self.epochs.get(channel_id, 0) + 1
+                self.epochs[channel_id] = epoch
+                previous = self.routes.get(channel_id)
+                if previous and previous["connection"] is not connection:
+                    self.owners.get(previous["connection"], set()).discard(channel_id)
+                self.routes[channel_id] = {
+                    "channel_id": channel_id,
+                    "host": host,
+                    "port": port,
+                    "epoch": epoch,
+                    "host_id": user_id,
+                    "connection": connection
+                }
+                self.owners.setdefault(connection, set()).add(channel_id)
+                registered.append(self.public_route(channel_id))
+            self.publish(channel_id)
+
+        return registered, rejected
+
+    def unregister(self, connection, channel_ids=None):
+        with self.lock:
+            owned = self.owners.get(connection, set())
+            targets = owned.copy() if channel_ids is None else owned & set(channel_ids)
+            for channel_id in targets:
+                owned.discard(channel_id)
+                route = self.routes.get(channel_id)
+                if route and route["connection"] is connection:
+                    del self.routes[channel_id]
+                    self.epochs[channel_id] = self.epochs.get(channel_id, 0) + 1
+            if not owned:
+                self.owners.pop(connection, None)
+
+        for channel_id in targets:
+            self.publish(channel_id)
+        return list(targets)
+
+    def lookup(self, channel_ids):
+        with self.lock:
+            return [self.public_route(channel_id) for channel_id in channel_ids]
+
+    def public_route(self, channel_id):
+        route = self.routes.get(channel_id)
+        if route is None:
+            return {"channel_id": channel_id, "host": None, "port": None,
+                    "epoch": self.epochs.get(channel_id, 0)}
+        return {key: value for key, value in route.items() if key != "connection"}
+
+    def watch(self, connection, channel_ids):
+        with self.lock:
+            for channel_id in channel_ids:
+                self.watchers.setdefault(channel_id, set()).add(connection)
+
+    def unwatch(self, connection, channel_ids=None):
+        with self.lock:
+            for channel_id in list(self.watchers) if channel_ids is None else channel_ids:
+                watchers = self.watchers.get(channel_id)
+                if watchers:
+                    watchers.discard(connection)
+                    if not watchers:
+                        del self.watchers[channel_id]
+
+    def register_peer(self, connection, user_id, host, port):
+        with self.lock:
+            self.peers[user_id] = (host, port, connection)
+
+    def unregister_peer(self, connection, user_id=None):
+        with self.lock:
+            for peer_id, (_, _, owner) in list(self.peers.items()):
+                if owner is connection and user_id in (None, peer_id):
+                    del self.peers[peer_id]
+
+    def lookup_peers(self, user_ids):
+        with self.lock:
+            return [{"user_id": user_id, "host": self.peers[user_id][0], "port": self.peers[user_id][1]}
+                    for user_id in user_ids if user_id in self.peers]
+
+    def drop_connection(self, connection):
+        self.unwatch(connection)
+        self.unregister(connection)
+        self.unregister_peer(connection)
+
+    def publish(self, channel_id):
+        with self.lock:
+            watchers = list(self.watchers.get(channel_id, ()))
+            update = {"type": "route_update", "route": self.public_route(channel_id),
+                      "timestamp": time.time()}
+        for connection in watchers:
+            connection.send(update)
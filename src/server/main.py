@@ -4,12 +4,25 @@ import json
 import logging
 import signal
 import sys
+import time
 from datetime import datetime
 from src.server.config import *
+from src.server.directory import RoutingDirectory
+from src.common.codec import CodecError, decode, negotiate
+from src.common.framing import encode_frame, FrameReader
+from src.common import metrics
+from src.common.metrics_server import MetricsServer
+from src.common import profiling
 from src.database.models import *
 from src.database.config import SessionLocal, engine
+from src.database.migrations import upgrade_schema
 
 Base.metadata.create_all(bind=engine)
+upgrade_schema(engine)
+
+RECEIVED_BYTES = metrics.counter("server_received_bytes_total", "Bytes read from control connections")
+SENT_BYTES = metrics.counter("server_sent_bytes_total", "Bytes written to control connections")
+DB_COMMIT_SECONDS = metrics.histogram("server_db_commit_seconds", "Database commit time")
 
 logging.basicConfig(
     level=LOG_LEVEL,
@@ -20,6 +33,35 @@ logging.basicConfig(
     ]
 )
 
+class ControlConnection:
+    """A client socket speaking newline-delimited JSON, or length-prefixed
+    frames in the agreed codec after a hello; pushes and responses may be
+    written from different threads"""
+
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.codec = None  # set once the client switched to frames
+        self.send_lock = threading.Lock()
+
+    def send(self, payload):
+        try:
+            if self.codec is not None:
+                data = encode_frame(self.codec.encode(payload))
+            else:
+                data = (json.dumps(payload) + "\n").encode('utf-8')
+            with self.send_lock:
+                self.sock.sendall(data)
+            SENT_BYTES.inc(len(data))
+            if "type" in payload:
+                metrics.counter("server_pushes_total", "Unsolicited messages sent to clients",
+                                type=str(payload["type"])).inc()
+            return True
+        except Exception as e:
+            logging.warning(f"Error sending to {self.address}: {e}")
+            return False
+
+
 class ChatServer:
     def __init__(self):
         self.server_socket = None
@@ -27,6 +69,13 @@ class ChatServer:
         self.clients = {} 
         self.channels = {} 
         self.p2p_peers = {}  
+        self.directory = RoutingDirectory()
+        self.metrics_server = None
+        metrics.gauge("server_connected_clients", "Open control connections").set_function(lambda: len(self.clients))
+        metrics.gauge("server_routed_channels", "Channels with a registered host").set_function(
+            lambda: len(self.directory.routes))
+        metrics.gauge("server_route_watchers", "Route subscriptions across all clients").set_function(
+            lambda: sum(len(watchers) for watchers in list(self.directory.watchers.values())))
         
     def start(self):
         try:
@@ -35,6 +84,14 @@ class ChatServer:
             self.server_socket.bind((SERVER_HOST, SERVER_PORT))
             self.server_socket.listen(MAX_CONNECTIONS)
             self.running = True
+            metrics.REGISTRY.start_dump(METRICS_DUMP_INTERVAL)
+            if METRICS_PORT is not None:
+                try:
+                    self.metrics_server = MetricsServer(METRICS_HOST, METRICS_PORT)
+                    self.metrics_server.start()
+                except OSError as e:
+                    logging.error(f"Could not serve metrics on {METRICS_HOST}:{METRICS_PORT}: {e}")
+                    self.metrics_server = None
             
             logging.info(f"Server started on {SERVER_HOST}:{SERVER_PORT}")
             
@@ -79,6 +136,10 @@ class ChatServer:
                 self.server_socket.close()
             except:
                 pass
+        
+        if self.metrics_server:
+            self.metrics_server.stop()
+            self.metrics_server = None
                 
         logging.info("Server shutdown complete")
         sys.exit(0)
@@ -88,34 +149,164 @@ class ChatServer:
         self.stop()
 
     def handle_client(self, client_socket, address):
+        connection = ControlConnection(client_socket, address)
+        buffer = b""
+        reader = None  # FrameReader once the client said hello
         try:
             while self.running:
                 data = client_socket.recv(BUFFER_SIZE)
                 if not data:
                     break
-                    
-                message = data.decode()
-                logging.info(f"Received from {address}: {message}")
+                RECEIVED_BYTES.inc(len(data))
+                profiling.checkpoint()
                 
-                if message.strip().lower() == "shutdown":
-                    if address[0] == "127.0.0.1":
-                        logging.info("Received shutdown command from localhost")
-                        self.stop()
+                # Requests are newline-delimited; a bare "shutdown" still works
+                buffer += data
+                while reader is None:
+                    newline = buffer.find(b"\n")
+                    if newline < 0:
+                        break
+                    line, buffer = buffer[:newline], buffer[newline + 1:]
+                    if line.strip() and not self.handle_line(connection, line):
                         return
-                    else:
-                        logging.warning(f"Shutdown attempt from {address} rejected")
-                        client_socket.send("Shutdown command rejected: Only localhost can shutdown the server".encode())
-                        continue
+                    if connection.codec is not None:
+                        # Everything after the hello is framed
+                        reader = FrameReader()
                 
-                client_socket.send(data)
+                if reader is not None:
+                    frames, buffer = reader.feed(buffer), b""
+                    for frame in frames:
+                        self.handle_frame(connection, frame)
+                    continue
+                
+                if buffer.strip().lower() == b"shutdown":
+                    line, buffer = buffer, b""
+                    if not self.handle_line(connection, line):
+                        return
+                if len(buffer) > MAX_CONTROL_LINE:
+                    logging.warning(f"Request line from {address} too long, disconnecting")
+                    break
                 
         except Exception as e:
             logging.error(f"Error handling client {address}: {e}")
         finally:
+            self.directory.drop_connection(connection)
             if address in self.clients:
                 del self.clients[address]
             client_socket.close()
             logging.info(f"Client {address} disconnected")
+    
+    def handle_line(self, connection, line):
+        """Handle one request line, False once the connection should end"""
+        address = connection.address
+        client_socket = connection.sock
+        message = line.decode(errors="replace")
+        
+        if message.lstrip().startswith("{"):
+            try:
+                request = json.loads(message)
+            except json.JSONDecodeError:
+                connection.send({"status": "error", "message": "Invalid JSON"})
+                return True
+            
+            self.dispatch(connection, request)
+            if request.get('action') == "hello":
+                connection.codec = negotiate(request.get('formats'))
+            return True
+        
+        logging.info(f"Received from {address}: {message}")
+        
+        if message.strip().lower() == "shutdown":
+            if address[0] == "127.0.0.1":
+                logging.info("Received shutdown command from localhost")
+                self.stop()
+                return False
+            else:
+                logging.warning(f"Shutdown attempt from {address} rejected")
+                client_socket.send("Shutdown command rejected: Only localhost can shutdown the server".encode())
+                return True
+        
+        if profiling.is_command(message):
+            # Profiling and memory snapshots, see src/common/profiling.py
+            if address[0] == "127.0.0.1":
+                logging.info(f"Received profiling command from localhost: {message.strip()}")
+                reply = profiling.PROFILER.handle_command(message)
+            else:
+                logging.warning(f"Profiling command from {address} rejected")
+                reply = "Profiling command rejected: Only localhost can profile the server"
+            client_socket.send((reply + "\n").encode())
+            return True
+        
+        client_socket.send(line + b"\n")
+        return True
+    
+    def handle_frame(self, connection, frame):
+        try:
+            request = decode(frame)
+        except (CodecError, ValueError):
+            connection.send({"status": "error", "message": "Undecodable request"})
+            return
+        
+        self.dispatch(connection, request)
+    
+    def dispatch(self, connection, request):
+        """Answer one control request, echoing its tag"""
+        started = time.perf_counter()
+        response = self.process_control(connection, request)
+        action = str(request.get('action'))
+        if str(response.get('message', '')).startswith("Unknown action"):
+            action = "unknown"  # keep client-chosen strings out of the label set
+        metrics.histogram("server_request_seconds", "Control request handling time", action=action).record(
+            time.perf_counter() - started)
+        metrics.counter("server_requests_total", "Control requests handled",
+                        action=action, status=str(response.get('status'))).inc()
+        if 'tag' in request:
+            response['tag'] = request['tag']
+        connection.send(response)
+    
+    def process_control(self, connection, request):
+        action = request.get('action')
+        channel_ids = request.get('channel_ids') or []
+        
+        if action == "hello":
+            # The connection switches to frames in this codec after the answer
+            return {"status": "success", "format": negotiate(request.get('formats')).name}
+        elif action == "register":
+            if 'user_id' not in request or 'port' not in request:
+                return {"status": "error", "message": "Missing user_id or port parameter"}
+            host = request.get('host') or connection.address[0]
+            registered, rejected = self.directory.register(
+                connection, request['user_id'], channel_ids, host, request['port']
+            )
+            logging.info(f"User {request['user_id']} hosts channels {[r['channel_id'] for r in registered]} "
+                         f"on {host}:{request['port']}")
+            return {"status": "success", "routes": registered, "rejected": rejected}
+        elif action == "unregister":
+            removed = self.directory.unregister(connection, request.get('channel_ids'))
+            return {"status": "success", "channel_ids": removed}
+        elif action == "lookup":
+            if request.get('watch'):
+                self.directory.watch(connection, channel_ids)
+            return {"status": "success", "routes": self.directory.lookup(channel_ids)}
+        elif action == "register_peer":
+            if 'user_id' not in request or 'port' not in request:
+                return {"status": "error", "message": "Missing user_id or port parameter"}
+            host = request.get('host') or connection.address[0]
+            self.directory.register_peer(connection, request['user_id'], host, request['port'])
+            return {"status": "success"}
+        elif action == "unregister_peer":
+            self.directory.unregister_peer(connection, request.get('user_id'))
+            return {"status": "success"}
+        elif action == "lookup_peers":
+            return {"status": "success", "peers": self.directory.lookup_peers(request.get('user_ids') or [])}
+        elif action == "subscribe_routes":
+            self.directory.watch(connection, channel_ids)
+            return {"status": "success"}
+        elif action == "unsubscribe_routes":
+            self.directory.unwatch(connection, request.get('channel_ids'))
+            return {"status": "success"}
+        else:
+            return {"status": "error", "message": f"Unknown action: {action}"}
 
     def process_message(self, client_socket, message):
         message_type = message.get('type')
@@ -157,13 +348,13 @@ class ChatServer:
     def handle_text_message(self, client_socket, message):
         db = SessionLocal()
         try:
-            new_message = Message(
+            add_channel_message(
+                db,
+                commit=self.commit,
                 content=message['content'],
                 sender_id=message['sender_id'],
                 channel_id=message['channel_id']
             )
-            db.add(new_message)
-            db.commit()
             
             channel_id = message['channel_id']
             if channel_id in self.channels:
@@ -173,6 +364,10 @@ class ChatServer:
         finally:
             db.close()
 
+    def commit(self, db):
+        with DB_COMMIT_SECONDS.time():
+            db.commit()
+
     def handle_file_message(self, client_socket, message):
         target_peer = message['target_peer']
         if target_peer in self.p2p_peers:
@@ -194,7 +389,8 @@ class ChatServer:
                 allow_visitors=message.get('allow_visitors', True)
             )
             db.add(new_channel)
-            db.commit()
+            with DB_COMMIT_SECONDS.time():
+                db.commit()
             
             self.channels[new_channel.id] = {
                 'name': new_channel.name,
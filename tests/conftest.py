@@ -0,0 +1,182 @@
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Logs, snapshots and the database go to a scratch directory. DATABASE_URL is
+# read when src.database.config is first imported, so it is set right here.
+WORKDIR = tempfile.mkdtemp(prefix="chat-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'chat.db')}"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def workdir():
+    previous = os.getcwd()
+    os.chdir(WORKDIR)
+    yield WORKDIR
+    os.chdir(previous)
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def database():
+    """The application schema, emptied again after the test"""
+    from src.database.config import Base, engine
+    from src.database.migrations import upgrade_schema
+    import src.database.models  # noqa: F401 (registers the tables)
+
+    Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
+    yield engine
+    with engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+
+
+@pytest.fixture
+def channel(database):
+    """Channel 1 owned by alice (1) with member bob (2); carol (3) is not a member"""
+    from src.database.config import SessionLocal
+    from src.database.models import User, Channel, ChannelMembership
+
+    db = SessionLocal()
+    try:
+        db.add_all([User(id=user_id, username=name, password="x")
+                    for user_id, name in ((1, "alice"), (2, "bob"), (3, "carol"))])
+        db.add(Channel(id=1, name="general", owner_id=1))
+        db.add_all([ChannelMembership(user_id=1, channel_id=1, role="owner"),
+                    ChannelMembership(user_id=2, channel_id=1)])
+        db.commit()
+    finally:
+        db.close()
+    return 1
+
+
+def add_messages(channel_id, sender_id, count, prefix="message"):
+    """Commit count channel messages straight to the database, as the host
+    serializes them, oldest first"""
+    from src.client.channel_host import serialize_message
+    from src.database.config import SessionLocal
+    from src.database.models import Message
+
+    db = SessionLocal()
+    try:
+        messages = [Message(content=f"{prefix} {n}", sender_id=sender_id, channel_id=channel_id)
+                    for n in range(count)]
+        db.add_all(messages)
+        db.commit()
+        return [serialize_message(message) for message in messages]
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def make_host(tmp_path):
+    """Start ChannelHosts on free loopback ports, stopped after the test"""
+    from src.client.channel_host import ChannelHost
+
+    hosts = []
+
+    def make(user_id=1, preload="eager", **kwargs):
+        kwargs.setdefault("snapshot_path", str(tmp_path / f"snapshot_{user_id}_{len(hosts)}.json.gz"))
+        kwargs.setdefault("metrics_port", None)
+        host = ChannelHost(user_id, free_port(), preload=preload, **kwargs)
+        assert host.start_hosting()
+        assert host.wait_ready(10)
+        hosts.append(host)
+        return host
+
+    yield make
+    for host in hosts:
+        host.stop_hosting()
+
+
+@pytest.fixture
+def host(channel, make_host):
+    return make_host()
+
+
+@pytest.fixture
+def connect():
+    """Open ChannelHostClients, closed after the test"""
+    from src.client.channel_client import ChannelHostClient
+
+    clients = []
+
+    def connect(host, user_id, **kwargs):
+        kwargs.setdefault("timeout", 5.0)
+        client = ChannelHostClient(user_id, "127.0.0.1", host.host_port, **kwargs)
+        assert client.connect()
+        clients.append(client)
+        return client
+
+    yield connect
+    for client in clients:
+        client.close()
+
+
+@pytest.fixture
+def chat_server(database, monkeypatch):
+    """The central server on a free loopback port; yields its port"""
+    import src.server.main as server_main
+
+    port = free_port()
+    monkeypatch.setattr(server_main, "SERVER_PORT", port)
+    monkeypatch.setattr(server_main, "METRICS_PORT", None)
+    # start() installs a SIGINT handler, which only the main thread may do
+    monkeypatch.setattr(server_main.signal, "signal", lambda *args: None)
+    server = server_main.ChatServer()
+    threading.Thread(target=server.start, daemon=True).start()
+    deadline = time.monotonic() + 5
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            assert time.monotonic() < deadline, "server did not start"
+            time.sleep(0.05)
+    yield port
+    # Not stop(): it ends with sys.exit
+    server.running = False
+    server.server_socket.close()
+    for client_info in list(server.clients.values()):
+        client_info['socket'].close()
+
+
+@pytest.fixture
+def directories(chat_server):
+    """Open ChannelDirectory connections to chat_server, stopped after the test"""
+    from src.client.channel_directory import ChannelDirectory
+
+    opened = []
+
+    def open_directory():
+        directory = ChannelDirectory("127.0.0.1", chat_server)
+        assert directory.start()
+        opened.append(directory)
+        return directory
+
+    yield open_directory
+    for directory in opened:
+        directory.stop()
@@ -0,0 +1,76 @@
+from src.client.channel_cache import ChannelCache
+from conftest import add_messages
+
+
+def test_least_recently_used_entry_goes_first():
+    evicted = []
+    cache = ChannelCache(max_entries=2, on_evict=lambda key, entry: evicted.append(key))
+    cache.put(1, "one")
+    cache.put(2, "two")
+    assert cache.get(1) == "one"  # 2 is now the coldest
+    cache.put(3, "three")
+
+    assert evicted == [2]
+    assert cache.keys() == [1, 3]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_peek_does_not_refresh_or_count():
+    cache = ChannelCache(max_entries=2)
+    cache.put(1, "one")
+    cache.put(2, "two")
+    assert cache.peek(1) == "one"
+    cache.put(3, "three")
+
+    assert 1 not in cache
+    assert cache.stats()["hits"] == 0 and cache.stats()["misses"] == 0
+
+
+def test_byte_budget_and_resize():
+    sizes = {"a": 40, "b": 40, "c": 40}
+    cache = ChannelCache(max_bytes=100, sizeof=lambda entry: sizes[entry])
+    cache.put(1, "a")
+    cache.put(2, "b")
+    assert cache.size_bytes == 80
+
+    sizes["b"] = 90  # entry 2 grew in place
+    cache.resize(2)
+    assert cache.keys() == [2]
+    assert cache.size_bytes == 90
+
+    sizes["c"] = 500  # alone over budget, but the newest entry always stays
+    cache.put(3, "c")
+    assert cache.keys() == [3]
+
+
+def test_hit_rate():
+    cache = ChannelCache()
+    cache.put(1, "one")
+    cache.get(1)
+    cache.get(2)
+    assert cache.stats()["hit_rate"] == 0.5
+
+
+def test_lazy_hydration_keeps_messages_recorded_while_loading(channel, make_host, monkeypatch):
+    add_messages(channel, 1, 3, prefix="old")
+    host = make_host(preload="lazy")
+    assert channel not in host.channel_data
+
+    new_history = host.new_history
+    recorded = []
+
+    def racing_new_history():
+        # A write commits and is recorded after the database was read,
+        # before the history is installed
+        if not recorded:
+            recorded.extend(add_messages(channel, 2, 1, prefix="new"))
+            host.record_message(channel, recorded[0])
+        return new_history()
+
+    monkeypatch.setattr(host, "new_history", racing_new_history)
+    entry = host.get_channel_entry(channel)
+
+    contents = [message["content"] for message in entry["history"].oldest_first()]
+    assert contents == ["old 0", "old 1", "old 2", "new 0"]
+    assert [message["content"] for message in host.messages_since(channel, 0)][-1] == "new 0"
+    assert not host.hydrating
@@ -0,0 +1,155 @@
+import threading
+import time
+
+from src.client.channel_client import ChannelHostClient
+from conftest import add_messages, wait_for
+
+
+def collect(client, message_type):
+    received = []
+    client.add_update_callback(lambda message: message.get("type") == message_type and received.append(message))
+    return received
+
+
+def test_subscribers_get_writes_in_seq_order(host, connect):
+    bob = connect(host, 2)
+    pushes = collect(bob, "new_message")
+    response = bob.subscribe([1])
+    assert [channel["channel_id"] for channel in response["subscribed"]] == [1]
+
+    # The owner writes through its own host, from several threads at once
+    writers = [threading.Thread(target=host.write_message, args=(1, 1), kwargs={"content": f"owner {n}"})
+               for n in range(10)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    wait_for(lambda: len(pushes) == 10)
+
+    assert [push["message"]["seq"] for push in pushes] == list(range(1, 11))
+    assert bob.send_message(1, "from bob")["seq"] == 11
+
+
+def test_sender_gets_no_push_of_its_own_message(host, connect):
+    alice, bob = connect(host, 1), connect(host, 2)
+    alice_pushes, bob_pushes = collect(alice, "new_message"), collect(bob, "new_message")
+    alice.subscribe([1])
+    bob.subscribe([1])
+
+    assert bob.send_message(1, "hello")["status"] == "success"
+    wait_for(lambda: alice_pushes)
+    assert alice_pushes[0]["message"]["content"] == "hello"
+    assert bob_pushes == []
+
+
+def test_non_member_cannot_subscribe(host, connect):
+    carol = connect(host, 3)
+    response = carol.subscribe([1])
+    assert response["subscribed"] == []
+    assert carol.send_message(1, "let me in")["status"] == "error"
+
+
+def test_reconnecting_client_syncs_what_it_missed(channel, make_host, connect):
+    add_messages(1, 1, 3)
+    host = make_host()
+    bob = connect(host, 2, channel_ids=[1])
+    assert bob.last_seqs[1] == 3
+    bob.close()
+    for n in range(4):
+        host.write_message(1, 1, content=f"while away {n}")
+
+    again = ChannelHostClient(2, "127.0.0.1", host.host_port, timeout=5.0, channel_ids=[1])
+    again.last_seqs = {1: 3}
+    catch_ups = collect(again, "catch_up")
+    try:
+        assert again.connect()
+        wait_for(lambda: again.last_seqs[1] == 7)
+        assert [message["seq"] for update in catch_ups for message in update["new_messages"]] == [4, 5, 6, 7]
+    finally:
+        again.close()
+
+
+def test_sync_pages_through_long_gaps(channel, make_host, connect):
+    add_messages(1, 1, 5)
+    host = make_host()
+    bob = connect(host, 2)
+    response = bob.request("sync", channels=[{"channel_id": 1, "last_seq": 1}], limit=2)
+
+    result = response["results"][0]
+    assert [message["seq"] for message in result["messages"]] == [2, 3]
+    assert result["more"] and result["head_seq"] == 5
+
+
+def write_past_host(channel_id, sender_id, content):
+    """Commit a message the way clients that do not host the channel do"""
+    from src.database.config import SessionLocal
+    from src.database.models import add_channel_message
+
+    db = SessionLocal()
+    try:
+        return add_channel_message(db, content=content, sender_id=sender_id, channel_id=channel_id).id
+    finally:
+        db.close()
+
+
+def test_reads_include_messages_written_past_the_host(host, connect):
+    host.write_message(1, 1, content="through the host")
+    message_id = write_past_host(1, 2, "straight to the database")
+
+    assert [message["content"] for message in host.messages_since(1, 0)] == [
+        "through the host", "straight to the database"]
+    response = host.handle_get_channel_messages({"channel_id": 1}, 1)
+    assert message_id in [message["id"] for message in response["messages"]]
+    bob = connect(host, 2)
+    synced = bob.request("sync", channels=[{"channel_id": 1, "last_seq": 1}])["results"][0]
+    assert [message["seq"] for message in synced["messages"]] == [2]
+    # Recorded once: the history holds it and later writes follow it
+    assert host.write_message(1, 1, content="after")["seq"] == 3
+    assert [message["seq"] for message in host.messages_since(1, 0)] == [1, 2, 3]
+
+
+def leave_past_host(channel_id, user_id):
+    """Delete a membership the way ChannelHandler.leave_channel does"""
+    from src.database.config import SessionLocal
+    from src.database.models import ChannelMembership
+
+    db = SessionLocal()
+    try:
+        db.query(ChannelMembership).filter(
+            ChannelMembership.channel_id == channel_id,
+            ChannelMembership.user_id == user_id
+        ).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def subscribed_users(host, channel_id):
+    with host.subscribers_lock:
+        return {session.user_id for session in host.subscribers.get(channel_id, ())}
+
+
+def test_leaving_client_tells_the_host(host, connect):
+    bob = connect(host, 2)
+    bob.subscribe([1])
+    assert bob.send_message(1, "bye")["status"] == "success"
+
+    leave_past_host(1, 2)
+    assert bob.refresh_membership(1)["member"] is False
+    assert 2 not in subscribed_users(host, 1)
+    assert bob.send_message(1, "still here?")["status"] == "error"
+
+
+def test_member_lists_expire_after_a_leave_past_the_host(host, connect):
+    bob = connect(host, 2)
+    bob.subscribe([1])
+    assert host.is_channel_member(1, 2)
+
+    leave_past_host(1, 2)
+    host.membership.positive_ttl = 0.2
+    assert host.is_channel_member(1, 2)
+    time.sleep(0.3)
+    assert not host.is_channel_member(1, 2)
+    # The reload marks the channel, its subscribers are rechecked in the background
+    wait_for(lambda: 2 not in subscribed_users(host, 1))
+    assert host.is_channel_member(1, 1)
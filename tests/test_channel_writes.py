@@ -0,0 +1,83 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from src.database.config import SessionLocal
+from src.database.migrations import add_message_seq
+from src.database.models import Channel, Message, add_channel_message
+from conftest import add_messages
+
+
+def channel_seqs(channel_id):
+    db = SessionLocal()
+    try:
+        return [row.seq for row in db.query(Message.seq).filter(
+            Message.channel_id == channel_id).order_by(Message.id)]
+    finally:
+        db.close()
+
+
+def take_seq(seq):
+    """A commit that numbers pending messages with seq, as a concurrent
+    writer that got there first would leave them"""
+    def commit(session):
+        for obj in session.new:
+            obj.seq = seq
+        session.commit()
+    return commit
+
+
+def test_add_channel_message_numbers_again_after_conflict(channel):
+    add_messages(channel, 2, 1)
+    calls = []
+
+    def commit(session):
+        calls.append(session)
+        if len(calls) == 1:
+            take_seq(1)(session)
+        else:
+            session.commit()
+
+    db = SessionLocal()
+    try:
+        message = add_channel_message(db, commit=commit, content="hi", sender_id=1, channel_id=channel)
+        assert message.seq == 2
+    finally:
+        db.close()
+    assert len(calls) == 2
+    assert channel_seqs(channel) == [1, 2]
+
+
+def test_add_channel_message_gives_up_after_attempts(channel):
+    add_messages(channel, 2, 1)
+    db = SessionLocal()
+    try:
+        with pytest.raises(IntegrityError):
+            add_channel_message(db, attempts=2, commit=take_seq(1), content="hi", sender_id=1, channel_id=channel)
+    finally:
+        db.close()
+    assert channel_seqs(channel) == [1]
+
+
+def test_seq_backfill_numbers_only_missing_seqs(channel, database):
+    db = SessionLocal()
+    try:
+        db.add_all([Channel(id=2, name="random", owner_id=1), Channel(id=3, name="news", owner_id=1)])
+        db.commit()
+    finally:
+        db.close()
+    for channel_id in (channel, 2, 3):
+        add_messages(channel_id, 1, 3)
+    with database.begin() as connection:
+        # Channel 1 was numbered from 11, channel 2 predates seq and
+        # channel 3 got its last message before its seq was written
+        connection.execute(text("UPDATE messages SET seq = seq + 10 WHERE channel_id = 1"))
+        connection.execute(text("UPDATE messages SET seq = NULL WHERE channel_id = 2"))
+        connection.execute(text("UPDATE messages SET seq = NULL WHERE channel_id = 3 AND seq = 3"))
+        connection.execute(text("UPDATE messages SET seq = seq + 4 WHERE channel_id = 3"))
+
+    add_message_seq(database)
+
+    assert channel_seqs(channel) == [11, 12, 13]
+    assert channel_seqs(2) == [1, 2, 3]
+    assert channel_seqs(3) == [5, 6, 7]
@@ -0,0 +1,56 @@
+import pytest
+
+from src.common.codec import BINARY, JSON, CodecError, decode, negotiate
+
+MESSAGES = [
+    # Schema-shaped: a pushed channel message
+    {"type": "new_message", "channel_id": 7, "message": {
+        "id": 123456, "seq": 42, "content": "héllo wörld ✓", "sender_id": 2,
+        "created_at": "2025-03-01T12:00:00.123456", "has_media": False,
+        "media_type": None, "media_path": None, "media_name": None}},
+    # Free-form: unknown keys, symbols as values, nested lists
+    {"action": "sync", "tag": 9, "channels": [{"channel_id": 1, "last_seq": 0}, {"channel_id": 2}],
+     "custom key": "success", "empty": {}, "nothing": []},
+    # Integer edges around the one-byte and varint encodings
+    {"values": [0, 127, 128, -1, -128, 2 ** 31, -(2 ** 31), 2 ** 63 + 5, -(2 ** 70)]},
+    {"ratio": 0.1, "negative": -2.5, "flags": [True, False, None], "text": "x" * 300},
+]
+
+
+@pytest.mark.parametrize("codec", [JSON, BINARY], ids=lambda codec: codec.name)
+@pytest.mark.parametrize("message", MESSAGES)
+def test_round_trip(codec, message):
+    encoded = codec.encode(message)
+    assert codec.decode(encoded) == message
+    assert decode(encoded) == message
+
+
+def test_bin1_keeps_bytes():
+    message = {"media_data": b"\x00\xb1\xff" * 100}
+    assert BINARY.decode(BINARY.encode(message)) == message
+
+
+@pytest.mark.parametrize("codec", [JSON, BINARY], ids=lambda codec: codec.name)
+def test_add_field_prepends_without_reencoding(codec):
+    encoded = codec.encode(MESSAGES[0])
+    assert decode(codec.add_field(encoded, "seq", 5)) == dict(MESSAGES[0], seq=5)
+    assert decode(codec.add_field(codec.add_field(encoded, "seq", 5), "tag", 1)) == dict(
+        MESSAGES[0], seq=5, tag=1)
+
+
+def test_bin1_rejects_malformed_payloads():
+    encoded = BINARY.encode(MESSAGES[1])
+    with pytest.raises(CodecError):
+        BINARY.decode(b'{"type": "ping"}')
+    with pytest.raises(CodecError):
+        BINARY.decode(encoded + b"\x00")
+    with pytest.raises(CodecError):
+        BINARY.encode({"value": object()})
+
+
+def test_negotiate_follows_the_offer_and_falls_back_to_json():
+    assert negotiate(["json", "bin1"]) is JSON
+    assert negotiate(["bin1", "json"]) is BINARY
+    assert negotiate(["bin9", "bin1"]) is BINARY
+    assert negotiate(["bin9"]) is JSON
+    assert negotiate(None) is JSON
@@ -0,0 +1,43 @@
+from conftest import add_messages
+
+
+def test_restart_replays_messages_committed_before_they_were_recorded(channel, make_host, tmp_path):
+    snapshot_path = str(tmp_path / "host.json.gz")
+    add_messages(channel, 1, 3)
+    host = make_host(snapshot_path=snapshot_path)
+    assert host.get_channel_entry(channel)["history"].newest_seq == 3
+
+    # Committed, but the snapshot is taken before the host records it
+    host.record_message = lambda *args, **kwargs: None
+    host.write_message(channel, 2, content="in flight")
+    assert host.save_snapshot()
+    host.stop_hosting()
+
+    restarted = make_host(snapshot_path=snapshot_path)
+    history = restarted.channel_data.peek(channel)["history"]
+    assert [message["seq"] for message in history.oldest_first()] == [1, 2, 3, 4]
+    assert history.oldest_first()[-1]["content"] == "in flight"
+
+
+def test_snapshot_replay_is_per_channel(channel, make_host, tmp_path):
+    from src.database.config import SessionLocal
+    from src.database.models import Channel, ChannelMembership
+
+    db = SessionLocal()
+    try:
+        db.add(Channel(id=2, name="random", owner_id=1))
+        db.add(ChannelMembership(user_id=1, channel_id=2, role="owner"))
+        db.commit()
+    finally:
+        db.close()
+    snapshot_path = str(tmp_path / "host.json.gz")
+    add_messages(channel, 1, 5)
+    add_messages(2, 1, 1)
+    host = make_host(snapshot_path=snapshot_path)
+    host.stop_hosting()
+    add_messages(2, 1, 2, prefix="later")
+
+    restarted = make_host(snapshot_path=snapshot_path)
+    seqs = {channel_id: [message["seq"] for message in restarted.channel_data.peek(channel_id)["history"].oldest_first()]
+            for channel_id in (1, 2)}
+    assert seqs == {1: [1, 2, 3, 4, 5], 2: [1, 2, 3]}
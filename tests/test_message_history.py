@@ -0,0 +1,81 @@
+from src.client.message_history import ChannelHistory, estimate_message_size
+
+
+def message(message_id, seq=None, content="x"):
+    return {"id": message_id, "seq": seq if seq is not None else message_id, "content": content}
+
+
+def ids(messages):
+    return [m["id"] for m in messages]
+
+
+def test_ring_keeps_the_newest_messages():
+    history = ChannelHistory(capacity=3)
+    history.extend(message(i) for i in range(1, 6))
+
+    assert ids(history.oldest_first()) == [3, 4, 5]
+    assert history.oldest_id == 3 and history.newest_id == 5
+    assert not history.complete
+    assert history.evicted_id == 2
+
+
+def test_paging_newest_first():
+    history = ChannelHistory(capacity=10)
+    history.extend(message(i) for i in (2, 4, 6, 8))
+
+    assert ids(history.latest(2)) == [8, 6]
+    assert ids(history.before(6, 10)) == [4, 2]
+    assert ids(history.before(5, 1)) == [4]  # before an id the ring does not hold
+
+
+def test_since_and_coverage():
+    history = ChannelHistory(capacity=3)
+    history.extend(message(i) for i in range(1, 6))
+
+    assert ids(history.since(3)) == [4, 5]
+    assert history.covers_after(2)
+    assert not history.covers_after(1)  # message 2 was evicted
+    assert ChannelHistory().covers_after(0)  # an empty, complete channel
+
+
+def test_seq_lookups():
+    # Ids are global, seqs count each channel's messages without gaps
+    history = ChannelHistory(capacity=3)
+    history.extend(message(i * 10, seq=i) for i in range(1, 6))
+
+    assert history.newest_seq == 5
+    assert ids(history.since_seq(3)) == [40, 50]
+    assert ids(history.since_seq(2, limit=1)) == [30]
+    assert history.covers_after_seq(2)
+    assert not history.covers_after_seq(1)
+
+
+def test_replacing_and_out_of_order_appends():
+    history = ChannelHistory(capacity=5)
+    history.extend(message(i) for i in (1, 3))
+    history.append(message(2))
+    history.append(message(3, content="edited"))
+
+    assert ids(history.oldest_first()) == [1, 2, 3]
+    assert history.oldest_first()[-1]["content"] == "edited"
+    assert len(history) == 3
+
+
+def test_byte_budget_evicts_oldest():
+    size = estimate_message_size(message(1, content="a" * 100))
+    history = ChannelHistory(capacity=100, max_bytes=size * 2)
+    history.extend(message(i, content="a" * 100) for i in range(1, 5))
+
+    assert ids(history.oldest_first()) == [3, 4]
+    assert history.size_bytes == size * 2
+
+
+def test_restore_matches_appending():
+    messages = [message(i) for i in range(1, 8)]
+    appended = ChannelHistory(capacity=4)
+    appended.extend(messages)
+    restored = ChannelHistory(capacity=4)
+    restored.restore(messages, True, None)
+
+    assert restored.oldest_first() == appended.oldest_first()
+    assert (restored.complete, restored.evicted_id) == (appended.complete, appended.evicted_id)
@@ -0,0 +1,80 @@
+import re
+import urllib.error
+import urllib.request
+
+import pytest
+
+from src.common.metrics import MetricsRegistry
+from src.common.metrics_server import CONTENT_TYPE, MetricsServer
+
+
+def scrape(port, path="/metrics"):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=5) as response:
+        return response.headers["Content-Type"], response.read().decode("utf-8")
+
+
+def sample(text, series):
+    """Value of one series line, e.g. 'requests_total{action="ping"}'"""
+    match = re.search(rf"^{re.escape(series)} (\S+)$", text, re.M)
+    return float(match.group(1)) if match else None
+
+
+@pytest.fixture
+def registry():
+    registry = MetricsRegistry()
+    server = MetricsServer("127.0.0.1", 0, registry)
+    server.start()
+    yield registry, server.port
+    server.stop()
+
+
+def test_exposition_of_each_kind(registry):
+    registry, port = registry
+    registry.counter("requests_total", "Requests handled", action="ping").inc(3)
+    registry.gauge("queue_depth", "Waiting items").set_function(lambda: 7)
+    latency = registry.histogram("request_seconds", "Handling time", action="ping")
+    for seconds in (0.001, 0.002, 0.004):
+        latency.record(seconds)
+
+    content_type, text = scrape(port)
+
+    assert content_type == CONTENT_TYPE
+    assert "# HELP requests_total Requests handled\n# TYPE requests_total counter" in text
+    assert sample(text, 'requests_total{action="ping"}') == 3
+    assert "# TYPE queue_depth gauge" in text and sample(text, "queue_depth") == 7
+    assert "# TYPE request_seconds summary" in text
+    assert sample(text, 'request_seconds_count{action="ping"}') == 3
+    assert sample(text, 'request_seconds_sum{action="ping"}') == pytest.approx(0.007)
+    assert 0.001 <= sample(text, 'request_seconds{action="ping",quantile="0.5"}') <= 0.004
+
+
+def test_gauges_are_read_at_scrape_time(registry):
+    registry, port = registry
+    depth = [1]
+    registry.gauge("queue_depth").set_function(lambda: depth[0])
+    assert sample(scrape(port)[1], "queue_depth") == 1
+    depth[0] = 5
+    assert sample(scrape(port)[1], "queue_depth") == 5
+
+
+def test_only_metrics_path_is_served(registry):
+    _, port = registry
+    with pytest.raises(urllib.error.HTTPError) as error:
+        scrape(port, "/")
+    assert error.value.code == 404
+    assert scrape(port, "/metrics?format=text")[1].endswith("\n")
+
+
+def test_channel_host_exposes_its_requests(channel, make_host, connect):
+    host = make_host(metrics_port=0)
+    port = host.metrics_server.port
+    before = sample(scrape(port)[1], 'channel_host_requests_total{action="send_message",status="success"}') or 0
+
+    bob = connect(host, 2)
+    assert bob.send_message(1, "counted")["status"] == "success"
+    text = scrape(port)[1]
+
+    assert sample(text, 'channel_host_requests_total{action="send_message",status="success"}') == before + 1
+    assert sample(text, 'channel_host_request_seconds_count{action="send_message"}') >= 1
+    assert sample(text, f'channel_host_sessions{{port="{host.host_port}"}}') == 1
+    assert sample(text, f'channel_host_channels{{port="{host.host_port}"}}') == 1
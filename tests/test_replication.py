@@ -0,0 +1,89 @@
+import time
+
+from conftest import add_messages, wait_for
+
+
+def channel_seqs(channel_id):
+    from src.database.config import SessionLocal
+    from src.database.models import Message
+
+    db = SessionLocal()
+    try:
+        return [row.seq for row in db.query(Message.seq).filter(
+            Message.channel_id == channel_id).order_by(Message.seq)]
+    finally:
+        db.close()
+
+
+def add_member(channel_id, user_id):
+    from src.database.config import SessionLocal
+    from src.database.models import ChannelMembership
+
+    db = SessionLocal()
+    try:
+        db.add(ChannelMembership(user_id=user_id, channel_id=channel_id))
+        db.commit()
+    finally:
+        db.close()
+
+
+def send(client, channel_id, content, timeout=10.0):
+    """Send until a host accepts, riding out a failover"""
+    deadline = time.monotonic() + timeout
+    while True:
+        response = client.send_message(channel_id, content)
+        if response.get("status") == "success":
+            return response
+        assert time.monotonic() < deadline, response
+        time.sleep(0.1)
+
+
+def test_designated_member_follows_primary(channel, make_host, directories):
+    primary = make_host(1, directory=directories(), advertise_host="127.0.0.1")
+    assert primary.designate_replica(channel, 2)
+    standby = make_host(2, directory=directories(), advertise_host="127.0.0.1")
+
+    wait_for(lambda: channel in standby.standby)
+    assert channel not in standby.hosted_channels
+    wait_for(lambda: primary.standby_address(channel) == ["127.0.0.1", standby.host_port])
+
+
+def test_members_without_replica_role_do_not_follow(channel, make_host, directories):
+    make_host(1, directory=directories(), advertise_host="127.0.0.1")
+    member = make_host(2, directory=directories(), advertise_host="127.0.0.1")
+
+    assert member.follow_replica_channels() == []
+    assert member.standby == {}
+
+
+def test_standby_takes_over_without_losing_seqs(channel, make_host, directories):
+    from src.client.channel_client import ChannelHostClient
+
+    add_member(channel, 3)
+    add_messages(channel, 1, 3, prefix="before")
+    primary = make_host(1, directory=directories(), advertise_host="127.0.0.1")
+    assert primary.designate_replica(channel, 2)
+    standby = make_host(2, directory=directories(), advertise_host="127.0.0.1")
+    wait_for(lambda: channel in standby.standby)
+
+    client = ChannelHostClient.for_channel(directories(), 3, channel, timeout=5.0)
+    assert client is not None and client.port == primary.host_port
+    try:
+        client.subscribe([channel])
+        wait_for(lambda: channel in client.standbys)
+        for n in range(5):
+            send(client, channel, f"primary {n}")
+        # The standby has streamed everything the primary committed
+        wait_for(lambda: standby.channel_data.peek(channel)["history"].newest_seq == 8)
+
+        primary.stop_hosting()
+        for n in range(5):
+            send(client, channel, f"standby {n}")
+
+        assert client.port == standby.host_port
+        assert channel in standby.hosted_channels
+        assert channel_seqs(channel) == list(range(1, 14))
+        messages = client.get_channel_messages(channel, limit=20)["messages"]
+        assert sorted(message["seq"] for message in messages) == list(range(1, 14))
+    finally:
+        client.close()
@@ -0,0 +1,153 @@
+import threading
+import time
+
+from src.client.update_waiters import UpdateWaiter, UpdateWaiters
+from conftest import add_messages, wait_for
+
+
+def make_waiter(channel_id=1, deadline_in=5.0, stream=False):
+    return UpdateWaiter(None, 2, {"action": "fetch_updates"}, channel_id, 0,
+                        time.monotonic() + deadline_in, stream)
+
+
+def test_wake_takes_one_shot_waiters_and_keeps_streams():
+    waiters = UpdateWaiters(lambda waiter: None)
+    one_shot, stream, other = make_waiter(), make_waiter(stream=True), make_waiter(channel_id=2)
+    for waiter in (one_shot, stream, other):
+        waiters.park(waiter)
+
+    assert set(waiters.wake(1)) == {one_shot, stream}
+    assert waiters.wake(1) == [stream]
+    assert waiters.pending_count() == 2
+
+
+def test_deadline_expires_waiter_once():
+    expired = []
+    done = threading.Event()
+    waiters = UpdateWaiters(lambda waiter: (expired.append(waiter), done.set()))
+    waiters.start()
+    try:
+        waiter = make_waiter(deadline_in=0.05)
+        waiters.park(waiter)
+        assert done.wait(2)
+        time.sleep(0.1)
+        assert expired == [waiter]
+        assert waiters.pending_count() == 0
+    finally:
+        waiters.stop()
+
+
+def test_woken_waiter_parked_again_still_times_out():
+    done = threading.Event()
+    waiters = UpdateWaiters(lambda waiter: done.set())
+    waiters.start()
+    try:
+        waiter = make_waiter(deadline_in=0.2)
+        waiters.park(waiter)
+        assert waiters.wake(1) == [waiter]
+        waiters.park(waiter)
+        assert waiters.pending_count() == 1
+        assert done.wait(2)
+    finally:
+        waiters.stop()
+
+
+def test_long_poll_answered_by_new_message(host, connect):
+    bob = connect(host, 2)
+    result = {}
+    poll = threading.Thread(target=lambda: result.update(bob.fetch_updates(1, 0, wait=5)))
+    poll.start()
+    deadline = time.monotonic() + 2
+    while not host.waiters.pending_count() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    started = time.monotonic()
+    assert connect(host, 1).send_message(1, "hello")["status"] == "success"
+    poll.join(5)
+    assert time.monotonic() - started < 2
+    assert [message["content"] for message in result["new_messages"]] == ["hello"]
+
+
+def test_woken_long_poll_without_news_waits_for_the_next_message(host, connect):
+    bob = connect(host, 2)
+    result = {}
+    poll = threading.Thread(target=lambda: result.update(bob.fetch_updates(1, 0, wait=5)))
+    poll.start()
+    deadline = time.monotonic() + 2
+    while not host.waiters.pending_count() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    # A wake with nothing newer than the waiter's last message
+    for waiter in host.waiters.wake(1):
+        host.answer_waiter(waiter)
+    assert host.waiters.pending_count() == 1
+
+    assert connect(host, 1).send_message(1, "late")["status"] == "success"
+    poll.join(5)
+    assert [message["content"] for message in result["new_messages"]] == ["late"]
+    assert not result.get("timed_out")
+
+
+def test_message_recorded_between_check_and_park_is_returned(host, monkeypatch):
+    messages_since = host.messages_since
+    calls = []
+
+    def racing_messages_since(channel_id, last_message_id):
+        found = messages_since(channel_id, last_message_id)
+        if not calls:
+            # A write commits and is recorded right after the check
+            host.record_message(channel_id, add_messages(channel_id, 1, 1)[0])
+        calls.append(found)
+        return found
+
+    monkeypatch.setattr(host, "messages_since", racing_messages_since)
+    response = host.handle_fetch_updates(
+        {"channel_id": 1, "last_message_id": 0, "wait": 2}, 2, session=object())
+
+    assert response is not None, "the request was parked and missed the message"
+    assert [message["content"] for message in response["new_messages"]] == ["message 0"]
+    assert host.waiters.pending_count() == 0
+
+
+def write_past_host(channel_id, sender_id, content):
+    from src.database.config import SessionLocal
+    from src.database.models import add_channel_message
+
+    db = SessionLocal()
+    try:
+        return add_channel_message(db, content=content, sender_id=sender_id, channel_id=channel_id).id
+    finally:
+        db.close()
+
+
+def test_write_past_the_host_wakes_polls_and_subscribers(host, connect):
+    bob, alice = connect(host, 2), connect(host, 1)
+    pushes = []
+    alice.add_update_callback(lambda message: message.get("type") == "new_message" and pushes.append(message))
+    alice.subscribe([1])
+    poll = bob.request_async("fetch_updates", channel_id=1, last_message_id=0, wait=10)
+    wait_for(lambda: host.waiters.pending_count() == 1)
+
+    started = time.monotonic()
+    write_past_host(1, 2, "from another client")
+    response = poll.result(timeout=10)
+
+    assert [message["content"] for message in response["new_messages"]] == ["from another client"]
+    assert not response.get("timed_out") and time.monotonic() - started < 5
+    wait_for(lambda: pushes)
+    assert pushes[0]["message"]["content"] == "from another client"
+
+
+def test_expiring_poll_looks_at_the_database_once_more(channel, make_host, connect, monkeypatch):
+    import src.client.channel_host as channel_host
+
+    monkeypatch.setattr(channel_host, "CHANNEL_DB_POLL_INTERVAL", 3600)
+    host = make_host()
+    bob = connect(host, 2)
+    poll = bob.request_async("fetch_updates", channel_id=1, last_message_id=0, wait=0.5)
+    wait_for(lambda: host.waiters.pending_count() == 1)
+    write_past_host(1, 1, "just before the deadline")
+
+    response = poll.result(timeout=5)
+    assert [message["content"] for message in response["new_messages"]] == ["just before the deadline"]
+    assert not response.get("timed_out")